@@ -4,22 +4,17 @@ from airflow.operators.python_operator import PythonOperator
 from airflow.utils.task_group import TaskGroup
 from airflow.operators.empty import EmptyOperator
 from datetime import datetime, timedelta
-from prometheus_client import Counter, Gauge
-from statsd import StatsClient
 from airflow.configuration import conf
+from src.instrumentation import configure_statsd, record_dag_run
 
 
 STATSD_HOST = conf.get("metrics", "statsd_host")
 STATSD_PORT = conf.get("metrics", "statsd_port")
 STATSD_PREFIX = conf.get("metrics", "statsd_prefix")
 
-
-
-# # Métriques Prometheus
-dag_runs = Counter('sante_dag_runs_total', 'Total number of DAG runs')
-task_duration = Gauge('sante_task_duration_seconds', 'Task execution duration')
-
-
+# Per-stage pipeline metrics go to the same statsd-exporter as Airflow's own
+# (sante.* names, see statsd_mapping.yml)
+configure_statsd(STATSD_HOST, STATSD_PORT)
 
 
 default_args = {
@@ -53,6 +48,8 @@ with DAG(
     max_active_runs=2,
     tags=['sante', 'data-pipeline'],
     concurrency=5,     
+    on_success_callback=record_dag_run,
+    on_failure_callback=record_dag_run,
     ) as dag:
     start_task = EmptyOperator(task_id = 'start_task')
     
@@ -63,7 +60,9 @@ with DAG(
             task = PythonOperator(
                 task_id=f'extract_{table}',
                 python_callable=extract_table,
-                op_kwargs={'table_name': table},
+                # Only pull rows past the table's recorded high-watermark (SCD2 dimensions are always
+                # read whole, see _build_extract_query)
+                op_kwargs={'table_name': table, 'incremental': True},
                 provide_context=True,
             )
             extraction_tasks.append(task)
@@ -74,7 +73,8 @@ with DAG(
             task = PythonOperator(
                 task_id=f'extract_{table}',
                 python_callable=extract_table,
-                op_kwargs={'table_name': table},
+                # Fact days can be large: stream them in bounded batches
+                op_kwargs={'table_name': table, 'extract_mode': 'stream', 'incremental': True},
                 provide_context=True,
             )
             extraction_tasks.append(task)
@@ -99,19 +99,28 @@ with DAG(
             create_cleaning_task(table) for table in facts
         ]
     
+    # Facts whose keys have no clean dimension row are quarantined before aggregation and load
+    validate_references_task = PythonOperator(
+        task_id='validate_references',
+        python_callable=validate_references,
+        provide_context=True
+    )
+    
+    # Dimensions are extracted and cleaned by the extract/clean groups: only the facts are prepared here
     with TaskGroup("prepare_data") as prepare_data:
-        prepare_dimensions_task = PythonOperator(
-            task_id='prepare_dimensions_tables',
-            python_callable=dimension_pipeline,
-            provide_context=True
-        )
         prepare_facts_task = PythonOperator(
             task_id='prepare_fact_tables',
             python_callable=aggregate_daily_data,
             provide_context=True,
             depends_on_past=True
         )
-        prepare_dimensions_task >> prepare_facts_task
+        # Daily mergeable states and the weekly/monthly/rolling windows containing the day
+        rolling_aggregates_task = PythonOperator(
+            task_id='update_rolling_aggregates',
+            python_callable=update_rolling_aggregates,
+            provide_context=True
+        )
+        prepare_facts_task >> rolling_aggregates_task
     
     with TaskGroup("insert_data_in_data_warehouse") as insert_data_in_data_warehouse:
         insert_data_in_dimension_table = PythonOperator(
@@ -121,7 +130,7 @@ with DAG(
          )
         insert_data_in_fact_table = PythonOperator(
              task_id='insert_data_in_fact_table',
-             python_callable=fact_pipeline,
+             python_callable=insert_data_in_fact_tables,
              provide_context=True
          )
         insert_data_in_dimension_table >> insert_data_in_fact_table
@@ -132,5 +141,5 @@ with DAG(
     start_task >> [extract_dimensions, extract_facts]
     extract_dimensions >> clean_dimensions
     extract_facts >> clean_facts
-    [clean_dimensions, clean_facts] >> prepare_data
+    [clean_dimensions, clean_facts] >> validate_references_task >> prepare_data
     prepare_data >> insert_data_in_data_warehouse >> end_task
\ No newline at end of file
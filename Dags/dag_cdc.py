@@ -0,0 +1,34 @@
+from airflow import DAG
+from src.utils import capture_changes
+from airflow.operators.python_operator import PythonOperator
+from datetime import datetime, timedelta
+
+
+default_args = {
+    'owner': 'airflow',
+    'depends_on_past': False,
+    'start_date': datetime(2024, 1, 1),
+    'email_on_failure': False,
+    'email_on_retry': False,
+    'retries': 2,
+    'retry_delay': timedelta(minutes=1),
+}
+
+
+# Change data capture from the production database's logical replication slot.
+# A near real-time feed next to the daily polling of sante_metrics_dag, which it does not
+# replace: the micro-batches are kept out of the manifests and cleaning reads the daily extracts.
+with DAG(
+    'sante_cdc_dag-v1.0.0',
+    default_args=default_args,
+    schedule_interval=timedelta(minutes=5),
+    catchup=False,
+    # The slot is a single cursor: never drain it from two runs at once
+    max_active_runs=1,
+    tags=['sante', 'cdc'],
+    ) as dag:
+    capture_task = PythonOperator(
+        task_id='capture_changes',
+        python_callable=capture_changes,
+        provide_context=True,
+    )
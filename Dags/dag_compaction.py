@@ -0,0 +1,32 @@
+from airflow import DAG
+from src.utils import compact_partitions
+from airflow.operators.python_operator import PythonOperator
+from datetime import datetime, timedelta
+
+
+default_args = {
+    'owner': 'airflow',
+    'depends_on_past': False,
+    'start_date': datetime(2024, 1, 1),
+    'email_on_failure': False,
+    'email_on_retry': False,
+    'retries': 2,
+    'retry_delay': timedelta(minutes=5),
+}
+
+
+# Once a month is over, merge its daily Parquet files into one file per table
+# in each bucket (the run's execution_date is the start of the closed month).
+with DAG(
+    'sante_compaction_dag-v1.0.0',
+    default_args=default_args,
+    schedule_interval='@monthly',
+    catchup=True,
+    max_active_runs=1,
+    tags=['sante', 'maintenance'],
+    ) as dag:
+    compaction_task = PythonOperator(
+        task_id='compact_partitions',
+        python_callable=compact_partitions,
+        provide_context=True,
+    )
@@ -0,0 +1,144 @@
+import logging
+
+import polars as pl
+
+# Declarative aggregates written to the aggregated bucket, one object per aggregate and day.
+#   fact      fact table read from the clean bucket; its date column is always the first key
+#   joins     dimension table -> attributes added to the fact through its ``<name>_id`` key
+#   group_by  grouping columns (fact columns or joined attributes)
+#   rollup    also compute every prefix of group_by (a, b, c -> (a, b), (a), ()), the
+#             rolled-up columns being NULL and ``grouping_level`` their number
+#   measures  output column -> (function, column); functions: count, sum, mean, min,
+#             max, n_unique and rate (share of true values of a boolean column)
+AGGREGATES = {
+    'consultation_daily': {
+        'fact': 'fact_consultation',
+        'measures': {'nb_consultations': ('count', None)},
+    },
+    'consultation_cost': {
+        'fact': 'fact_consultation',
+        'joins': {'dim_medecin': ['specialite']},
+        'group_by': ['etablissement_id', 'specialite', 'urgence'],
+        'rollup': True,
+        'measures': {
+            'nb_consultations': ('count', None),
+            'cout_total': ('sum', 'cout'),
+            'cout_moyen': ('mean', 'cout'),
+            'duree_moyenne_minutes': ('mean', 'duree_minutes'),
+            'satisfaction_moyenne': ('mean', 'satisfaction_patient'),
+            'nb_patients': ('n_unique', 'patient_id'),
+        },
+    },
+    'traitement_cost': {
+        'fact': 'fact_traitement',
+        'joins': {'dim_medicament': ['categorie_therapeutique']},
+        'group_by': ['categorie_therapeutique'],
+        'measures': {
+            'nb_traitements': ('count', None),
+            'cout_total': ('sum', 'cout_total'),
+            'duree_moyenne_jours': ('mean', 'duree_jours'),
+            'efficacite_moyenne': ('mean', 'efficacite'),
+            'taux_effets_secondaires': ('rate', 'effets_secondaires'),
+        },
+    },
+    'occupation_by_type': {
+        'fact': 'fact_occupation_etablissement',
+        'joins': {'dim_etablissement': ['type']},
+        'group_by': ['type', 'etablissement_id'],
+        'rollup': True,
+        'measures': {
+            'taux_occupation_moyen': ('mean', 'taux_occupation'),
+            'nombre_admissions': ('sum', 'nombre_admissions'),
+            'nombre_sorties': ('sum', 'nombre_sorties'),
+            'duree_moyenne_sejour': ('mean', 'duree_moyenne_sejour'),
+        },
+    },
+    'analyse_abnormal_rate': {
+        'fact': 'fact_analyse',
+        'group_by': ['type_analyse'],
+        'rollup': True,
+        'measures': {
+            'nb_analyses': ('count', None),
+            'taux_anormal': ('rate', 'resultat_anormal'),
+            'cout_moyen': ('mean', 'cout'),
+            'delai_moyen_heures': ('mean', 'delai_resultat_heures'),
+        },
+    },
+}
+
+GROUPING_LEVEL_COLUMN = "grouping_level"
+
+_MEASURES = {
+    'count': lambda column: pl.len(),
+    'sum': lambda column: pl.col(column).sum(),
+    'mean': lambda column: pl.col(column).mean(),
+    'min': lambda column: pl.col(column).min(),
+    'max': lambda column: pl.col(column).max(),
+    'n_unique': lambda column: pl.col(column).n_unique(),
+    'rate': lambda column: pl.col(column).cast(pl.Float64).mean(),
+}
+
+
+def dimension_key(dimension_table: str) -> str:
+    return f"{dimension_table[len('dim_'):]}_id"
+
+
+def aggregates_for(fact_table: str, names=None) -> dict:
+    names = AGGREGATES if names is None else names
+    return {name: AGGREGATES[name] for name in names if AGGREGATES[name]['fact'] == fact_table}
+
+
+def required_dimensions(fact_table: str, names=None) -> dict:
+    """Dimension table -> attributes needed by the aggregates of ``fact_table``."""
+    needed = {}
+    for spec in aggregates_for(fact_table, names).values():
+        for dimension_table, attributes in spec.get('joins', {}).items():
+            needed.setdefault(dimension_table, set()).update(attributes)
+    return {dimension_table: sorted(attributes) for dimension_table, attributes in needed.items()}
+
+
+def required_columns(fact_table: str, date_column: str, names=None) -> list:
+    """Fact columns read by the aggregates of ``fact_table`` (projection pushed to the reader)."""
+    joined = {attribute for attributes in required_dimensions(fact_table, names).values() for attribute in attributes}
+    columns = {date_column}
+    columns.update(dimension_key(dimension_table) for dimension_table in required_dimensions(fact_table, names))
+    for spec in aggregates_for(fact_table, names).values():
+        columns.update(column for column in spec.get('group_by', []) if column not in joined)
+        columns.update(column for _, column in spec['measures'].values() if column is not None)
+    return sorted(columns)
+
+
+def _aggregate_plan(base: pl.LazyFrame, date_column: str, spec: dict) -> pl.LazyFrame:
+    group_by = spec.get('group_by', [])
+    measures = [_MEASURES[function](column).alias(name) for name, (function, column) in spec['measures'].items()]
+    if not spec.get('rollup', False):
+        return base.group_by([date_column] + group_by).agg(measures).sort([date_column] + group_by)
+
+    levels = [
+        base.group_by([date_column] + group_by[:depth]).agg(measures)
+        .with_columns(pl.lit(len(group_by) - depth, dtype=pl.Int8).alias(GROUPING_LEVEL_COLUMN))
+        for depth in range(len(group_by), -1, -1)
+    ]
+    # Missing (rolled-up) columns are filled with NULLs of the right type
+    columns = [date_column] + group_by + [GROUPING_LEVEL_COLUMN] + list(spec['measures'])
+    return (pl.concat(levels, how="diagonal").select(columns)
+            .sort([date_column, GROUPING_LEVEL_COLUMN] + group_by, nulls_last=True))
+
+
+def build_aggregate_plans(fact_table: str, fact: pl.LazyFrame, dimensions: dict, date_column: str,
+                          names=None) -> dict:
+    """Lazy plans of the aggregates of ``fact_table``, all sharing the same joined input."""
+    base = fact
+    for dimension_table, attributes in required_dimensions(fact_table, names).items():
+        key = dimension_key(dimension_table)
+        base = base.join(dimensions[dimension_table].lazy().select([key] + attributes), on=key, how="left")
+    return {name: _aggregate_plan(base, date_column, spec) for name, spec in aggregates_for(fact_table, names).items()}
+
+
+def compute_aggregates(fact_table: str, df: pl.DataFrame, dimensions: dict, date_column: str, names=None) -> dict:
+    """Compute every aggregate of ``fact_table`` in a single ``collect_all`` over ``df``."""
+    plans = build_aggregate_plans(fact_table, df.lazy(), dimensions, date_column, names)
+    results = dict(zip(plans, pl.collect_all(list(plans.values()))))
+    for name, result in results.items():
+        logging.info(f"Aggregate {name}: {len(result)} rows from {len(df)} {fact_table} rows")
+    return results
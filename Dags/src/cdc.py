@@ -0,0 +1,278 @@
+import os
+import json
+import hashlib
+import struct
+import logging
+from datetime import datetime
+
+import polars as pl
+
+from src.layout import put_parquet
+from src.streaming import PG_TYPE_MAPPING
+
+CDC_SLOT_NAME = os.environ.get("SANTE_CDC_SLOT", "sante_cdc")
+# pgoutput ships with Postgres; wal2json needs the extension installed on the server
+CDC_PLUGIN = os.environ.get("SANTE_CDC_PLUGIN", "pgoutput")
+CDC_PUBLICATION = os.environ.get("SANTE_CDC_PUBLICATION", "sante_cdc")
+# Changes decoded per micro-batch (Postgres always returns whole transactions)
+CDC_BATCH_CHANGES = int(os.environ.get("SANTE_CDC_BATCH_CHANGES", "100000"))
+CDC_CHECKPOINT_TABLE = "etl_cdc_checkpoint"
+
+CDC_OPERATION_COLUMN = "_cdc_op"
+CDC_LSN_COLUMN = "_cdc_lsn"
+# pgoutput 'u': a TOASTed value the update did not change, hence not sent again
+UNCHANGED_TOAST = object()
+
+
+def ensure_cdc_slot(connection, tables, slot_name: str = CDC_SLOT_NAME, plugin: str = CDC_PLUGIN):
+    """Create the checkpoint table, the publication (pgoutput) and the logical slot if missing.
+
+    Requires ``wal_level = logical`` on the source server.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {CDC_CHECKPOINT_TABLE} (
+                slot_name TEXT PRIMARY KEY,
+                plugin TEXT NOT NULL,
+                lsn PG_LSN NOT NULL,
+                nb_changes BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP NOT NULL DEFAULT now()
+            )
+        """)
+        if plugin == 'pgoutput':
+            cursor.execute("SELECT 1 FROM pg_publication WHERE pubname = %s", (CDC_PUBLICATION,))
+            if cursor.fetchone() is None:
+                cursor.execute(f"CREATE PUBLICATION {CDC_PUBLICATION} FOR TABLE {', '.join(tables)}")
+        cursor.execute("SELECT 1 FROM pg_replication_slots WHERE slot_name = %s", (slot_name,))
+        if cursor.fetchone() is None:
+            cursor.execute("SELECT pg_create_logical_replication_slot(%s, %s)", (slot_name, plugin))
+            logging.info(f"Created logical replication slot {slot_name} ({plugin})")
+    connection.commit()
+
+
+def _peek_changes(connection, slot_name, plugin, tables, max_changes):
+    """Return ``(lsn, data)`` rows from the slot without consuming them."""
+    with connection.cursor() as cursor:
+        if plugin == 'pgoutput':
+            cursor.execute(
+                "SELECT lsn::text, data FROM pg_logical_slot_peek_binary_changes("
+                "%s, NULL, %s, 'proto_version', '1', 'publication_names', %s)",
+                (slot_name, max_changes, CDC_PUBLICATION)
+            )
+        else:
+            cursor.execute(
+                "SELECT lsn::text, data FROM pg_logical_slot_peek_changes("
+                "%s, NULL, %s, 'format-version', '2', 'include-type-oids', '1', "
+                "'actions', 'insert,update', 'add-tables', %s)",
+                (slot_name, max_changes, ','.join(f"public.{table}" for table in tables))
+            )
+        rows = cursor.fetchall()
+    # The slot is only advanced once the batch is stored
+    connection.rollback()
+    return rows
+
+
+def _read_tuple(data: bytes, pos: int):
+    """Decode a pgoutput TupleData; values stay in their text representation."""
+    nb_columns, = struct.unpack_from('!h', data, pos)
+    pos += 2
+    values = []
+    for _ in range(nb_columns):
+        kind = data[pos:pos + 1]
+        pos += 1
+        if kind == b't':
+            length, = struct.unpack_from('!i', data, pos)
+            pos += 4
+            values.append(data[pos:pos + length].decode())
+            pos += length
+        elif kind == b'u':
+            values.append(UNCHANGED_TOAST)
+        else:
+            values.append(None)
+    return values, pos
+
+
+def _read_cstring(data: bytes, pos: int):
+    end = data.index(b'\x00', pos)
+    return data[pos:end].decode(), end + 1
+
+
+def decode_pgoutput(messages, relations: dict):
+    """Yield ``(table, op, lsn, columns, {column: text})`` for the inserts and updates in ``messages``.
+
+    ``relations`` caches the Relation messages (relid -> (table, [(column, type oid)])).
+    Unchanged TOASTed columns of an update are left out of its values, not set to NULL.
+    """
+    for lsn, data in messages:
+        data = bytes(data)
+        kind = data[0:1]
+        if kind == b'R':
+            relid, = struct.unpack_from('!I', data, 1)
+            _, pos = _read_cstring(data, 5)
+            table_name, pos = _read_cstring(data, pos)
+            nb_columns, = struct.unpack_from('!h', data, pos + 1)
+            pos += 3
+            columns = []
+            for _ in range(nb_columns):
+                name, pos = _read_cstring(data, pos + 1)
+                type_oid, = struct.unpack_from('!I', data, pos)
+                pos += 8
+                columns.append((name, type_oid))
+            relations[relid] = (table_name, columns)
+        elif kind in (b'I', b'U'):
+            relid, = struct.unpack_from('!I', data, 1)
+            pos = 5
+            if data[pos:pos + 1] in (b'K', b'O'):
+                # Old key / old row of an update: only the new row is kept
+                _, pos = _read_tuple(data, pos + 1)
+            values, _ = _read_tuple(data, pos + 1)
+            table_name, columns = relations[relid]
+            yield table_name, kind.decode(), lsn, columns, {
+                name: value for (name, _), value in zip(columns, values) if value is not UNCHANGED_TOAST}
+
+
+def decode_wal2json(messages):
+    """Same output as :func:`decode_pgoutput` for wal2json ``format-version`` 2 messages."""
+    for lsn, data in messages:
+        change = json.loads(data)
+        if change['action'] not in ('I', 'U'):
+            continue
+        columns = [(column['name'], column['typeoid']) for column in change['columns']]
+        values = {
+            column['name']: None if column['value'] is None
+            else ('t' if column['value'] else 'f') if isinstance(column['value'], bool)
+            else str(column['value'])
+            for column in change['columns']
+        }
+        yield change['table'], change['action'], lsn, columns, values
+
+
+def _cast_text_column(name: str, type_oid: int) -> pl.Expr:
+    dtype = PG_TYPE_MAPPING.get(type_oid, pl.Utf8)
+    column = pl.col(name)
+    if dtype == pl.Boolean:
+        return (column == 't').alias(name)
+    if dtype == pl.Date:
+        return column.str.strptime(pl.Date, "%Y-%m-%d", strict=False).alias(name)
+    if dtype == pl.Utf8:
+        return column
+    if dtype in (pl.Int16, pl.Int32, pl.Int64, pl.Float32, pl.Float64):
+        return column.cast(dtype, strict=False)
+    return column.str.strptime(dtype, strict=False).alias(name)
+
+
+def changes_to_frames(changes) -> dict:
+    """Group decoded changes into typed frames with ``_cdc_op`` / ``_cdc_lsn`` columns.
+
+    Frames are keyed by ``(table, unchanged columns)``: updates that did not
+    send some columns (unchanged TOAST) get a frame without them, so a value
+    that was not sent is never stored as NULL.
+    """
+    rows_by_table, types_by_table = {}, {}
+    for table_name, op, lsn, columns, values in changes:
+        types_by_table.setdefault(table_name, {}).update(columns)
+        rows_by_table.setdefault(table_name, []).append({**values, CDC_OPERATION_COLUMN: op, CDC_LSN_COLUMN: lsn})
+
+    frames = {}
+    for table_name, rows in rows_by_table.items():
+        types = types_by_table[table_name]
+        groups = {}
+        for row in rows:
+            groups.setdefault(tuple(name for name in types if name not in row), []).append(row)
+        for unchanged, group in groups.items():
+            sent = {name: type_oid for name, type_oid in types.items() if name not in unchanged}
+            schema = {name: pl.Utf8 for name in sent}
+            schema.update({CDC_OPERATION_COLUMN: pl.Utf8, CDC_LSN_COLUMN: pl.Utf8})
+            frames[table_name, unchanged] = pl.DataFrame(group, schema=schema).with_columns(
+                [_cast_text_column(name, type_oid) for name, type_oid in sent.items()]
+            )
+    return frames
+
+
+def lsn_key(lsn: str) -> str:
+    """``16/B374D848`` -> ``00000016B374D848``, so object keys sort in LSN order."""
+    high, low = lsn.split('/')
+    return f"{int(high, 16):08X}{int(low, 16):08X}"
+
+
+def cdc_suffix(lsn: str, unchanged=()) -> str:
+    """Object suffix of a micro-batch; frames missing unchanged columns get a stable extra tag."""
+    suffix = f"_cdc_{lsn_key(lsn)}"
+    if unchanged:
+        suffix += f"_u{hashlib.md5(','.join(unchanged).encode()).hexdigest()[:8]}"
+    return suffix
+
+
+def read_checkpoint(connection, slot_name: str = CDC_SLOT_NAME):
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT lsn::text FROM {CDC_CHECKPOINT_TABLE} WHERE slot_name = %s", (slot_name,))
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def commit_checkpoint(connection, lsn: str, nb_changes: int, slot_name: str = CDC_SLOT_NAME,
+                      plugin: str = CDC_PLUGIN):
+    """Record ``lsn`` as stored, then release the WAL before it from the slot."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {CDC_CHECKPOINT_TABLE} (slot_name, plugin, lsn, nb_changes)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (slot_name) DO UPDATE SET
+                plugin = EXCLUDED.plugin,
+                lsn = EXCLUDED.lsn,
+                nb_changes = {CDC_CHECKPOINT_TABLE}.nb_changes + EXCLUDED.nb_changes,
+                updated_at = now()
+            """,
+            (slot_name, plugin, lsn, nb_changes)
+        )
+        connection.commit()
+        _advance_slot(cursor, slot_name, lsn)
+    connection.commit()
+    logging.info(f"CDC checkpoint for {slot_name} advanced to {lsn}")
+
+
+def _advance_slot(cursor, slot_name: str, lsn: str):
+    cursor.execute(
+        "SELECT pg_replication_slot_advance(%s, %s::pg_lsn) FROM pg_replication_slots "
+        "WHERE slot_name = %s AND confirmed_flush_lsn < %s::pg_lsn",
+        (slot_name, lsn, slot_name, lsn)
+    )
+
+
+def capture_batch(connection, minio_client, bucket: str, tables, slot_name: str = CDC_SLOT_NAME,
+                  plugin: str = CDC_PLUGIN, max_changes: int = CDC_BATCH_CHANGES) -> dict:
+    """Store one micro-batch of changes as Parquet and checkpoint its last LSN.
+
+    Changes are peeked, uploaded to the day partition as ``{table}_{YYYY-MM-DD}_cdc_{lsn}.parquet``
+    (plus ``_u{tag}`` for updates with unchanged TOAST columns, see
+    :func:`changes_to_frames`) and only then consumed from the slot. A crash in between replays the same
+    transactions into the same object keys, so delivery is at-least-once and
+    the files are idempotent. Returns per-table row counts, or ``None`` once
+    the slot has nothing left to decode.
+    """
+    # A checkpoint written just before a crash may not have reached the slot yet
+    checkpoint = read_checkpoint(connection, slot_name)
+    if checkpoint is not None:
+        with connection.cursor() as cursor:
+            _advance_slot(cursor, slot_name, checkpoint)
+        connection.commit()
+
+    messages = _peek_changes(connection, slot_name, plugin, tables, max_changes)
+    if not messages:
+        return None
+
+    changes = decode_pgoutput(messages, {}) if plugin == 'pgoutput' else decode_wal2json(messages)
+    frames = changes_to_frames(change for change in changes if change[0] in tables)
+
+    last_lsn = messages[-1][0]
+    capture_date = datetime.utcnow().date()
+    counts = {}
+    for (table_name, unchanged), df in frames.items():
+        object_path = put_parquet(minio_client, bucket, table_name, capture_date, df,
+                                  suffix=cdc_suffix(last_lsn, unchanged), profile='raw', register=False)
+        logging.info(f"Stored {len(df)} changes of {table_name} to {object_path}")
+        counts[table_name] = counts.get(table_name, 0) + len(df)
+
+    commit_checkpoint(connection, last_lsn, sum(counts.values()), slot_name, plugin)
+    return counts
@@ -0,0 +1,170 @@
+import logging
+
+import polars as pl
+
+# Declarative cleaning rules per table.
+#   casts      column -> dtype (non-castable values are rejected under "cast:<column>")
+#   nullable   columns allowed to be NULL; every other column must be non-NULL
+#   fill       column -> value used instead of NULL (applied before the null check)
+#   normalize  column -> "strip" | "upper" | "lower" | "title"
+#   ranges     column -> (min, max), inclusive, None for an open bound
+#   dedup_keys business key used for deduplication (whole row when absent)
+CLEANING_RULES = {
+    'dim_temps': {
+        'casts': {'date': pl.Date},
+        'ranges': {'mois': (1, 12), 'jour': (1, 31), 'trimestre': (1, 4)},
+        'dedup_keys': ['temps_id'],
+    },
+    'dim_patient': {
+        'casts': {'date_naissance': pl.Date, 'age': pl.Int32},
+        'normalize': {'nom': 'strip', 'prenom': 'strip', 'ville': 'strip',
+                      'sexe': 'upper', 'groupe_sanguin': 'upper'},
+        'ranges': {'age': (0, 130)},
+        'dedup_keys': ['patient_id'],
+    },
+    'dim_medecin': {
+        'casts': {'experience_annees': pl.Int32},
+        'normalize': {'nom': 'strip', 'prenom': 'strip', 'specialite': 'strip'},
+        'ranges': {'experience_annees': (0, 70)},
+        'dedup_keys': ['medecin_id'],
+    },
+    'dim_etablissement': {
+        'normalize': {'nom': 'strip', 'ville': 'strip'},
+        'ranges': {'capacite_lits': (0, None)},
+        'dedup_keys': ['etablissement_id'],
+    },
+    'dim_diagnostic': {
+        'normalize': {'code_cim10': 'upper'},
+        'dedup_keys': ['diagnostic_id'],
+    },
+    'dim_medicament': {
+        'casts': {'prix': pl.Float64},
+        'normalize': {'nom': 'strip'},
+        'ranges': {'prix': (0, None)},
+        'dedup_keys': ['medicament_id'],
+    },
+    'fact_consultation': {
+        'casts': {'date_consultation': pl.Date, 'duree_minutes': pl.Int32},
+        # About 10% of consultations legitimately have no diagnosis
+        'nullable': ['diagnostic_id'],
+        'ranges': {'duree_minutes': (1, 24 * 60), 'cout': (0, None), 'satisfaction_patient': (1, 5)},
+        'dedup_keys': ['consultation_id'],
+    },
+    'fact_traitement': {
+        'casts': {'date_traitement': pl.Date},
+        'nullable': ['diagnostic_id'],
+        'ranges': {'duree_jours': (1, None), 'cout_total': (0, None), 'efficacite': (1, 5)},
+        'dedup_keys': ['traitement_id'],
+    },
+    'fact_analyse': {
+        'casts': {'date_analyse': pl.Date},
+        'ranges': {'cout': (0, None), 'delai_resultat_heures': (0, None)},
+        'dedup_keys': ['analyse_id'],
+    },
+    'fact_occupation_etablissement': {
+        'casts': {'date_occupation': pl.Date},
+        'ranges': {'taux_occupation': (0, 1), 'nombre_admissions': (0, None),
+                   'nombre_sorties': (0, None), 'duree_moyenne_sejour': (0, None)},
+        'dedup_keys': ['occupation_id'],
+    },
+}
+
+REJECT_COLUMN = "_rejected_by"
+DEDUP_RULE = "dedup"
+
+_NORMALIZERS = {
+    'strip': lambda expr: expr.str.strip_chars(),
+    'upper': lambda expr: expr.str.strip_chars().str.to_uppercase(),
+    'lower': lambda expr: expr.str.strip_chars().str.to_lowercase(),
+    'title': lambda expr: expr.str.strip_chars().str.to_titlecase(),
+}
+
+
+def _reject_expression(rules: dict, schema) -> pl.Expr:
+    """Name of the first rule a row violates, NULL when the row is valid."""
+    checks = []
+    for column, dtype in rules.get('casts', {}).items():
+        if column in schema:
+            failed = pl.col(column).is_not_null() & pl.col(column).cast(dtype, strict=False).is_null()
+            checks.append((f"cast:{column}", failed))
+
+    nullable = set(rules.get('nullable', []))
+    for column in schema:
+        if column not in nullable:
+            checks.append((f"not_null:{column}", pl.col(column).is_null()))
+
+    for column, (low, high) in rules.get('ranges', {}).items():
+        if column not in schema:
+            continue
+        value = pl.col(column)
+        if column in rules.get('casts', {}):
+            value = value.cast(rules['casts'][column], strict=False)
+        out_of_range = pl.lit(False)
+        if low is not None:
+            out_of_range = out_of_range | (value < low)
+        if high is not None:
+            out_of_range = out_of_range | (value > high)
+        checks.append((f"range:{column}", out_of_range.fill_null(False)))
+
+    if not checks:
+        return pl.lit(None, dtype=pl.Utf8)
+    reason = pl.when(checks[0][1]).then(pl.lit(checks[0][0]))
+    for name, condition in checks[1:]:
+        reason = reason.when(condition).then(pl.lit(name))
+    return reason.otherwise(pl.lit(None, dtype=pl.Utf8))
+
+
+def build_cleaning_plan(table_name: str, df: pl.DataFrame):
+    """Compile the rules of ``table_name`` into lazy plans over ``df``.
+
+    Returns ``(checked, clean)``: ``checked`` carries the rejection reason of
+    every row, ``clean`` is the deduplicated set of valid rows.
+    """
+    rules = CLEANING_RULES.get(table_name, {})
+    schema = df.schema
+
+    lf = df.lazy()
+    fill = {column: value for column, value in rules.get('fill', {}).items() if column in schema}
+    normalize = {column: how for column, how in rules.get('normalize', {}).items()
+                 if column in schema and schema[column] == pl.Utf8}
+    if fill or normalize:
+        lf = lf.with_columns(
+            [pl.col(column).fill_null(value) for column, value in fill.items()]
+            + [_NORMALIZERS[how](pl.col(column)).alias(column) for column, how in normalize.items()]
+        )
+
+    checked = lf.with_columns(_reject_expression(rules, schema).alias(REJECT_COLUMN))
+
+    casts = [pl.col(column).cast(dtype, strict=False) for column, dtype in rules.get('casts', {}).items()
+             if column in schema]
+    valid = checked.filter(pl.col(REJECT_COLUMN).is_null()).drop(REJECT_COLUMN)
+    if casts:
+        valid = valid.with_columns(casts)
+
+    dedup_keys = [column for column in rules.get('dedup_keys', []) if column in schema]
+    clean = valid.unique(subset=dedup_keys or None, keep='first', maintain_order=True)
+    return checked, clean
+
+
+def apply_cleaning_rules(table_name: str, df: pl.DataFrame):
+    """Run the compiled plan and return ``(clean_df, rejected)``.
+
+    ``rejected`` maps each rule name to the number of rows it rejected. A row
+    is counted under the first rule it violates only; ``dedup`` counts the
+    duplicates removed on the business key.
+    """
+    checked, clean = build_cleaning_plan(table_name, df)
+    reasons = (checked.filter(pl.col(REJECT_COLUMN).is_not_null())
+               .group_by(REJECT_COLUMN).agg(pl.len().alias("rows")))
+    nb_valid = checked.filter(pl.col(REJECT_COLUMN).is_null()).select(pl.len().alias("rows"))
+
+    # collect_all runs the plans together so the shared scan/checks are computed once
+    reasons_df, nb_valid_df, clean_df = pl.collect_all([reasons, nb_valid, clean])
+
+    rejected = dict(zip(reasons_df[REJECT_COLUMN].to_list(), reasons_df["rows"].to_list()))
+    duplicates = nb_valid_df["rows"][0] - len(clean_df)
+    if duplicates:
+        rejected[DEDUP_RULE] = duplicates
+    if rejected:
+        logging.info(f"Cleaning rules rejected rows from {table_name}: {rejected}")
+    return clean_df, rejected
@@ -0,0 +1,357 @@
+import io
+import os
+import json
+import math
+import time
+import uuid
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import polars as pl
+from minio.error import S3Error
+
+from src.cleaning_rules import CLEANING_RULES
+from src.encoding import write_parquet
+from src.instrumentation import record
+from src.parquet_reader import read_parquet_object
+from src.resources import put_object_if
+
+# Root of the dedup indexes in the clean bucket: dedup/{table}/_index.json, bloom/*.bin, part=NNN/*.parquet
+DEDUP_PREFIX = "dedup/"
+# Fact tables deduplicated across days, on their dedup_keys (src.cleaning_rules)
+DEDUP_TABLES = ['fact_consultation', 'fact_traitement', 'fact_analyse', 'fact_occupation_etablissement']
+# Hash partitions of the key store, fixed when an index is created
+DEDUP_PARTITIONS = int(os.environ.get("SANTE_DEDUP_PARTITIONS", "64"))
+# Target Bloom false positive rate and its memory cap; over the cap the rate degrades (logged)
+DEDUP_FALSE_POSITIVE_RATE = float(os.environ.get("SANTE_DEDUP_FALSE_POSITIVE_RATE", "0.01"))
+DEDUP_BLOOM_MAX_BYTES = int(os.environ.get("SANTE_DEDUP_BLOOM_MAX_MB", "256")) * 2 ** 20
+# Keys the Bloom filter of a new index is sized for; it is rebuilt twice as large when full
+DEDUP_INITIAL_CAPACITY = int(os.environ.get("SANTE_DEDUP_INITIAL_CAPACITY", "1000000"))
+# Partitions read at once: memory is bounded by the Bloom filter plus this many partitions
+DEDUP_READ_WORKERS = int(os.environ.get("SANTE_DEDUP_READ_WORKERS", "4"))
+# Segments of a partition merged into one once there are more
+DEDUP_MAX_SEGMENTS = int(os.environ.get("SANTE_DEDUP_MAX_SEGMENTS", "16"))
+# Segments replaced by a compaction are deleted this long after, once no reader can still list them
+DEDUP_RETIRED_GRACE_SECONDS = float(os.environ.get("SANTE_DEDUP_RETIRED_GRACE_HOURS", "24")) * 3600
+# Conditional index writes attempted before giving up when other processes keep committing
+DEDUP_WRITE_ATTEMPTS = int(os.environ.get("SANTE_DEDUP_WRITE_ATTEMPTS", "10"))
+
+FIRST_DAY_COLUMN = "_first_day"
+_BLOOM_CHUNK = 1_000_000
+_index_locks = {}
+_index_locks_guard = threading.Lock()
+
+
+def _index_lock(bucket: str, table: str) -> threading.Lock:
+    with _index_locks_guard:
+        return _index_locks.setdefault((bucket, table), threading.Lock())
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer: stable 64-bit hash of uint64 values (unlike Polars' hash, across versions too)."""
+    with np.errstate(over='ignore'):
+        values = values + np.uint64(0x9E3779B97F4A7C15)
+        values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return values ^ (values >> np.uint64(31))
+
+
+def key_hashes(df: pl.DataFrame, keys: list) -> np.ndarray:
+    """64-bit hash of the business key of every row; keys must be integer (or date) columns."""
+    hashes = np.zeros(len(df), dtype=np.uint64)
+    for column in keys:
+        physical = df[column].to_physical()
+        if not physical.dtype.is_integer():
+            raise ValueError(f"Dedup index keys must be integers, {column} is {df[column].dtype}")
+        hashes = _mix(hashes ^ _mix(physical.cast(pl.Int64).to_numpy().view(np.uint64)))
+    return hashes
+
+
+def key_partitions(hashes: np.ndarray, nb_partitions: int) -> np.ndarray:
+    # Remixed so the partition is independent of the bits the Bloom filter uses
+    return (_mix(hashes ^ np.uint64(0x5BD1E995)) % np.uint64(nb_partitions)).astype(np.int64)
+
+
+class BloomFilter:
+    """Bit array with ``nb_hashes`` probes per key, derived from the 64-bit key hash (double hashing).
+
+    The size is a power of two, so probes are masked rather than divided.
+    """
+
+    def __init__(self, words: np.ndarray, nb_hashes: int):
+        self.words = words
+        self.mask = np.uint64(len(words) * 64 - 1)
+        self.nb_hashes = nb_hashes
+
+    @classmethod
+    def sized_for(cls, capacity: int, false_positive_rate: float = DEDUP_FALSE_POSITIVE_RATE,
+                  max_bytes: int = DEDUP_BLOOM_MAX_BYTES) -> "BloomFilter":
+        nb_bits = math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+        max_bits = 2 ** int(math.log2(max_bytes * 8))
+        if nb_bits > max_bits:
+            logging.warning(f"Bloom filter for {capacity} keys capped at {max_bits // 8} bytes: "
+                            f"false positive rate above {false_positive_rate}")
+        nb_bits = min(max_bits, max(64, 2 ** math.ceil(math.log2(nb_bits))))
+        # Optimal probe count, but no more than the target rate needs once the size is rounded up
+        nb_hashes = max(1, round(min(nb_bits / capacity * math.log(2), -math.log2(false_positive_rate))))
+        return cls(np.zeros(nb_bits // 64, dtype=np.uint64), nb_hashes)
+
+    def _probes(self, hashes: np.ndarray):
+        """(word, bit) of each probe of ``hashes``, one probe at a time."""
+        low = hashes & np.uint64(0xFFFFFFFF)
+        step = (hashes >> np.uint64(32)) | np.uint64(1)
+        for probe in range(self.nb_hashes):
+            with np.errstate(over='ignore'):
+                positions = (low + np.uint64(probe) * step) & self.mask
+            yield positions >> np.uint64(6), positions & np.uint64(63)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        found = np.ones(len(hashes), dtype=bool)
+        for start in range(0, len(hashes), _BLOOM_CHUNK):
+            chunk_found = found[start:start + _BLOOM_CHUNK]
+            for words, bits in self._probes(hashes[start:start + _BLOOM_CHUNK]):
+                chunk_found &= ((self.words[words] >> bits) & np.uint64(1)).astype(bool)
+        return found
+
+    def add(self, hashes: np.ndarray):
+        for start in range(0, len(hashes), _BLOOM_CHUNK):
+            for words, bits in self._probes(hashes[start:start + _BLOOM_CHUNK]):
+                np.bitwise_or.at(self.words, words, np.uint64(1) << bits)
+
+
+class DedupIndex:
+    """Persistent index of the business keys of a fact table, kept in MinIO.
+
+    Every key ever cleaned is stored with the day it was first seen, in
+    Parquet segments spread over hash partitions
+    (``dedup/{table}/part=NNN/``); a Bloom filter over all keys
+    (``dedup/{table}/bloom/*.bin``) spares reading the partitions for keys
+    never seen, i.e. nearly all of them.
+
+    False positive policy: a Bloom hit is only a candidate. Candidates are
+    checked against their partition, so a new row is never dropped because
+    of the filter; false positives only cost partition reads, at the rate
+    set by ``SANTE_DEDUP_FALSE_POSITIVE_RATE``.
+
+    ``_index.json`` is only written if it is unchanged since it was read
+    (If-Match), so concurrent commits, across processes too, are retried
+    on top of each other instead of losing one. Every commit writes a new
+    Bloom filter object, named in the index, so the filter always matches
+    the index it was built from. Segments merged by a compaction are only deleted after a grace period
+    (``SANTE_DEDUP_RETIRED_GRACE_HOURS``), so another process holding the
+    previous metadata can still read them; past it, a missing segment
+    makes the reader reload the metadata.
+    """
+
+    def __init__(self, minio_client, bucket: str, table: str):
+        self.minio_client = minio_client
+        self.bucket = bucket
+        self.table = table
+        self.root = f"{DEDUP_PREFIX}{table}"
+        self.keys = CLEANING_RULES[table]['dedup_keys']
+        self._reload_lock = threading.Lock()
+        self._load()
+        self._pending = None
+
+    def _get(self, name: str):
+        """``(payload, etag)`` of ``name``, ``(None, None)`` if it does not exist."""
+        try:
+            response = self.minio_client.get_object(self.bucket, f"{self.root}/{name}")
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchBucket"):
+                return None, None
+            raise
+        try:
+            return response.read(), response.headers.get("ETag")
+        finally:
+            response.close()
+            response.release_conn()
+
+    def _put(self, name: str, payload: bytes, content_type: str = 'application/octet-stream'):
+        self.minio_client.put_object(self.bucket, f"{self.root}/{name}", io.BytesIO(payload), len(payload),
+                                     content_type=content_type)
+
+    def _load(self):
+        payload, self._etag = self._get("_index.json")
+        if payload is None:
+            self.metadata = {'table': self.table, 'keys': self.keys, 'partitions': DEDUP_PARTITIONS,
+                             'count': 0, 'capacity': DEDUP_INITIAL_CAPACITY, 'segments': {}}
+            self.bloom = BloomFilter.sized_for(DEDUP_INITIAL_CAPACITY)
+            self.metadata['bloom_hashes'] = self.bloom.nb_hashes
+            return
+        self.metadata = json.loads(payload)
+        # Indexes written before the filter was versioned keep it in bloom.bin
+        bits, _ = self._get(self.metadata.setdefault('bloom', "bloom.bin"))
+        if bits is None:
+            self._rebuild_bloom(self.metadata['capacity'])
+        else:
+            self.bloom = BloomFilter(np.frombuffer(bits, dtype=np.uint64).copy(), self.metadata['bloom_hashes'])
+
+    def _read_segments(self, keys) -> pl.DataFrame:
+        frames = []
+        for key in keys:
+            df, metrics = read_parquet_object(self.minio_client, self.bucket, key)
+            record('bytes_in', metrics['bytes_read'])
+            frames.append(df)
+        if not frames:
+            return None
+        return frames[0] if len(frames) == 1 else pl.concat(frames, how="vertical_relaxed")
+
+    def _read_partition(self, partition: int) -> pl.DataFrame:
+        try:
+            return self._read_segments(self.metadata['segments'].get(str(partition), []))
+        except S3Error as e:
+            if e.code != "NoSuchKey":
+                raise
+        # Compacted and deleted since this metadata was read: the current one lists the merged segment
+        logging.info(f"Dedup index of {self.table}: partition {partition} was compacted, reloading the metadata")
+        with self._reload_lock:
+            self._load()
+        return self._read_segments(self.metadata['segments'].get(str(partition), []))
+
+    def _write_segment(self, partition: int, df: pl.DataFrame) -> str:
+        buffer = io.BytesIO()
+        write_parquet(df, buffer, 'clean')
+        key = f"{self.root}/part={partition:03d}/{uuid.uuid4().hex}.parquet"
+        self.minio_client.put_object(self.bucket, key, io.BytesIO(buffer.getvalue()), buffer.getbuffer().nbytes,
+                                     content_type='application/octet-stream')
+        record('bytes_out', buffer.getbuffer().nbytes)
+        return key
+
+    def filter_seen(self, df: pl.DataFrame, day, max_workers: int = DEDUP_READ_WORKERS):
+        """Drop the rows whose key was first seen on another day; return ``(df, nb_dropped)``.
+
+        Keys first seen on ``day`` itself are kept, so replaying a day is a
+        no-op. Keys never seen are remembered until :meth:`commit`.
+        """
+        day = day.date() if isinstance(day, datetime) else day
+        if df.is_empty():
+            self._pending = None
+            return df, 0
+        hashes = key_hashes(df, self.keys)
+        partitions = key_partitions(hashes, self.metadata['partitions'])
+        rows = df.select(self.keys).with_columns([
+            pl.Series('_row', np.arange(len(df))), pl.Series('_partition', partitions),
+            pl.Series('_candidate', self.bloom.contains(hashes)),
+        ])
+
+        def first_days(partition):
+            stored = self._read_partition(partition)
+            candidates = rows.filter(pl.col('_candidate') & (pl.col('_partition') == partition))
+            if stored is None:
+                return None
+            return candidates.join(stored, on=self.keys, how='inner').select(['_row', FIRST_DAY_COLUMN])
+
+        candidate_partitions = rows.filter(pl.col('_candidate'))['_partition'].unique().to_list()
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(candidate_partitions) or 1)),
+                                thread_name_prefix=f"dedup-{self.table}") as executor:
+            found = [part for part in executor.map(first_days, candidate_partitions) if part is not None]
+        seen = (pl.concat(found) if found
+                else pl.DataFrame(schema={'_row': pl.Int64, FIRST_DAY_COLUMN: pl.Date}))
+
+        known = np.zeros(len(df), dtype=bool)
+        known[seen['_row'].to_numpy()] = True
+        redelivered = np.zeros(len(df), dtype=bool)
+        redelivered[seen.filter(pl.col(FIRST_DAY_COLUMN) != day)['_row'].to_numpy()] = True
+
+        new = ~known
+        self._pending = (rows.filter(pl.Series(new)).select(self.keys + ['_partition'])
+                         .with_columns([pl.lit(day).alias(FIRST_DAY_COLUMN)]), hashes[new])
+        nb_candidates = int(rows['_candidate'].sum())
+        logging.info(f"Dedup index of {self.table}: {nb_candidates} Bloom candidates in "
+                     f"{len(candidate_partitions)} partitions, {int(known.sum())} keys already seen, "
+                     f"{int(redelivered.sum())} from earlier days")
+        return df.filter(pl.Series(~redelivered)), int(redelivered.sum())
+
+    def _rebuild_bloom(self, capacity: int):
+        """Size a new filter for ``capacity`` keys and fill it from the partitions, one at a time."""
+        bloom = BloomFilter.sized_for(capacity)
+        for partition in range(self.metadata['partitions']):
+            stored = self._read_partition(partition)
+            if stored is not None:
+                bloom.add(key_hashes(stored, self.keys))
+        logging.info(f"Rebuilt the Bloom filter of {self.table} for {capacity} keys "
+                     f"({bloom.words.nbytes} bytes, {bloom.nb_hashes} hashes)")
+        self.bloom = bloom
+        self.metadata['capacity'] = capacity
+        self.metadata['bloom_hashes'] = bloom.nb_hashes
+
+    def _retire(self, keys: list):
+        """Schedule ``keys`` for deletion once the grace period is over (see :meth:`_expired_segments`)."""
+        retired_at = datetime.utcnow().isoformat()
+        self.metadata.setdefault('retired', []).extend({'key': key, 'retired_at': retired_at} for key in keys)
+
+    def _compact_partition(self, partition: int) -> str:
+        """Merge the segments of ``partition`` and return the merged one; the old ones are retired, not deleted."""
+        segments = self.metadata['segments'][str(partition)]
+        merged = self._write_segment(partition, self._read_partition(partition))
+        self.metadata['segments'][str(partition)] = [merged]
+        self._retire(segments)
+        return merged
+
+    def _expired_segments(self) -> list:
+        """Retired segments past the grace period, removed from the metadata; delete them once it is saved."""
+        limit = (datetime.utcnow() - timedelta(seconds=DEDUP_RETIRED_GRACE_SECONDS)).isoformat()
+        retired = self.metadata.get('retired', [])
+        self.metadata['retired'] = [segment for segment in retired if segment['retired_at'] > limit]
+        return [segment['key'] for segment in retired if segment['retired_at'] <= limit]
+
+    def commit(self) -> int:
+        """Store the new keys of the last :meth:`filter_seen`; call once the clean data is saved.
+
+        The new segments are written once; on a conflicting commit the index
+        is read again and they are added to it, with a filter rebuilt from it.
+        """
+        if self._pending is None or self._pending[0].is_empty():
+            return 0
+        new_keys, new_hashes = self._pending
+        parts = new_keys.partition_by('_partition', as_dict=True)
+        with _index_lock(self.bucket, self.table):
+            segments = {partition: self._write_segment(partition, part.drop('_partition'))
+                        for (partition,), part in parts.items()}
+            for attempt in range(DEDUP_WRITE_ATTEMPTS):
+                # Another writer, in this process or another one, may have committed since the last read
+                self._load()
+                # Captured now: a reload by _read_partition below must make the write fail, not follow it
+                etag = self._etag
+                written = []
+                for partition, segment in segments.items():
+                    self.metadata['segments'].setdefault(str(partition), []).append(segment)
+                    if len(self.metadata['segments'][str(partition)]) > DEDUP_MAX_SEGMENTS:
+                        written.append(self._compact_partition(partition))
+
+                self.metadata['count'] += len(new_keys)
+                if self.metadata['count'] > self.metadata['capacity']:
+                    # The new segments are already listed: the rebuild includes the new keys
+                    self._rebuild_bloom(max(2 * self.metadata['capacity'], self.metadata['count']))
+                else:
+                    self.bloom.add(new_hashes)
+                if 'bloom' in self.metadata:
+                    self._retire([f"{self.root}/{self.metadata['bloom']}"])
+                self.metadata['bloom'] = f"bloom/{uuid.uuid4().hex}.bin"
+                self._put(self.metadata['bloom'], self.bloom.words.tobytes())
+                written.append(f"{self.root}/{self.metadata['bloom']}")
+
+                expired = self._expired_segments()
+                self.metadata['updated_at'] = datetime.utcnow().isoformat()
+                if put_object_if(self.minio_client, self.bucket, f"{self.root}/_index.json",
+                                 json.dumps(self.metadata, indent=1).encode(), etag,
+                                 content_type='application/json'):
+                    break
+                # Never listed in a saved index: nobody can be reading them
+                for key in written:
+                    self.minio_client.remove_object(self.bucket, key)
+                time.sleep(random.uniform(0, 0.05 * 2 ** min(attempt, 5)))
+            else:
+                raise RuntimeError(f"Dedup index of {self.table} still modified concurrently after "
+                                   f"{DEDUP_WRITE_ATTEMPTS} attempts")
+            for key in expired:
+                self.minio_client.remove_object(self.bucket, key)
+        self._pending = None
+        logging.info(f"Added {len(new_keys)} keys to the dedup index of {self.table} "
+                     f"({self.metadata['count']} keys)")
+        return len(new_keys)
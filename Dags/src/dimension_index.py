@@ -0,0 +1,232 @@
+import os
+import json
+import fcntl
+import logging
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import polars as pl
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from src.layout import list_table_objects
+from src.parquet_reader import read_parquet_object
+
+# Local directory holding the index files, shared by the worker processes of a host
+DIMENSION_INDEX_DIR = os.environ.get("SANTE_DIMENSION_INDEX_DIR", "/tmp/sante_dimension_index")
+# Id returned for natural keys absent from the dimension
+MISSING_ID = -1
+# Natural key -> surrogate id index of each dimension, for enrichment with lookup_ids
+NATURAL_KEY_INDEXES = {
+    'dim_patient': ('numero_securite_sociale', 'patient_id'),
+    'dim_medecin': ('numero_rpps', 'medecin_id'),
+    'dim_diagnostic': ('code_cim10', 'diagnostic_id'),
+    'dim_temps': ('date', 'temps_id'),
+}
+
+_HASH_SEED = 0
+_open_indexes = {}
+_open_indexes_guard = threading.Lock()
+
+
+def index_path(dimension_table: str, natural_key: str) -> str:
+    return os.path.join(DIMENSION_INDEX_DIR, f"{dimension_table}.{natural_key}.arrow")
+
+
+def _metadata_path(dimension_table: str, natural_key: str) -> str:
+    return os.path.join(DIMENSION_INDEX_DIR, f"{dimension_table}.{natural_key}.json")
+
+
+def _normalize_keys(keys: pl.Series) -> pl.Series:
+    # Timestamps are looked up by day: dim_temps is keyed by date
+    return keys.cast(pl.Date) if keys.dtype == pl.Datetime else keys
+
+
+def _is_exact(dtype) -> bool:
+    return dtype == pl.Date or dtype.is_integer()
+
+
+def lookup_codes(keys: pl.Series) -> np.ndarray:
+    """uint64 code of each natural key: the value itself for integers and dates, 64-bit hash otherwise.
+
+    Hashes depend on the Polars version; the version is stored with the index,
+    which is rebuilt when it changes.
+    """
+    keys = _normalize_keys(keys)
+    if _is_exact(keys.dtype):
+        # NULLs get a placeholder code; callers mask them out
+        return keys.to_physical().cast(pl.Int64).fill_null(0).to_numpy().view(np.uint64)
+    return keys.cast(pl.Utf8).hash(seed=_HASH_SEED).to_numpy()
+
+
+class DimensionIndex:
+    """Read-only, memory-mapped ``natural key -> id`` index of one dimension.
+
+    The Arrow file is mapped, not read: the worker processes of a host share
+    its pages through the OS cache. Codes are sorted, so a batch is resolved
+    with one ``searchsorted``; hashed keys are then compared with the stored
+    keys, so a hash collision can never return a wrong id.
+    """
+
+    def __init__(self, dimension_table: str, natural_key: str):
+        self.dimension_table = dimension_table
+        self.natural_key = natural_key
+        self.path = index_path(dimension_table, natural_key)
+        self._stat = os.stat(self.path)
+        with pa.memory_map(self.path, 'r') as source:
+            table = pa.ipc.open_file(source).read_all()
+        self.codes = table.column('code').to_numpy()
+        self.ids = table.column('id').to_numpy()
+        self.keys = table.column('key').combine_chunks()
+        self.exact = pa.types.is_date(self.keys.type) or pa.types.is_integer(self.keys.type)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def is_stale(self) -> bool:
+        stat = os.stat(self.path)
+        return (stat.st_ino, stat.st_mtime_ns) != (self._stat.st_ino, self._stat.st_mtime_ns)
+
+    def _align(self, keys: pl.Series) -> pl.Series:
+        """Cast ``keys`` to the stored key type when one side is coded exactly and the other hashed."""
+        if _is_exact(keys.dtype) == self.exact:
+            return keys
+        return keys.cast(pl.from_arrow(self.keys.slice(0, 0)).dtype, strict=False)
+
+    def lookup(self, keys) -> np.ndarray:
+        """Ids (int64) of the natural ``keys``, ``MISSING_ID`` where a key is unknown or NULL."""
+        keys = _normalize_keys(keys if isinstance(keys, pl.Series) else pl.Series(keys))
+        result = np.full(len(keys), MISSING_ID, dtype=np.int64)
+        if len(self.codes) == 0 or len(keys) == 0:
+            return result
+        keys = self._align(keys)
+        codes = lookup_codes(keys)
+        # Probing in sorted order keeps the binary searches cache-friendly on large batches
+        order = np.argsort(codes)
+        positions = np.empty(len(codes), dtype=np.int64)
+        positions[order] = np.minimum(np.searchsorted(self.codes, codes[order]), len(self.codes) - 1)
+        found = (self.codes[positions] == codes) & keys.is_not_null().to_numpy()
+        if not self.exact and found.any():
+            matched = np.flatnonzero(found)
+            stored = self.keys.take(pa.array(positions[matched]))
+            same = pc.equal(stored, keys.cast(pl.Utf8).to_arrow().take(pa.array(matched)))
+            found[matched[~same.to_numpy(zero_copy_only=False)]] = False
+        result[found] = self.ids[positions[found]]
+        return result
+
+    def contains(self, keys: pl.Series) -> np.ndarray:
+        """Whether each key is in the dimension (NULL: False), as a hash membership test.
+
+        Much faster than :meth:`lookup` on large batches when only existence matters.
+        """
+        keys = self._align(_normalize_keys(keys))
+        if len(self.ids) == 0:
+            return np.zeros(len(keys), dtype=bool)
+        stored = pl.from_arrow(self.keys)
+        if self.exact:
+            keys, stored = keys.to_physical().cast(pl.Int64), stored.to_physical().cast(pl.Int64)
+        else:
+            keys, stored = keys.cast(pl.Utf8), stored.cast(pl.Utf8)
+        return keys.is_in(stored.implode()).fill_null(False).to_numpy()
+
+
+def open_index(dimension_table: str, natural_key: str) -> DimensionIndex:
+    """Per-process handle on the index of ``dimension_table`` by ``natural_key``, remapped after a refresh."""
+    with _open_indexes_guard:
+        index = _open_indexes.get((dimension_table, natural_key))
+        if index is None or index.is_stale():
+            index = DimensionIndex(dimension_table, natural_key)
+            _open_indexes[(dimension_table, natural_key)] = index
+        return index
+
+
+def lookup_ids(dimension_table: str, natural_key: str, keys) -> np.ndarray:
+    """Batched ``natural key -> id`` lookup on the current index; ``MISSING_ID`` where unknown."""
+    return open_index(dimension_table, natural_key).lookup(keys)
+
+
+def contains_keys(dimension_table: str, natural_key: str, keys: pl.Series) -> np.ndarray:
+    """Batched existence test of ``keys`` in the current index."""
+    return open_index(dimension_table, natural_key).contains(keys)
+
+
+def _read_metadata(dimension_table: str, natural_key: str) -> dict:
+    try:
+        with open(_metadata_path(dimension_table, natural_key)) as metadata:
+            return json.load(metadata)
+    except (OSError, ValueError):
+        return {}
+
+
+@contextmanager
+def _exclusive(dimension_table: str, natural_key: str):
+    """Serialize the refreshes of one index across the processes of the host."""
+    with open(os.path.join(DIMENSION_INDEX_DIR, f"{dimension_table}.{natural_key}.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _write_index(dimension_table: str, natural_key: str, entries: pl.DataFrame, metadata: dict):
+    """Atomically replace the index files; processes still mapping the old file keep a valid view."""
+    table = entries.select(['code', 'id', 'key']).to_arrow()
+    path = index_path(dimension_table, natural_key)
+    with pa.OSFile(f"{path}.tmp", 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(f"{path}.tmp", path)
+    metadata_path = _metadata_path(dimension_table, natural_key)
+    with open(f"{metadata_path}.tmp", "w") as output:
+        json.dump(metadata, output)
+    os.replace(f"{metadata_path}.tmp", metadata_path)
+
+
+def refresh_index(minio_client, bucket: str, dimension_table: str, natural_key: str, id_column: str) -> dict:
+    """Bring the ``natural_key -> id_column`` index of ``dimension_table`` up to date with its clean objects.
+
+    The clean objects are listed from the bucket; only those added or rewritten
+    (new ETag) since the last refresh are downloaded, projected on the natural key and the id; their
+    rows replace the indexed ones with the same natural key. A change of
+    Polars version (hash function) triggers a full rebuild.
+    """
+    os.makedirs(DIMENSION_INDEX_DIR, exist_ok=True)
+    with _exclusive(dimension_table, natural_key):
+        metadata = _read_metadata(dimension_table, natural_key)
+        rebuild = (metadata.get('polars') != pl.__version__
+                   or not os.path.exists(index_path(dimension_table, natural_key)))
+        applied = {} if rebuild else metadata.get('objects', {})
+
+        current = list_table_objects(minio_client, bucket, dimension_table, suffix="_clean")
+        changed = [key for key in current if applied.get(key) != current[key]]
+        if not changed and not rebuild:
+            return {'dimension': dimension_table, 'natural_key': natural_key,
+                    'objects_read': 0, 'keys': metadata.get('keys', 0)}
+
+        frames = []
+        if not rebuild:
+            existing = DimensionIndex(dimension_table, natural_key)
+            frames.append(pl.DataFrame({'key': pl.from_arrow(existing.keys), 'id': existing.ids}))
+        for key in changed:
+            df, _ = read_parquet_object(minio_client, bucket, key,
+                                        columns=list(dict.fromkeys([natural_key, id_column])))
+            frames.append(df.select([pl.col(natural_key).alias('key'), pl.col(id_column).cast(pl.Int64).alias('id')])
+                          .drop_nulls('key'))
+        entries = (pl.concat(frames, how="vertical_relaxed") if frames
+                   else pl.DataFrame({'key': [], 'id': []}, schema={'key': pl.Utf8, 'id': pl.Int64}))
+        # Later objects win: a natural key re-delivered with another id points to the latest one
+        entries = entries.unique(subset=['key'], keep='last', maintain_order=True)
+        entries = entries.with_columns(pl.Series('code', lookup_codes(entries['key']), dtype=pl.UInt64)).sort('code')
+
+        collisions = entries.filter(pl.col('code').is_duplicated()).height
+        if collisions:
+            logging.warning(f"{dimension_table}.{natural_key}: {collisions} natural keys share a 64-bit hash; "
+                            f"only the first of each is resolvable")
+        _write_index(dimension_table, natural_key, entries, {
+            'polars': pl.__version__, 'natural_key': natural_key, 'id_column': id_column,
+            'keys': len(entries), 'objects': current,
+        })
+    logging.info(f"Refreshed {dimension_table}.{natural_key} index: {len(changed)} objects read, {len(entries)} keys")
+    return {'dimension': dimension_table, 'natural_key': natural_key,
+            'objects_read': len(changed), 'keys': len(entries)}
@@ -0,0 +1,58 @@
+import os
+
+import polars as pl
+import pyarrow.parquet as pq
+
+# Named Parquet encodings; see benchmarks/bench_parquet_profiles.py for the measurements
+PARQUET_PROFILES = {
+    # Raw files are written once and read back once by the cleaning step
+    'fast-write': {
+        'compression': 'lz4',
+        'compression_level': None,
+        'row_group_size': 128_000,
+        'use_dictionary': False,
+        'write_statistics': False,
+    },
+    'balanced': {
+        'compression': 'zstd',
+        'compression_level': 3,
+        'row_group_size': 128_000,
+        'use_dictionary': True,
+        'write_statistics': True,
+    },
+    # Aggregates are small and read by every dashboard: smaller row groups prune better
+    'read-optimized': {
+        'compression': 'zstd',
+        'compression_level': 9,
+        'row_group_size': 32_000,
+        'use_dictionary': True,
+        'write_statistics': True,
+    },
+}
+
+STAGE_PROFILES = {
+    'raw': os.environ.get("SANTE_PARQUET_PROFILE_RAW", "fast-write"),
+    'clean': os.environ.get("SANTE_PARQUET_PROFILE_CLEAN", "balanced"),
+    'aggregated': os.environ.get("SANTE_PARQUET_PROFILE_AGGREGATED", "read-optimized"),
+}
+
+
+def parquet_options(profile: str, **overrides) -> dict:
+    """pyarrow writer options of ``profile`` (a stage name or a profile name)."""
+    options = dict(PARQUET_PROFILES[STAGE_PROFILES.get(profile, profile)])
+    options.update(overrides)
+    return options
+
+
+def write_parquet(df: pl.DataFrame, sink, profile: str, **overrides):
+    """Write ``df`` to ``sink`` with the encoding of ``profile``."""
+    options = parquet_options(profile, **overrides)
+    row_group_size = options.pop('row_group_size')
+    pq.write_table(df.to_arrow(), sink, row_group_size=row_group_size, **options)
+
+
+def parquet_writer(sink, schema, profile: str, **overrides) -> pq.ParquetWriter:
+    """Incremental writer with the encoding of ``profile``; row groups are sized by the caller."""
+    options = parquet_options(profile, **overrides)
+    options.pop('row_group_size')
+    return pq.ParquetWriter(sink, schema, **options)
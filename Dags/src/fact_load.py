@@ -0,0 +1,204 @@
+import logging
+import time
+from datetime import date
+
+import polars as pl
+
+from src.cleaning_rules import CLEANING_RULES
+from src.dimension_index import MISSING_ID, NATURAL_KEY_INDEXES, contains_keys, lookup_ids, refresh_index
+from src.warehouse import COPY_BATCH_SIZE, copy_dataframe
+
+# How each clean fact is loaded into the warehouse.
+#   date        fact date column; the target table is range-partitioned on it by month
+#   lookups     surrogate key column -> (dimension table, natural key column of the dimension,
+#               fact column holding the natural key), translated through the dimension index
+#   references  key column the sources already share with the warehouse -> its dimension
+#               table; only checked to exist (DimensionIndex.contains), loaded as is
+FACT_LOADS = {
+    'fact_consultation': {
+        'date': 'date_consultation',
+        'lookups': {'temps_id': ('dim_temps', 'date', 'date_consultation')},
+        'references': {'patient_id': 'dim_patient', 'medecin_id': 'dim_medecin',
+                       'etablissement_id': 'dim_etablissement', 'diagnostic_id': 'dim_diagnostic'},
+    },
+    'fact_traitement': {
+        'date': 'date_traitement',
+        'lookups': {'temps_id': ('dim_temps', 'date', 'date_traitement')},
+        'references': {'patient_id': 'dim_patient', 'medecin_id': 'dim_medecin',
+                       'medicament_id': 'dim_medicament', 'diagnostic_id': 'dim_diagnostic'},
+    },
+    'fact_analyse': {
+        'date': 'date_analyse',
+        'lookups': {'temps_id': ('dim_temps', 'date', 'date_analyse')},
+        'references': {'patient_id': 'dim_patient', 'etablissement_id': 'dim_etablissement'},
+    },
+    'fact_occupation_etablissement': {
+        'date': 'date_occupation',
+        'lookups': {'temps_id': ('dim_temps', 'date', 'date_occupation')},
+        'references': {'etablissement_id': 'dim_etablissement'},
+    },
+}
+
+_POLARS_TO_PG = {
+    pl.Int8: "SMALLINT", pl.Int16: "SMALLINT", pl.Int32: "INTEGER", pl.Int64: "BIGINT",
+    pl.Float32: "REAL", pl.Float64: "DOUBLE PRECISION", pl.Boolean: "BOOLEAN",
+    pl.Date: "DATE", pl.Datetime: "TIMESTAMP", pl.Utf8: "TEXT", pl.Decimal: "NUMERIC",
+}
+
+def lookup_indexes(fact_tables=None) -> list:
+    """``(dimension table, natural key, id column)`` of every index ``fact_tables`` (default: all) need.
+
+    The lookups, the references (indexed on themselves, for ``contains``) and
+    the natural key indexes of the referenced dimensions (src.dimension_index.NATURAL_KEY_INDEXES).
+    """
+    fact_tables = FACT_LOADS if fact_tables is None else fact_tables
+    indexes = set()
+    for fact_table in fact_tables:
+        load = FACT_LOADS[fact_table]
+        indexes.update((dimension_table, natural_key, surrogate)
+                       for surrogate, (dimension_table, natural_key, _) in load['lookups'].items())
+        indexes.update((dimension_table, column, column) for column, dimension_table in load['references'].items())
+        indexes.update((dimension_table, *NATURAL_KEY_INDEXES[dimension_table])
+                       for dimension_table in load['references'].values() if dimension_table in NATURAL_KEY_INDEXES)
+    return sorted(indexes)
+
+
+def refresh_lookup_indexes(minio_client, bucket: str, fact_tables=None) -> list:
+    """Bring the local dimension indexes (src.dimension_index) used by ``fact_tables`` up to date.
+
+    Called on the host about to resolve or check keys: only the clean objects
+    changed since that host's last refresh are downloaded.
+    """
+    return [refresh_index(minio_client, bucket, dimension_table, natural_key, id_column)
+            for dimension_table, natural_key, id_column in lookup_indexes(fact_tables)]
+
+
+def resolve_surrogate_keys(fact_table: str, df: pl.DataFrame):
+    """Replace the surrogate keys of ``df`` by the warehouse ones, looked up in the dimension indexes.
+
+    The indexes must have been refreshed (``refresh_lookup_indexes``). Rows
+    whose natural key is not found in a dimension, or whose shared key is not
+    in its dimension, are dropped (a key that is NULL in the fact and nullable
+    stays NULL). Returns the resolved frame and the number of rows dropped per
+    surrogate key.
+    """
+    nullable = set(CLEANING_RULES.get(fact_table, {}).get('nullable', []))
+    unresolved = {}
+    for surrogate, (dimension_table, natural_key, fact_column) in FACT_LOADS[fact_table]['lookups'].items():
+        ids = lookup_ids(dimension_table, natural_key, df[fact_column])
+        df = df.with_columns(pl.Series('_resolved', ids))
+        missing = pl.col('_resolved') == MISSING_ID
+        if surrogate in nullable:
+            missing = missing & pl.col(fact_column).is_not_null()
+        unresolved[surrogate] = df.select(missing.sum()).item()
+        resolved = pl.when(pl.col('_resolved') != MISSING_ID).then(pl.col('_resolved'))
+        # Clean facts usually lack the surrogate (temps_id): it is then added, as a BIGINT
+        dtype = df.schema[surrogate] if surrogate in df.columns else pl.Int64
+        df = df.filter(~missing).with_columns([resolved.cast(dtype).alias(surrogate)]).drop('_resolved')
+    for column, dimension_table in FACT_LOADS[fact_table]['references'].items():
+        missing = ~pl.Series(contains_keys(dimension_table, column, df[column]))
+        if column in nullable:
+            missing = missing & df[column].is_not_null()
+        unresolved[column] = int(missing.sum())
+        df = df.filter(~missing)
+    return df, {surrogate: count for surrogate, count in unresolved.items() if count}
+
+
+def _relation_kind(cursor, table: str):
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def ensure_partitioned_fact_table(cursor, fact_table: str, df: pl.DataFrame):
+    """Make ``fact_table`` a table range-partitioned by month on its date column.
+
+    A missing table is created from the frame's schema. An existing plain
+    table is migrated: renamed aside, recreated partitioned with the same
+    columns, its rows copied into the monthly partitions (one row per key, as
+    the primary key then enforces), and dropped. The caller's transaction
+    makes the migration all or nothing.
+    """
+    date_column = FACT_LOADS[fact_table]['date']
+    primary_key = CLEANING_RULES[fact_table]['dedup_keys'] + [date_column]
+    kind = _relation_kind(cursor, fact_table)
+    if kind == 'p':
+        return
+
+    if kind is None:
+        columns = ', '.join(f"{name} {_POLARS_TO_PG.get(dtype.base_type(), 'TEXT')}"
+                            for name, dtype in df.schema.items())
+        cursor.execute(f"CREATE TABLE {fact_table} ({columns}) PARTITION BY RANGE ({date_column})")
+    else:
+        old = f"{fact_table}_unpartitioned"
+        key_columns = ', '.join(primary_key)
+        cursor.execute(f"SELECT count(*) FROM {fact_table} WHERE "
+                       + " OR ".join(f"{column} IS NULL" for column in primary_key))
+        nb_null_keys = cursor.fetchone()[0]
+        if nb_null_keys:
+            raise ValueError(f"Cannot partition {fact_table}: {nb_null_keys} rows have a NULL in "
+                             f"({key_columns}), which the partitioned table's primary key forbids")
+        cursor.execute(f"ALTER TABLE {fact_table} RENAME TO {old}")
+        cursor.execute(f"CREATE TABLE {fact_table} (LIKE {old} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                       f"PARTITION BY RANGE ({date_column})")
+        cursor.execute(f"SELECT DISTINCT date_trunc('month', {date_column})::date FROM {old}")
+        ensure_month_partitions(cursor, fact_table, [row[0] for row in cursor.fetchall()])
+        cursor.execute(f"INSERT INTO {fact_table} SELECT DISTINCT ON ({key_columns}) * FROM {old}")
+        logging.info(f"Migrated {cursor.rowcount} rows of {fact_table} into monthly partitions")
+        # Dropped before the primary key is added: its index would otherwise clash with the old one's name
+        cursor.execute(f"DROP TABLE {old}")
+    cursor.execute(f"ALTER TABLE {fact_table} ADD PRIMARY KEY ({', '.join(primary_key)})")
+    logging.info(f"Created {fact_table} partitioned by month of {date_column}")
+
+
+def month_partition(fact_table: str, day) -> str:
+    return f"{fact_table}_y{day.year}m{day.month:02d}"
+
+
+def ensure_month_partitions(cursor, fact_table: str, days):
+    """Create the monthly partitions covering ``days``."""
+    months = sorted({(day.year, day.month) for day in days})
+    for year, month in months:
+        first_day = date(year, month, 1)
+        next_month = date(year + month // 12, month % 12 + 1, 1)
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {month_partition(fact_table, first_day)} "
+                       f"PARTITION OF {fact_table} FOR VALUES FROM (%s) TO (%s)", (first_day, next_month))
+    return len(months)
+
+
+def load_fact(connection, fact_table: str, df: pl.DataFrame, batch_size: int = COPY_BATCH_SIZE) -> dict:
+    """Resolve the surrogate keys of a clean fact frame and load it into its partitioned table.
+
+    The dimension indexes must be up to date (``refresh_lookup_indexes``).
+
+    Rows are COPY'd into a staging table then inserted with ``ON CONFLICT DO
+    NOTHING``, so replaying a day does not duplicate facts. The caller owns the
+    transaction.
+    """
+    start = time.perf_counter()
+    df, unresolved = resolve_surrogate_keys(fact_table, df)
+    counts = {'rows_loaded': 0, 'rows_skipped': 0, 'rows_unresolved': sum(unresolved.values())}
+    if unresolved:
+        logging.warning(f"{fact_table}: dropped rows with unknown keys {unresolved}")
+    if df.is_empty():
+        return counts
+
+    date_column = FACT_LOADS[fact_table]['date']
+    columns = ','.join(df.columns)
+    stage = f"{fact_table}_stage"
+    with connection.cursor() as cursor:
+        ensure_partitioned_fact_table(cursor, fact_table, df)
+        for surrogate in FACT_LOADS[fact_table]['lookups']:
+            # Tables created before the surrogate was resolved lack its column
+            cursor.execute(f"ALTER TABLE {fact_table} ADD COLUMN IF NOT EXISTS {surrogate} "
+                           f"{_POLARS_TO_PG.get(df.schema[surrogate].base_type(), 'BIGINT')}")
+        counts['partitions'] = ensure_month_partitions(cursor, fact_table, df[date_column].unique().to_list())
+        cursor.execute(f"DROP TABLE IF EXISTS {stage}")
+        cursor.execute(f"CREATE TEMP TABLE {stage} (LIKE {fact_table} INCLUDING DEFAULTS) ON COMMIT DROP")
+        copy_dataframe(cursor, df, stage, batch_size=batch_size)
+        cursor.execute(f"INSERT INTO {fact_table} ({columns}) SELECT {columns} FROM {stage} ON CONFLICT DO NOTHING")
+        counts['rows_loaded'] = cursor.rowcount
+    counts['rows_skipped'] = len(df) - counts['rows_loaded']
+    logging.info(f"Loaded {counts['rows_loaded']} rows into {fact_table} in {time.perf_counter() - start:.2f}s "
+                 f"({counts['rows_skipped']} already present)")
+    return counts
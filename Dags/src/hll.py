@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+
+# 2^HLL_PRECISION registers of one byte; standard error ~ 1.04 / sqrt(2^p) (1.6% for p=12)
+HLL_PRECISION = int(os.environ.get("SANTE_HLL_PRECISION", "12"))
+
+_UINT64 = np.uint64
+
+
+def hash64(values) -> np.ndarray:
+    """splitmix64 of integer ``values``: stable across processes and library versions."""
+    x = np.asarray(values).astype(np.int64).view(_UINT64)
+    with np.errstate(over='ignore'):
+        x = x + _UINT64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> _UINT64(30))) * _UINT64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> _UINT64(27))) * _UINT64(0x94D049BB133111EB)
+    return x ^ (x >> _UINT64(31))
+
+
+def _leading_zeros(x: np.ndarray) -> np.ndarray:
+    count = np.zeros(x.shape, dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        empty = x < (_UINT64(1) << _UINT64(64 - shift))
+        count += np.where(empty, shift, 0).astype(np.uint8)
+        x = np.where(empty, x << _UINT64(shift), x)
+    return count + (x == 0).astype(np.uint8)
+
+
+def hll_registers(values, precision: int = HLL_PRECISION) -> np.ndarray:
+    """HyperLogLog registers of the integer ``values`` (NULLs must be removed beforehand)."""
+    registers = np.zeros(1 << precision, dtype=np.uint8)
+    hashes = hash64(values)
+    if len(hashes) == 0:
+        return registers
+    index = (hashes >> _UINT64(64 - precision)).astype(np.int64)
+    # Rank of the first 1 bit in the remaining 64 - p bits (capped when they are all 0)
+    rank = np.minimum(_leading_zeros(hashes << _UINT64(precision)) + 1, 64 - precision + 1).astype(np.uint8)
+    np.maximum.at(registers, index, rank)
+    return registers
+
+
+def hll_merge(register_sets) -> np.ndarray:
+    """Union of several sketches: register-wise maximum."""
+    return np.maximum.reduce([np.asarray(registers, dtype=np.uint8) for registers in register_sets])
+
+
+def hll_estimate(registers) -> float:
+    registers = np.asarray(registers, dtype=np.uint8)
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.power(2.0, -registers.astype(np.float64)))
+    zeros = np.count_nonzero(registers == 0)
+    if estimate <= 2.5 * m and zeros:
+        # Small range correction: linear counting
+        return m * np.log(m / zeros)
+    return float(estimate)
@@ -0,0 +1,184 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# StatsD endpoint: the statsd-exporter of docker-compose.yml, turned into Prometheus
+# metrics by statsd_mapping.yml (sante.stage.<stage>.<table>.<metric>)
+STATSD_HOST = os.environ.get("SANTE_STATSD_HOST", "statsd-exporter")
+STATSD_PORT = int(os.environ.get("SANTE_STATSD_PORT", "9125"))
+STATSD_PREFIX = os.environ.get("SANTE_STATSD_PREFIX", "sante")
+# Seconds between two RSS samples while a stage runs
+RSS_SAMPLE_INTERVAL = float(os.environ.get("SANTE_RSS_SAMPLE_INTERVAL", "0.05"))
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_current_stage = contextvars.ContextVar("sante_stage", default=None)
+_lock = threading.Lock()
+_settings = {"host": STATSD_HOST, "port": STATSD_PORT, "prefix": STATSD_PREFIX}
+_client = None
+_client_pid = None
+_listeners = []
+
+
+def configure_statsd(host=None, port=None, prefix=None):
+    """Override the StatsD endpoint (e.g. with the [metrics] section of airflow.cfg)."""
+    global _client
+    with _lock:
+        _settings.update({key: value for key, value in
+                          {"host": host, "port": int(port) if port else None, "prefix": prefix}.items() if value})
+        _client = None
+
+
+def get_statsd():
+    """Process-wide StatsD client, ``None`` (metrics disabled) when it cannot be created."""
+    global _client, _client_pid
+    with _lock:
+        if _client is None or _client_pid != os.getpid():
+            try:
+                from statsd import StatsClient
+                _client = StatsClient(_settings["host"], _settings["port"], prefix=_settings["prefix"])
+            except Exception as e:
+                logging.warning(f"StatsD metrics disabled: {e}")
+                _client = False
+            _client_pid = os.getpid()
+        return _client or None
+
+
+def add_listener(callback):
+    """Also hand every finished :class:`StageMetrics` to ``callback`` (e.g. the benchmarks)."""
+    _listeners.append(callback)
+
+
+def remove_listener(callback):
+    _listeners.remove(callback)
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return 0
+
+
+class StageMetrics:
+    """Counters and timings of one stage of one table, sent to StatsD when the stage ends."""
+
+    def __init__(self, stage: str, table: str):
+        self.stage = stage
+        self.table = table
+        self.counters = {"rows": 0, "bytes_in": 0, "bytes_out": 0}
+        self.timings = {"query": 0.0, "serialize": 0.0}
+        self.peak_rss = 0
+        self.seconds = 0.0
+        self.failed = False
+        self._counters_lock = threading.Lock()
+
+    def add(self, name: str, value):
+        with self._counters_lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, name: str):
+        """Add the time spent in the block to the ``name`` timing (``query``, ``serialize``)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._counters_lock:
+                self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def _sample_rss(self, stop: threading.Event):
+        while not stop.wait(RSS_SAMPLE_INTERVAL):
+            self.peak_rss = max(self.peak_rss, rss_bytes())
+
+    def emit(self):
+        client = get_statsd()
+        if client is None:
+            return
+        name = f"stage.{self.stage}.{self.table}"
+        with client.pipeline() as pipe:
+            for counter, value in self.counters.items():
+                if value:
+                    pipe.incr(f"{name}.{counter}", value)
+            for timing, seconds in self.timings.items():
+                if seconds:
+                    pipe.timing(f"{name}.{timing}_time", seconds * 1000)
+            pipe.timing(f"{name}.duration", self.seconds * 1000)
+            pipe.gauge(f"{name}.peak_rss_bytes", self.peak_rss)
+            pipe.incr(f"{name}.{'failures' if self.failed else 'successes'}")
+
+
+@contextmanager
+def stage(stage_name: str, table: str):
+    """Measure one pipeline stage (extract, clean, aggregate, load) of ``table``.
+
+    The yielded :class:`StageMetrics` receives the row count from the caller;
+    bytes transferred and serialization time are added by the storage helpers
+    (src.layout) running inside the block, including in threads started with
+    :func:`propagate`. Peak RSS is the process' RSS, sampled while the stage runs.
+    """
+    metrics = StageMetrics(stage_name, table)
+    token = _current_stage.set(metrics)
+    stop = threading.Event()
+    sampler = threading.Thread(target=metrics._sample_rss, args=(stop,), daemon=True)
+    metrics.peak_rss = rss_bytes()
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        yield metrics
+    except Exception:
+        metrics.failed = True
+        raise
+    finally:
+        metrics.seconds = time.perf_counter() - start
+        stop.set()
+        sampler.join()
+        metrics.peak_rss = max(metrics.peak_rss, rss_bytes())
+        _current_stage.reset(token)
+        logging.info(f"{stage_name} {table}: {metrics.seconds:.2f}s, {metrics.counters}, "
+                     + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in metrics.timings.items())
+                     + f", peak RSS {metrics.peak_rss / 2 ** 20:.0f} MiB")
+        try:
+            metrics.emit()
+        except Exception as e:
+            logging.warning(f"Could not send {stage_name} metrics of {table}: {e}")
+        for listener in list(_listeners):
+            listener(metrics)
+
+
+def record(name: str, value):
+    """Add ``value`` to a counter of the running stage, if any."""
+    metrics = _current_stage.get()
+    if metrics is not None:
+        metrics.add(name, value)
+
+
+@contextmanager
+def timed(name: str):
+    """Time the block into the running stage, if any."""
+    metrics = _current_stage.get()
+    if metrics is None:
+        yield
+    else:
+        with metrics.timer(name):
+            yield
+
+
+def propagate(function):
+    """Bind ``function`` to the current stage, for work submitted to another thread."""
+    context = contextvars.copy_context()
+    # A context can only be entered by one thread at a time: each call runs in its own copy
+    return lambda *args, **kwargs: context.copy().run(function, *args, **kwargs)
+
+
+def record_dag_run(context):
+    """DAG ``on_success_callback`` / ``on_failure_callback``: count runs per DAG and state."""
+    client = get_statsd()
+    dag_run = context.get('dag_run')
+    if client is None or dag_run is None:
+        return
+    # Dots would split the StatsD name (e.g. sante_metrics_dag-v1.0.0)
+    client.incr(f"dag_runs.{dag_run.dag_id.replace('.', '_')}.{dag_run.state}")
@@ -0,0 +1,62 @@
+import logging
+
+import polars as pl
+
+from src.cleaning_rules import REJECT_COLUMN
+from src.dimension_index import contains_keys
+from src.fact_load import FACT_LOADS
+
+# Root of the quarantined rows in the clean bucket: quarantine/{fact}/year=.../{fact}_{day}_orphans.parquet
+QUARANTINE_PREFIX = "quarantine/"
+ORPHANS_SUFFIX = "_orphans"
+ORPHAN_RULE = "orphan"
+
+
+def fact_references(fact_table: str) -> list:
+    """``(fact column, dimension table, dimension column)`` of every key ``fact_table`` references.
+
+    Same references as the warehouse load (src.fact_load), so a fact validated
+    here has all its surrogate keys resolvable there.
+    """
+    load = FACT_LOADS[fact_table]
+    return ([(fact_column, dimension_table, dimension_column)
+             for dimension_table, dimension_column, fact_column in load['lookups'].values()]
+            + [(column, dimension_table, column) for column, dimension_table in load['references'].items()])
+
+
+def orphan_expression(fact_table: str, df: pl.DataFrame) -> pl.Expr:
+    """``orphan:<column>`` for every key of the row missing from its dimension (comma separated), NULL if none.
+
+    Keys are tested in one batch per column against the local dimension index
+    (src.dimension_index), which must have been refreshed. A NULL key is not an
+    orphan: NULLs are the cleaning rules' business.
+    """
+    reasons = []
+    for fact_column, dimension_table, column in fact_references(fact_table):
+        if fact_column not in df.schema:
+            logging.warning(f"{fact_table} has no {fact_column} column: reference to {dimension_table} not checked")
+            continue
+        known = pl.Series(f"_known_{fact_column}", contains_keys(dimension_table, column, df[fact_column]))
+        orphan = pl.col(fact_column).is_not_null() & ~pl.lit(known)
+        reasons.append(pl.when(orphan).then(pl.lit(f"{ORPHAN_RULE}:{fact_column}")))
+    if not reasons:
+        return pl.lit(None, dtype=pl.Utf8)
+    reason = pl.concat_str(reasons, separator=",", ignore_nulls=True)
+    return pl.when(reason != "").then(reason).otherwise(pl.lit(None, dtype=pl.Utf8))
+
+
+def split_orphans(fact_table: str, df: pl.DataFrame):
+    """Return ``(valid, orphans)``; ``orphans`` carries the reasons in ``_rejected_by``."""
+    checked = df.lazy().with_columns(orphan_expression(fact_table, df).alias(REJECT_COLUMN))
+    valid = checked.filter(pl.col(REJECT_COLUMN).is_null()).drop(REJECT_COLUMN)
+    orphans = checked.filter(pl.col(REJECT_COLUMN).is_not_null())
+    return tuple(pl.collect_all([valid, orphans]))
+
+
+def count_reasons(orphans: pl.DataFrame) -> dict:
+    """Orphan rows per missing reference (a row missing several is counted under each)."""
+    if orphans.is_empty():
+        return {}
+    counts = (orphans.select(pl.col(REJECT_COLUMN).str.split(",").explode())
+              .group_by(REJECT_COLUMN).agg(pl.len().alias("rows")))
+    return dict(zip(counts[REJECT_COLUMN].to_list(), counts["rows"].to_list()))
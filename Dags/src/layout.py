@@ -0,0 +1,364 @@
+import io
+import os
+import re
+import json
+import time
+import random
+import logging
+import threading
+from calendar import monthrange
+from datetime import date, datetime, timedelta
+
+import polars as pl
+from minio.error import S3Error
+
+from src.encoding import write_parquet
+from src.instrumentation import record, timed
+from src.parquet_reader import read_parquet_object
+from src.resources import put_object_if
+
+MANIFEST_NAME = "_manifest.json"
+# Conditional manifest writes attempted before giving up when other writers keep winning
+MANIFEST_WRITE_ATTEMPTS = int(os.environ.get("SANTE_MANIFEST_WRITE_ATTEMPTS", "10"))
+# Rows per row group of the monthly files written by the compaction
+COMPACTION_ROW_GROUP_SIZE = int(os.environ.get("SANTE_COMPACTION_ROW_GROUP_SIZE", "250000"))
+# Day of origin of each row in a compacted file, so a single day can still be read back
+PARTITION_DATE_COLUMN = "_partition_date"
+
+_HIVE_KEY = re.compile(r"/year=(\d{4})/month=(\d{2})(?:/day=(\d{2}))?/")
+_LEGACY_KEY = re.compile(r"_(\d{4})-(\d{2})-(\d{2})[^/]*\.parquet$")
+# Micro-batches of src.cdc: one every few minutes, kept out of the manifests
+_CDC_KEY = re.compile(r"_cdc_[0-9A-F]{16}(_u[0-9a-f]{8})?\.parquet$")
+_manifest_locks = {}
+_manifest_locks_guard = threading.Lock()
+
+
+def _as_date(value) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def partition_path(table: str, day, monthly: bool = False) -> str:
+    day = _as_date(day)
+    path = f"{table}/year={day.year}/month={day.month:02d}"
+    return path if monthly else f"{path}/day={day.day:02d}"
+
+
+def object_key(table: str, day, suffix: str = "") -> str:
+    """``fact_analyse/year=2024/month=01/day=05/fact_analyse_2024-01-05{suffix}.parquet``"""
+    day = _as_date(day)
+    return f"{partition_path(table, day)}/{table}_{day.strftime('%Y-%m-%d')}{suffix}.parquet"
+
+
+def monthly_key(table: str, year: int, month: int, suffix: str = "") -> str:
+    return f"{table}/year={year}/month={month:02d}/{table}_{year}-{month:02d}{suffix}.parquet"
+
+
+def _manifest_lock(bucket: str, table: str) -> threading.Lock:
+    with _manifest_locks_guard:
+        return _manifest_locks.setdefault((bucket, table), threading.Lock())
+
+
+def _entry_from_key(key: str, size=None):
+    """Manifest entry deduced from an object key, for Hive-style and legacy flat keys."""
+    match = _HIVE_KEY.search(key)
+    if match:
+        year, month, day = int(match.group(1)), int(match.group(2)), match.group(3)
+        if day is None:
+            first_day, last_day = date(year, month, 1), date(year, month, monthrange(year, month)[1])
+        else:
+            first_day = last_day = date(year, month, int(day))
+    else:
+        match = _LEGACY_KEY.search(key)
+        if not match:
+            return None
+        first_day = last_day = date(*(int(part) for part in match.groups()))
+    return {'key': key, 'first_day': first_day.isoformat(), 'last_day': last_day.isoformat(),
+            'rows': None, 'bytes': size, 'compacted': first_day != last_day}
+
+
+def _list_entries(minio_client, bucket: str, prefix: str) -> list:
+    entries = []
+    for obj in minio_client.list_objects(bucket, prefix=prefix, recursive=True):
+        if obj.object_name.endswith(".parquet") and not _CDC_KEY.search(obj.object_name):
+            entry = _entry_from_key(obj.object_name, obj.size)
+            if entry:
+                entries.append(entry)
+    return entries
+
+
+def _fetch_manifest(minio_client, bucket: str, table: str):
+    """``(manifest, etag)`` of ``table``, ``(None, None)`` when it has no manifest yet."""
+    try:
+        response = minio_client.get_object(bucket, f"{table}/{MANIFEST_NAME}")
+    except S3Error as e:
+        if e.code != "NoSuchKey":
+            raise
+        return None, None
+    try:
+        return json.loads(response.read()), response.headers.get("ETag")
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def _write_manifest(minio_client, bucket: str, table: str, manifest: dict, etag=None) -> bool:
+    """Write ``manifest`` only if the stored one still has ``etag`` (``None``: only if there is none).
+
+    Returns False when another writer, possibly in another process, got there first.
+    """
+    manifest['updated_at'] = datetime.utcnow().isoformat()
+    payload = json.dumps(manifest, indent=1).encode()
+    return put_object_if(minio_client, bucket, f"{table}/{MANIFEST_NAME}", payload, etag,
+                         content_type='application/json')
+
+
+def _modify_manifest(minio_client, bucket: str, table: str, change) -> dict:
+    """Apply ``change(manifest)`` with an optimistic read-modify-write, retried on conflicts.
+
+    A missing manifest is first recreated from a listing (which also migrates legacy flat keys).
+    """
+    with _manifest_lock(bucket, table):
+        for attempt in range(MANIFEST_WRITE_ATTEMPTS):
+            manifest, etag = _fetch_manifest(minio_client, bucket, table)
+            if manifest is None:
+                manifest = {'table': table, 'files': _list_entries(minio_client, bucket, f"{table}/")}
+            change(manifest)
+            if _write_manifest(minio_client, bucket, table, manifest, etag):
+                return manifest
+            time.sleep(random.uniform(0, 0.05 * 2 ** min(attempt, 5)))
+    raise RuntimeError(f"Manifest of {bucket}/{table} still modified concurrently after "
+                       f"{MANIFEST_WRITE_ATTEMPTS} attempts")
+
+
+def rebuild_manifest(minio_client, bucket: str, table: str) -> dict:
+    """Recreate the manifest of ``table`` from a listing (also migrates legacy flat keys)."""
+    def relist(manifest):
+        manifest['files'] = _list_entries(minio_client, bucket, f"{table}/")
+
+    manifest = _modify_manifest(minio_client, bucket, table, relist)
+    logging.info(f"Rebuilt manifest of {bucket}/{table} with {len(manifest['files'])} files")
+    return manifest
+
+
+def read_manifest(minio_client, bucket: str, table: str) -> dict:
+    try:
+        manifest, _ = _fetch_manifest(minio_client, bucket, table)
+    except S3Error as e:
+        if e.code == "NoSuchBucket":
+            return {'table': table, 'files': []}
+        raise
+    if manifest is None:
+        return rebuild_manifest(minio_client, bucket, table)
+    return manifest
+
+
+def update_manifest(minio_client, bucket: str, table: str, added=(), removed=()):
+    """Add/replace ``added`` entries and drop the ``removed`` keys in one manifest write.
+
+    The write is conditional on the manifest read (ETag), so concurrent writers
+    from other tasks or DAGs retry instead of overwriting each other's changes.
+    """
+    added = list(added)
+    dropped = set(removed) | {entry['key'] for entry in added}
+
+    def apply(manifest):
+        manifest['files'] = [entry for entry in manifest['files'] if entry['key'] not in dropped] + added
+        manifest['files'].sort(key=lambda entry: (entry['first_day'], entry['key']))
+
+    _modify_manifest(minio_client, bucket, table, apply)
+
+
+def register_object(minio_client, bucket: str, table: str, key: str, first_day, last_day=None,
+                    rows=None, size=None):
+    first_day = _as_date(first_day)
+    last_day = _as_date(last_day) if last_day is not None else first_day
+    update_manifest(minio_client, bucket, table, added=[{
+        'key': key, 'first_day': first_day.isoformat(), 'last_day': last_day.isoformat(),
+        'rows': rows, 'bytes': size, 'compacted': first_day != last_day,
+    }])
+
+
+def put_parquet(minio_client, bucket: str, table: str, day, df: pl.DataFrame, suffix: str = "",
+                profile: str = "balanced", prefix: str = "", register: bool = True) -> str:
+    """Write ``df`` to its day partition, register it in the manifest and return its key.
+
+    ``profile`` is a stage (``raw``, ``clean``, ``aggregated``) or a profile name of src.encoding.
+    ``prefix`` (e.g. ``quarantine/``) stores the object and its manifest under another root of the bucket.
+    ``register=False`` leaves the manifest alone (CDC micro-batches).
+    """
+    buffer = io.BytesIO()
+    with timed('serialize'):
+        write_parquet(df, buffer, profile)
+    size = buffer.getbuffer().nbytes
+    record('bytes_out', size)
+    buffer.seek(0)
+    key = f"{prefix}{object_key(table, day, suffix)}"
+    minio_client.put_object(bucket, key, buffer, size, content_type='application/octet-stream')
+    if register:
+        register_object(minio_client, bucket, f"{prefix}{table}", key, day, rows=len(df), size=size)
+    return key
+
+
+def _months(start: date, end: date):
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def resolve_range(minio_client, bucket: str, table: str, start, end=None, suffix: str = "") -> list:
+    """Manifest entries of ``table`` overlapping ``[start, end]`` for the files named with ``suffix``.
+
+    Months with days the manifest does not cover are listed directly, so objects whose writer
+    died before registering them (or written by an older writer) are still found.
+    """
+    start = _as_date(start)
+    end = _as_date(end) if end is not None else start
+    manifest = read_manifest(minio_client, bucket, table)
+    entries = [entry for entry in manifest['files']
+               if entry['first_day'] <= end.isoformat() and entry['last_day'] >= start.isoformat()]
+
+    covered = set()
+    for entry in entries:
+        day = max(date.fromisoformat(entry['first_day']), start)
+        last_day = min(date.fromisoformat(entry['last_day']), end)
+        while day <= last_day:
+            covered.add(day)
+            day += timedelta(days=1)
+    known = {entry['key'] for entry in manifest['files']}
+    missing = []
+    for year, month in _months(start, end):
+        month_start = max(date(year, month, 1), start)
+        month_end = min(date(year, month, monthrange(year, month)[1]), end)
+        if (month_end - month_start).days + 1 > sum(month_start <= day <= month_end for day in covered):
+            prefix = f"{table}/year={year}/month={month:02d}/"
+            missing += [entry for entry in _list_entries(minio_client, bucket, prefix)
+                        if entry['key'] not in known
+                        and entry['first_day'] <= end.isoformat() and entry['last_day'] >= start.isoformat()]
+    if missing:
+        logging.info(f"{len(missing)} objects of {bucket}/{table} missing from the manifest, registering them")
+        update_manifest(minio_client, bucket, table, added=missing)
+        entries += missing
+
+    return [entry for entry in entries if _is_table_file(entry['key'], table, suffix)]
+
+
+def _is_table_file(key: str, table: str, suffix: str) -> bool:
+    """Whether ``key`` is a daily or monthly file of ``table`` named with ``suffix``.
+
+    Excludes e.g. the CDC micro-batches of the raw bucket; files stored under a
+    prefix (put_parquet) are named after the bare table.
+    """
+    file_name = rf"{re.escape(table.rsplit('/', 1)[-1])}_\d{{4}}-\d{{2}}(?:-\d{{2}})?{re.escape(suffix)}\.parquet"
+    return re.fullmatch(file_name, key.rsplit('/', 1)[-1]) is not None
+
+
+def list_table_objects(minio_client, bucket: str, table: str, suffix: str = "") -> dict:
+    """``{key: etag}`` of every daily and monthly file of ``table`` named with ``suffix``, listed from the bucket.
+
+    Unlike the manifest, the listing also returns the objects whose writer died
+    before registering them; the ETag changes whenever an object is rewritten.
+    """
+    return {obj.object_name: obj.etag
+            for obj in minio_client.list_objects(bucket, prefix=f"{table}/", recursive=True)
+            if _is_table_file(obj.object_name, table, suffix)}
+
+
+def table_extent(minio_client, bucket: str, table: str, suffix: str = ""):
+    """``(first day, last day)`` covered by the files of ``table`` named with ``suffix``, None if it has none."""
+    entries = [_entry_from_key(key) for key in list_table_objects(minio_client, bucket, table, suffix)]
+    entries = [entry for entry in entries if entry]
+    if not entries:
+        return None
+    return (date.fromisoformat(min(entry['first_day'] for entry in entries)),
+            date.fromisoformat(max(entry['last_day'] for entry in entries)))
+
+
+def _rewritten_days(entries) -> list:
+    """Days having a daily file alongside a monthly file covering them (retry, backfill, late day)."""
+    monthly = [entry for entry in entries if entry['compacted']]
+    return sorted({date.fromisoformat(entry['first_day']) for entry in entries if not entry['compacted']
+                   and any(m['first_day'] <= entry['first_day'] <= m['last_day'] for m in monthly)})
+
+
+def read_partitions(minio_client, bucket: str, table: str, start, end=None, suffix: str = "",
+                    columns=None, predicates=None, metrics=None):
+    """Read the rows of ``table`` stored for ``[start, end]``; ``None`` when nothing is stored.
+
+    ``columns`` and ``predicates`` are pushed down to the Parquet reader (see
+    :func:`src.parquet_reader.read_parquet_object`); the per-object transfer
+    metrics are appended to ``metrics`` when a list is given.
+    """
+    start = _as_date(start)
+    end = _as_date(end) if end is not None else start
+    entries = resolve_range(minio_client, bucket, table, start, end, suffix)
+    rewritten = _rewritten_days(entries)
+    frames = []
+    for entry in entries:
+        object_predicates = list(predicates or [])
+        object_columns = list(columns) if columns is not None else None
+        if entry['compacted']:
+            # Monthly files are sorted by day: the range prunes their row groups
+            object_predicates += [(PARTITION_DATE_COLUMN, '>=', start), (PARTITION_DATE_COLUMN, '<=', end)]
+            if object_columns is not None and rewritten:
+                object_columns.append(PARTITION_DATE_COLUMN)
+        df, object_metrics = read_parquet_object(minio_client, bucket, entry['key'], object_columns, object_predicates)
+        record('bytes_in', object_metrics['bytes_read'])
+        if metrics is not None:
+            metrics.append(object_metrics)
+        if PARTITION_DATE_COLUMN in df.columns:
+            if rewritten:
+                # Days written again after the compaction: their daily file supersedes the monthly rows
+                df = df.filter(~pl.col(PARTITION_DATE_COLUMN).is_in(rewritten))
+            df = df.drop(PARTITION_DATE_COLUMN)
+        frames.append(df)
+    if not frames:
+        return None
+    return frames[0] if len(frames) == 1 else pl.concat(frames, how="diagonal")
+
+
+def compact_month(minio_client, bucket: str, table: str, year: int, month: int, suffix: str = "",
+                  profile: str = "balanced", row_group_size: int = COMPACTION_ROW_GROUP_SIZE) -> dict:
+    """Merge the daily files of ``table`` for one month into a single monthly file.
+
+    The monthly file is written and registered before the daily files are
+    deleted, so readers going through the manifest never miss rows. A
+    previously compacted file of the same month is merged again with any
+    late daily files, which replace its rows for their days.
+    """
+    first_day, last_day = date(year, month, 1), date(year, month, monthrange(year, month)[1])
+    entries = resolve_range(minio_client, bucket, table, first_day, last_day, suffix)
+    target = monthly_key(table, year, month, suffix)
+    daily = [entry for entry in entries if entry['key'] != target]
+    if not daily:
+        return {'table': table, 'files': 0, 'rows': 0}
+
+    rewritten = _rewritten_days(entries)
+    frames = []
+    for entry in entries:
+        df, _ = read_parquet_object(minio_client, bucket, entry['key'])
+        if PARTITION_DATE_COLUMN not in df.columns:
+            df = df.with_columns(pl.lit(date.fromisoformat(entry['first_day'])).alias(PARTITION_DATE_COLUMN))
+        elif rewritten:
+            # A late daily file replaces the rows the previous monthly file holds for its day
+            df = df.filter(~pl.col(PARTITION_DATE_COLUMN).is_in(rewritten))
+        frames.append(df)
+    merged = pl.concat(frames, how="diagonal").sort(PARTITION_DATE_COLUMN)
+
+    buffer = io.BytesIO()
+    # Statistics are always kept: daily reads prune the row groups on _partition_date
+    write_parquet(merged, buffer, profile, row_group_size=row_group_size, write_statistics=True)
+    size = buffer.getbuffer().nbytes
+    buffer.seek(0)
+    minio_client.put_object(bucket, target, buffer, size, content_type='application/octet-stream')
+
+    update_manifest(minio_client, bucket, table, added=[{
+        'key': target, 'first_day': first_day.isoformat(), 'last_day': last_day.isoformat(),
+        'rows': len(merged), 'bytes': size, 'compacted': True,
+    }], removed=[entry['key'] for entry in daily])
+    for entry in daily:
+        minio_client.remove_object(bucket, entry['key'])
+
+    logging.info(f"Compacted {len(daily)} files of {bucket}/{table} into {target} "
+                 f"({len(merged)} rows, {size} bytes)")
+    return {'table': table, 'files': len(daily), 'rows': len(merged), 'bytes': size}
@@ -0,0 +1,54 @@
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Tables processed at once by dimension_pipeline / fact_pipeline. Keep it at or
+# below SANTE_PG_POOL_MAX: each worker holds one pooled connection.
+PIPELINE_MAX_WORKERS = int(os.environ.get("SANTE_PIPELINE_WORKERS", "4"))
+
+
+def _run_one(table: str, worker, **kwargs) -> dict:
+    start = time.perf_counter()
+    try:
+        result = worker(table, **kwargs) or {}
+        status, error = "success", None
+    except Exception as e:
+        logging.exception(f"Processing of {table} failed")
+        result, status, error = {}, "failed", str(e)
+    return {"table": table, "status": status, "seconds": round(time.perf_counter() - start, 3),
+            "error": error, **result}
+
+
+def run_per_table(tables, worker, max_workers: int = PIPELINE_MAX_WORKERS, **kwargs) -> list:
+    """Run ``worker(table, **kwargs)`` for every table on a bounded thread pool.
+
+    The work is I/O bound (Postgres, MinIO), so threads are enough. A failing
+    table does not stop the others; its error is reported in its summary entry.
+    Entries keep the order of ``tables``.
+    """
+    max_workers = max(1, min(max_workers, len(tables)))
+    if max_workers == 1:
+        return [_run_one(table, worker, **kwargs) for table in tables]
+
+    summary = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sante-table") as executor:
+        futures = {executor.submit(_run_one, table, worker, **kwargs): table for table in tables}
+        for future in as_completed(futures):
+            summary[futures[future]] = future.result()
+    return [summary[table] for table in tables]
+
+
+def log_summary(pipeline: str, summary: list):
+    logging.info(f"{pipeline} summary:")
+    for entry in summary:
+        details = ", ".join(f"{key}={value}" for key, value in entry.items()
+                            if key not in ("table", "status", "error"))
+        logging.info(f"  {entry['table']:<32} {entry['status']:<8} {details}"
+                     + (f", error={entry['error']}" if entry["error"] else ""))
+
+
+def raise_for_failures(pipeline: str, summary: list):
+    failed = [entry["table"] for entry in summary if entry["status"] != "success"]
+    if failed:
+        raise RuntimeError(f"{pipeline} failed for tables: {', '.join(failed)}")
@@ -0,0 +1,164 @@
+import io
+import os
+import logging
+import operator
+
+import polars as pl
+import pyarrow.parquet as pq
+
+# Bytes fetched from the end of the object in the first request; covers the
+# footer (metadata + 8 bytes) of all our files so opening costs a single GET
+FOOTER_PREFETCH_SIZE = int(os.environ.get("SANTE_FOOTER_PREFETCH_SIZE", str(64 * 1024)))
+
+_COMPARISONS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+class MinioRangeFile(io.RawIOBase):
+    """Read-only file over a MinIO object where every read is a ranged GET.
+
+    The tail of the object is fetched once when the file is opened, so
+    pyarrow can parse the footer without extra round-trips. ``bytes_read``
+    and ``requests`` count what was actually transferred.
+    """
+
+    def __init__(self, minio_client, bucket: str, key: str, footer_prefetch: int = FOOTER_PREFETCH_SIZE):
+        super().__init__()
+        self.minio_client = minio_client
+        self.bucket = bucket
+        self.key = key
+        self.size = minio_client.stat_object(bucket, key).size
+        self.bytes_read = 0
+        self.requests = 0
+        self._position = 0
+        self._tail_offset = max(0, self.size - footer_prefetch)
+        self._tail = self._get(self._tail_offset, self.size - self._tail_offset)
+
+    def _get(self, offset: int, length: int) -> bytes:
+        response = self.minio_client.get_object(self.bucket, self.key, offset=offset, length=length)
+        try:
+            data = response.read()
+        finally:
+            response.close()
+            response.release_conn()
+        self.bytes_read += len(data)
+        self.requests += 1
+        return data
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._position = min(max(offset, 0), self.size)
+        return self._position
+
+    def readinto(self, buffer):
+        length = min(len(buffer), self.size - self._position)
+        if length <= 0:
+            return 0
+        if self._position >= self._tail_offset:
+            start = self._position - self._tail_offset
+            data = self._tail[start:start + length]
+        else:
+            data = self._get(self._position, length)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+def _may_match(row_group, predicates, column_index: dict) -> bool:
+    """False only when the row group statistics prove no row can satisfy ``predicates``."""
+    for column, op, value in predicates:
+        if column not in column_index:
+            continue
+        statistics = row_group.column(column_index[column]).statistics
+        if statistics is None or not statistics.has_min_max:
+            continue
+        low, high = statistics.min, statistics.max
+        try:
+            if op == '==' and not low <= value <= high:
+                return False
+            if op == 'in' and not any(low <= item <= high for item in value):
+                return False
+            if op == '<' and not low < value:
+                return False
+            if op == '<=' and not low <= value:
+                return False
+            if op == '>' and not high > value:
+                return False
+            if op == '>=' and not high >= value:
+                return False
+        except TypeError:
+            # Statistics of a type we cannot compare with the value: keep the row group
+            continue
+    return True
+
+
+def predicate_expression(predicates) -> pl.Expr:
+    """AND of ``(column, op, value)`` predicates as a Polars expression."""
+    expressions = [
+        pl.col(column).is_in(list(value)) if op == 'in' else _COMPARISONS[op](pl.col(column), value)
+        for column, op, value in predicates
+    ]
+    expression = expressions[0]
+    for other in expressions[1:]:
+        expression = expression & other
+    return expression
+
+
+def read_parquet_object(minio_client, bucket: str, key: str, columns=None, predicates=None):
+    """Read only the row groups and columns of ``bucket/key`` needed by the caller.
+
+    ``predicates`` is a list of ``(column, op, value)`` with op in ``==``,
+    ``!=``, ``<``, ``<=``, ``>``, ``>=``, ``in``. Row groups whose min/max
+    statistics exclude a predicate are never downloaded; the predicates are
+    then applied exactly on the rows read. Returns ``(frame, metrics)`` where
+    ``metrics`` holds the bytes transferred against the object size.
+    """
+    predicates = predicates or []
+    source = MinioRangeFile(minio_client, bucket, key)
+    parquet_file = pq.ParquetFile(source)
+    metadata = parquet_file.metadata
+    column_index = {metadata.schema.column(i).name: i for i in range(metadata.num_columns)}
+
+    row_groups = [i for i in range(metadata.num_row_groups)
+                  if _may_match(metadata.row_group(i), predicates, column_index)]
+    # Predicate columns are read too, then dropped if they were not requested
+    read_columns = None
+    if columns is not None:
+        read_columns = list(dict.fromkeys(list(columns) + [column for column, _, _ in predicates]))
+
+    table = parquet_file.read_row_groups(row_groups, columns=read_columns)
+    df = pl.from_arrow(table)
+    if predicates and len(df) > 0:
+        df = df.filter(predicate_expression(predicates))
+    if columns is not None:
+        df = df.select(list(columns))
+
+    metrics = {
+        'key': key,
+        'object_bytes': source.size,
+        'bytes_read': source.bytes_read,
+        'requests': source.requests,
+        'row_groups_read': len(row_groups),
+        'row_groups_total': metadata.num_row_groups,
+    }
+    logging.info(f"Read {bucket}/{key}: {metrics['bytes_read']}/{metrics['object_bytes']} bytes in "
+                 f"{metrics['requests']} requests, {len(row_groups)}/{metadata.num_row_groups} row groups")
+    return df, metrics
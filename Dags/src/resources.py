@@ -0,0 +1,198 @@
+import os
+import json
+import inspect
+import logging
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from minio import Minio
+from minio.error import S3Error
+from psycopg2 import pool
+
+# Airflow connection ids (see AIRFLOW_CONN_* in docker-compose.yml)
+SOURCE_CONN_ID = os.environ.get("SANTE_SOURCE_CONN_ID", "prod_db_conn")
+WAREHOUSE_CONN_ID = os.environ.get("SANTE_WAREHOUSE_CONN_ID", "analytics_db_conn")
+MINIO_CONN_ID = os.environ.get("SANTE_MINIO_CONN_ID", "minio_s3")
+
+PG_POOL_MIN_SIZE = int(os.environ.get("SANTE_PG_POOL_MIN", "1"))
+PG_POOL_MAX_SIZE = int(os.environ.get("SANTE_PG_POOL_MAX", "8"))
+
+# Used when neither an Airflow connection nor SANTE_* variables are available
+POSTGRES_DEFAULTS = {
+    "prod_db_conn": {"host": "postgres-prod", "port": 5432, "dbname": "sante_database",
+                     "user": "postgres", "password": "postgres"},
+    "analytics_db_conn": {"host": "postgres-etl", "port": 5432, "dbname": "sante_metrics",
+                          "user": "postgres", "password": "postgres"},
+}
+MINIO_DEFAULTS = {"endpoint": "minio:9000", "access_key": "minioadmin",
+                  "secret_key": "minioadmin", "secure": False}
+
+# Conditional writes (If-Match / If-None-Match) are not exposed by Minio.put_object, whose
+# headers all go through normalize_headers and become x-amz-meta-*; put_object_if relies on
+# the private Minio._put_object instead, so its signature is pinned here.
+_PUT_OBJECT_PARAMS = ("self", "bucket_name", "object_name", "data", "headers")
+_params = tuple(inspect.signature(getattr(Minio, "_put_object", lambda: None)).parameters)
+if _params[:len(_PUT_OBJECT_PARAMS)] != _PUT_OBJECT_PARAMS:
+    raise ImportError(
+        f"Minio._put_object{_params} does not match {_PUT_OBJECT_PARAMS}: the installed minio "
+        "release changed its private API, update src.resources.put_object_if"
+    )
+del _params
+
+_lock = threading.Lock()
+_pools = {}
+_pools_pid = None
+_minio_client = None
+_minio_pid = None
+_known_buckets = set()
+
+
+def _airflow_connection(conn_id: str):
+    try:
+        from airflow.hooks.base import BaseHook
+        return BaseHook.get_connection(conn_id)
+    except Exception as e:
+        logging.debug(f"Airflow connection {conn_id} unavailable: {e}")
+        return None
+
+
+def _env_prefix(conn_id: str) -> str:
+    return f"SANTE_{conn_id.upper()}_"
+
+
+def postgres_settings(conn_id: str) -> dict:
+    """Connection parameters for ``conn_id``: Airflow connection, then environment, then defaults.
+
+    Environment variables are named after the connection id, e.g.
+    ``SANTE_PROD_DB_CONN_HOST`` or ``SANTE_ANALYTICS_DB_CONN_PASSWORD``.
+    """
+    settings = dict(POSTGRES_DEFAULTS.get(conn_id, POSTGRES_DEFAULTS["prod_db_conn"]))
+    connection = _airflow_connection(conn_id)
+    if connection is not None:
+        settings.update({
+            "host": connection.host or settings["host"],
+            "port": connection.port or settings["port"],
+            "dbname": connection.schema or settings["dbname"],
+            "user": connection.login or settings["user"],
+            "password": connection.password or settings["password"],
+        })
+    prefix = _env_prefix(conn_id)
+    for key in settings:
+        value = os.environ.get(prefix + key.upper())
+        if value:
+            settings[key] = value
+    return settings
+
+
+def minio_settings() -> dict:
+    settings = dict(MINIO_DEFAULTS)
+    connection = _airflow_connection(MINIO_CONN_ID)
+    if connection is not None:
+        extra = connection.extra_dejson if hasattr(connection, "extra_dejson") else json.loads(connection.extra or "{}")
+        endpoint_url = extra.get("endpoint_url")
+        if endpoint_url:
+            parsed = urlparse(endpoint_url)
+            settings["endpoint"] = parsed.netloc
+            settings["secure"] = parsed.scheme == "https"
+        settings["access_key"] = extra.get("aws_access_key_id", settings["access_key"])
+        settings["secret_key"] = extra.get("aws_secret_access_key", settings["secret_key"])
+    settings["endpoint"] = os.environ.get("SANTE_MINIO_ENDPOINT", settings["endpoint"])
+    settings["access_key"] = os.environ.get("SANTE_MINIO_ACCESS_KEY", settings["access_key"])
+    settings["secret_key"] = os.environ.get("SANTE_MINIO_SECRET_KEY", settings["secret_key"])
+    if "SANTE_MINIO_SECURE" in os.environ:
+        settings["secure"] = os.environ["SANTE_MINIO_SECURE"].lower() in ("1", "true", "yes")
+    return settings
+
+
+def _reset_after_fork():
+    # Connections and sockets must not be shared between a parent and its forked children
+    global _pools, _pools_pid
+    if _pools_pid != os.getpid():
+        _pools = {}
+        _pools_pid = os.getpid()
+        _known_buckets.clear()
+
+
+def get_postgres_pool(conn_id: str = SOURCE_CONN_ID) -> pool.ThreadedConnectionPool:
+    with _lock:
+        _reset_after_fork()
+        if conn_id not in _pools:
+            settings = postgres_settings(conn_id)
+            logging.info(f"Opening Postgres pool for {conn_id} on {settings['host']}:{settings['port']}")
+            _pools[conn_id] = pool.ThreadedConnectionPool(PG_POOL_MIN_SIZE, PG_POOL_MAX_SIZE, **settings)
+        return _pools[conn_id]
+
+
+@contextmanager
+def postgres_connection(conn_id: str = SOURCE_CONN_ID):
+    """Borrow a connection from the per-process pool of ``conn_id``.
+
+    Uncommitted work is rolled back when the connection goes back to the pool.
+    """
+    connection_pool = get_postgres_pool(conn_id)
+    connection = connection_pool.getconn()
+    try:
+        yield connection
+    finally:
+        if connection.closed:
+            connection_pool.putconn(connection, close=True)
+        else:
+            connection.rollback()
+            connection_pool.putconn(connection)
+
+
+def close_postgres_pools():
+    with _lock:
+        for connection_pool in _pools.values():
+            connection_pool.closeall()
+        _pools.clear()
+
+
+def get_minio_client() -> Minio:
+    """Process-wide MinIO client; the client is thread-safe and reuses its HTTP pool."""
+    global _minio_client, _minio_pid
+    with _lock:
+        if _minio_client is None or _minio_pid != os.getpid():
+            settings = minio_settings()
+            _minio_client = Minio(
+                settings["endpoint"],
+                access_key=settings["access_key"],
+                secret_key=settings["secret_key"],
+                secure=settings["secure"]
+            )
+            _minio_pid = os.getpid()
+            _known_buckets.clear()
+        return _minio_client
+
+
+def put_object_if(minio_client: Minio, bucket: str, key: str, payload: bytes, etag=None,
+                  content_type: str = "application/octet-stream") -> bool:
+    """Write ``key`` only if the stored object still has ``etag`` (``None``: only if there is none).
+
+    Returns False when another writer, possibly in another process, got there first.
+    """
+    headers = {"Content-Type": content_type}
+    headers.update({"If-Match": etag} if etag else {"If-None-Match": "*"})
+    try:
+        minio_client._put_object(bucket, key, payload, headers)
+    except S3Error as e:
+        if e.code in ("PreconditionFailed", "ConditionalRequestConflict"):
+            return False
+        raise
+    return True
+
+
+def ensure_bucket(minio_client: Minio, bucket: str):
+    """Create ``bucket`` if needed, checking its existence once per process."""
+    if bucket in _known_buckets:
+        return
+    if not minio_client.bucket_exists(bucket):
+        logging.info(f"Creating bucket {bucket}")
+        try:
+            minio_client.make_bucket(bucket)
+        except S3Error as e:
+            # Another worker thread may have created it in the meantime
+            if e.code not in ("BucketAlreadyOwnedByYou", "BucketAlreadyExists"):
+                raise
+    _known_buckets.add(bucket)
@@ -0,0 +1,151 @@
+import logging
+from datetime import timedelta
+from calendar import monthrange
+
+import numpy as np
+import polars as pl
+
+from src.hll import hll_estimate, hll_merge, hll_registers
+
+# Mergeable partial states kept per day, from which coarser windows are derived.
+#   fact      clean fact table the daily state is computed from
+#   group_by  grouping columns kept in the state
+#   sums      columns summed (booleans count their true values); finalized as total_ and mean_
+#   min_max   columns whose minimum and maximum are kept
+#   distinct  integer columns whose distinct count is estimated with HyperLogLog
+ROLLING_STATES = {
+    'consultation': {
+        'fact': 'fact_consultation',
+        'group_by': ['etablissement_id'],
+        'sums': ['cout', 'duree_minutes', 'satisfaction_patient', 'urgence'],
+        'min_max': ['cout'],
+        'distinct': ['patient_id', 'medecin_id'],
+    },
+    'analyse': {
+        'fact': 'fact_analyse',
+        'group_by': ['type_analyse'],
+        'sums': ['cout', 'resultat_anormal', 'delai_resultat_heures'],
+        'min_max': ['delai_resultat_heures'],
+        'distinct': ['patient_id'],
+    },
+    'occupation': {
+        'fact': 'fact_occupation_etablissement',
+        'group_by': ['etablissement_id'],
+        'sums': ['taux_occupation', 'nombre_admissions', 'nombre_sorties'],
+        'min_max': ['taux_occupation'],
+        'distinct': [],
+    },
+}
+
+# Rolling windows: number of days ending on (and including) the window's day
+ROLLING_WINDOWS = {'rolling_7d': 7, 'rolling_30d': 30}
+
+STATE_DATE_COLUMN = "date"
+STATE_SUFFIX = "_state"
+
+
+def state_table(name: str) -> str:
+    return f"{name}{STATE_SUFFIX}"
+
+
+def required_columns(name: str, date_column: str) -> list:
+    spec = ROLLING_STATES[name]
+    return sorted({date_column, *spec['group_by'], *spec['sums'], *spec['min_max'], *spec['distinct']})
+
+
+def _sketch_column(state: pl.DataFrame, column: str, sketch) -> pl.DataFrame:
+    """Replace the list column ``column`` by one HLL sketch (bytes) per group."""
+    sketches = [sketch(values).tobytes() for values in state[column].to_list()]
+    return state.with_columns(pl.Series(column, sketches, dtype=pl.Binary))
+
+
+def compute_daily_state(name: str, df: pl.DataFrame, day) -> pl.DataFrame:
+    """Partial state of one day of facts: counts, sums, min/max and HLL sketches per group."""
+    spec = ROLLING_STATES[name]
+    aggregations = [pl.len().alias('nb_rows')]
+    aggregations += [pl.col(column).cast(pl.Float64).sum().alias(f"sum_{column}") for column in spec['sums']]
+    aggregations += [pl.col(column).min().alias(f"min_{column}") for column in spec['min_max']]
+    aggregations += [pl.col(column).max().alias(f"max_{column}") for column in spec['min_max']]
+    aggregations += [pl.col(column).drop_nulls().alias(f"hll_{column}") for column in spec['distinct']]
+    state = df.group_by(spec['group_by']).agg(aggregations)
+    for column in spec['distinct']:
+        state = _sketch_column(state, f"hll_{column}", lambda values: hll_registers(np.array(values, dtype=np.int64)))
+    return state.select([pl.lit(day).cast(pl.Date).alias(STATE_DATE_COLUMN)] + state.columns)
+
+
+def merge_states(name: str, states: pl.DataFrame) -> pl.DataFrame:
+    """Merge partial states of several days into one state per group."""
+    spec = ROLLING_STATES[name]
+    aggregations = [pl.col('nb_rows').sum()]
+    aggregations += [pl.col(f"sum_{column}").sum() for column in spec['sums']]
+    aggregations += [pl.col(f"min_{column}").min() for column in spec['min_max']]
+    aggregations += [pl.col(f"max_{column}").max() for column in spec['min_max']]
+    aggregations += [pl.col(f"hll_{column}") for column in spec['distinct']]
+    merged = states.group_by(spec['group_by']).agg(aggregations)
+    for column in spec['distinct']:
+        merged = _sketch_column(merged, f"hll_{column}", lambda sketches: hll_merge(
+            [np.frombuffer(sketch, dtype=np.uint8) for sketch in sketches]))
+    return merged
+
+
+def finalize_state(name: str, state: pl.DataFrame) -> pl.DataFrame:
+    """Metrics of a (merged) state: totals, means, min/max and estimated distinct counts."""
+    spec = ROLLING_STATES[name]
+    metrics = [pl.col('nb_rows')]
+    for column in spec['sums']:
+        metrics += [pl.col(f"sum_{column}").alias(f"total_{column}"),
+                    (pl.col(f"sum_{column}") / pl.col('nb_rows')).alias(f"mean_{column}")]
+    metrics += [pl.col(f"{bound}_{column}") for column in spec['min_max'] for bound in ('min', 'max')]
+    result = state.select(spec['group_by'] + metrics)
+    for column in spec['distinct']:
+        estimates = [round(hll_estimate(np.frombuffer(sketch, dtype=np.uint8))) for sketch in state[f"hll_{column}"]]
+        result = result.with_columns(pl.Series(f"distinct_{column}", estimates, dtype=pl.Int64))
+    return result.sort(spec['group_by'])
+
+
+def affected_windows(day) -> dict:
+    """Windows containing ``day``: window name -> list of (key day, first day, last day).
+
+    Rolling windows are listed for every end day they cover; the caller keeps
+    the ones whose end day has a state.
+    """
+    week_start = day - timedelta(days=day.weekday())
+    month_start = day.replace(day=1)
+    windows = {
+        'weekly': [(week_start, week_start, week_start + timedelta(days=6))],
+        'monthly': [(month_start, month_start, day.replace(day=monthrange(day.year, day.month)[1]))],
+    }
+    for window, length in ROLLING_WINDOWS.items():
+        windows[window] = [(day + timedelta(days=offset), day + timedelta(days=offset - length + 1),
+                            day + timedelta(days=offset)) for offset in range(length)]
+    return windows
+
+
+def derive_windows(name: str, states: pl.DataFrame, day) -> dict:
+    """Recompute, from the daily ``states``, every window containing ``day``.
+
+    Returns ``{window name: [(key day, finalized frame)]}``. Rolling windows
+    ending after the last day with a state are skipped.
+    """
+    days_with_state = set(states[STATE_DATE_COLUMN].unique().to_list())
+    results = {}
+    for window, ranges in affected_windows(day).items():
+        results[window] = []
+        for key_day, first_day, last_day in ranges:
+            if window in ROLLING_WINDOWS and key_day not in days_with_state:
+                continue
+            in_window = states.filter((pl.col(STATE_DATE_COLUMN) >= first_day) & (pl.col(STATE_DATE_COLUMN) <= last_day))
+            finalized = finalize_state(name, merge_states(name, in_window.drop(STATE_DATE_COLUMN)))
+            results[window].append((key_day, finalized.with_columns([
+                pl.lit(first_day).cast(pl.Date).alias('window_start'),
+                pl.lit(last_day).cast(pl.Date).alias('window_end')])))
+        logging.info(f"{name}: recomputed {len(results[window])} {window} windows containing {day}")
+    return results
+
+
+def window_range(day):
+    """Days whose states are needed to recompute every window containing ``day``."""
+    windows = affected_windows(day)
+    first_day = min(first for ranges in windows.values() for _, first, _ in ranges)
+    last_day = max(last for ranges in windows.values() for _, _, last in ranges)
+    return first_day, last_day
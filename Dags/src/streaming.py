@@ -0,0 +1,99 @@
+import os
+import uuid
+import logging
+import tempfile
+
+import polars as pl
+
+from src.encoding import parquet_writer
+from src.instrumentation import record
+
+# Rows fetched per round-trip from the server-side cursor (= one Parquet row group)
+STREAM_BATCH_SIZE = int(os.environ.get("SANTE_STREAM_BATCH_SIZE", "100000"))
+# Size of each part of the MinIO multipart upload (minimum allowed by S3 is 5 MiB)
+MULTIPART_PART_SIZE = 16 * 1024 * 1024
+
+# psycopg2 type OIDs -> Polars dtypes, so every batch gets the same schema
+# even when a column happens to be entirely NULL in the first batch
+PG_TYPE_MAPPING = {
+    16: pl.Boolean,
+    20: pl.Int64,
+    21: pl.Int16,
+    23: pl.Int32,
+    700: pl.Float32,
+    701: pl.Float64,
+    1700: pl.Float64,
+    1082: pl.Date,
+    1114: pl.Datetime,
+    1184: pl.Datetime(time_zone="UTC"),
+}
+
+
+def cursor_schema(description) -> dict:
+    return {column.name: PG_TYPE_MAPPING.get(column.type_code, pl.Utf8) for column in description}
+
+
+def iter_query_batches(connection, query: str, batch_size: int = STREAM_BATCH_SIZE):
+    """Yield the result of ``query`` as Polars frames of at most ``batch_size`` rows.
+
+    A named (server-side) cursor is used so Postgres keeps the result set and
+    only ``batch_size`` rows are held client-side at any time.
+    """
+    cursor = connection.cursor(name=f"sante_extract_{uuid.uuid4().hex[:8]}")
+    cursor.itersize = batch_size
+    try:
+        cursor.execute(query)
+        schema = None
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            if schema is None:
+                schema = cursor_schema(cursor.description)
+            yield pl.DataFrame(rows, schema=schema, orient="row", strict=False)
+    finally:
+        cursor.close()
+
+
+def write_batches_to_parquet(batches, sink, profile: str = 'raw') -> int:
+    """Write each frame of ``batches`` as its own row group into ``sink``."""
+    writer = None
+    nb_rows = 0
+    try:
+        for batch in batches:
+            table = batch.to_arrow()
+            if writer is None:
+                writer = parquet_writer(sink, table.schema, profile)
+            writer.write_table(table, row_group_size=len(batch))
+            nb_rows += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    return nb_rows
+
+
+def stream_query_to_minio(connection, query: str, minio_client, bucket: str, object_path: str,
+                          batch_size: int = STREAM_BATCH_SIZE) -> int:
+    """Stream ``query`` into a Parquet object without materializing the whole result.
+
+    Row groups are spooled to a local temporary file and the file is sent with
+    a multipart upload, so peak memory is bounded by ``batch_size``.
+    Returns the number of rows written; nothing is uploaded when it is 0.
+    """
+    with tempfile.TemporaryFile() as spool:
+        nb_rows = write_batches_to_parquet(iter_query_batches(connection, query, batch_size), spool)
+        if nb_rows == 0:
+            return 0
+        size = spool.tell()
+        record('bytes_out', size)
+        spool.seek(0)
+        logging.info(f"Uploading {nb_rows} records ({size} bytes) to {bucket}/{object_path}")
+        minio_client.put_object(
+            bucket_name=bucket,
+            object_name=object_path,
+            data=spool,
+            length=-1,
+            part_size=MULTIPART_PART_SIZE,
+            content_type='application/octet-stream'
+        )
+    return nb_rows
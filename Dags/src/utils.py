@@ -1,6 +1,3 @@
-import psycopg2
-from psycopg2 import extras
-from minio import Minio
 import random
 import sys
 import polars as pl
@@ -8,6 +5,27 @@ import io
 import logging
 from datetime import datetime, timedelta
 import time
+from concurrent.futures import ThreadPoolExecutor
+from src.cdc import CDC_BATCH_CHANGES, capture_batch, ensure_cdc_slot
+from src.aggregations import (AGGREGATES, aggregates_for, compute_aggregates, dimension_key,
+                              required_columns, required_dimensions)
+from src.cleaning_rules import CLEANING_RULES, apply_cleaning_rules
+from src.dedup_index import DEDUP_TABLES, DedupIndex
+from src.fact_load import load_fact, refresh_lookup_indexes
+from src.instrumentation import propagate, record, stage, timed
+from src.integrity import ORPHANS_SUFFIX, QUARANTINE_PREFIX, count_reasons, split_orphans
+from src.layout import (compact_month, object_key, put_parquet, read_partitions, register_object,
+                        resolve_range, table_extent)
+from src.parallel import PIPELINE_MAX_WORKERS, log_summary, raise_for_failures, run_per_table
+from src.parquet_reader import read_parquet_object
+from src.rolling import (ROLLING_STATES, STATE_SUFFIX, compute_daily_state, derive_windows,
+                         state_table, window_range)
+from src.rolling import required_columns as rolling_required_columns
+from src.resources import (SOURCE_CONN_ID, WAREHOUSE_CONN_ID, ensure_bucket,
+                           get_minio_client, postgres_connection)
+from src.streaming import STREAM_BATCH_SIZE, stream_query_to_minio
+from src.watermark import commit_watermark, ensure_watermark_table, open_watermark_window
+from src.warehouse import COPY_BATCH_SIZE, SCD2_TABLES, ensure_merge_columns, load_dataframe, merge_dataframe
 
 logging.basicConfig(
     level=logging.INFO,
@@ -18,303 +36,563 @@ logging.basicConfig(
     ]
 )
 
-# MinIO configuration
-MINIO_ENDPOINT = "minio:9000"
-MINIO_ACCESS_KEY = "minioadmin"
-MINIO_SECRET_KEY = "minioadmin"
+# MinIO configuration (endpoint and credentials are resolved in src.resources)
 MINIO_BUCKET_RAW = "sante-data-raw"
 MINIO_BUCKET_CLEAN = "sante-data-clean"
 MINIO_BUCKET_AGGREGATED = "sante-data-aggregated"
 
-def get_minio_client():
-    connection = Minio(
-        MINIO_ENDPOINT,
-        access_key=MINIO_ACCESS_KEY,
-        secret_key=MINIO_SECRET_KEY,
-        secure=False
-    )
-    return connection
+DATE_COLUMN_MAPPING = {
+    'dim_temps': 'date',
+    'dim_patient': 'date_naissance',
+    'dim_medecin': 'date_creation',
+    'dim_etablissement': 'date_creation',
+    'dim_diagnostic': 'date_creation',
+    'dim_medicament': 'date_creation',
+    'fact_consultation': 'date_consultation',
+    'fact_traitement': 'date_traitement',
+    'fact_analyse': 'date_analyse',
+    'fact_occupation_etablissement': 'date_occupation'
+}
 
 def extract_table(table_name: str, **kwargs):
     execution_date = kwargs['execution_date']
-    logging.info(f"Extracting data from {table_name} on {execution_date}")
-    date_column_mapping = {
-        'dim_temps': 'date',
-        'dim_patient': 'date_naissance',
-        'dim_medecin': 'date_creation',
-        'dim_etablissement': 'date_creation',
-        'dim_diagnostic': 'date_creation',
-        'dim_medicament': 'date_creation',
-        'fact_consultation': 'date_consultation',
-        'fact_traitement': 'date_traitement',
-        'fact_analyse': 'date_analyse',
-        'fact_occupation_etablissement': 'date_occupation'
-    }
+    nb_rows = _extract_rows(table_name, **kwargs)
+    if nb_rows == 0:
+        return f"No data found for {table_name} on {execution_date}"
+    return f"Extracted and saved {nb_rows} records from {table_name}"
+
+def _extract_rows(table_name: str, **kwargs) -> int:
+    execution_date = kwargs['execution_date']
+    extract_mode = kwargs.get('extract_mode', 'memory')
+    incremental = kwargs.get('incremental', False)
+    logging.info(f"Extracting data from {table_name} on {execution_date} ({extract_mode} mode)")
     
+    # Borrow a pooled PostgreSQL connection
+    with stage('extract', table_name) as metrics, postgres_connection(SOURCE_CONN_ID) as connection:
+        nb_rows = _extract_to_minio(connection, table_name, execution_date, extract_mode, incremental, **kwargs)
+        metrics.add('rows', nb_rows)
+        return nb_rows
+
+def _build_extract_query(postgres_connection, table_name, execution_date, incremental):
     # Get the appropriate date column for the table
-    date_column = date_column_mapping.get(table_name)
+    date_column = DATE_COLUMN_MAPPING.get(table_name)
     logging.info(f"Date column for {table_name}: {date_column}")
-    
-    # Create PostgreSQL connection
-    postgres_connection = psycopg2.connect(
-        dbname="sante_database",
-        user="postgres",
-        password="postgres",
-        host="postgres-prod",
-        port="5432"
-    )
-    
+
     # Construct query based on whether table has date column
-    if date_column:
+    window = None
+    if table_name in SCD2_TABLES:
+        # Always the whole table, whatever the caller asks: rows updated in place are re-read
+        # (unlike with an id watermark) and no partial object can replace the day's snapshot
+        query = f"SELECT * FROM {table_name}"
+    elif incremental:
+        ensure_watermark_table(postgres_connection)
+        window = open_watermark_window(postgres_connection, table_name, execution_date)
+        query = window.query
+    elif date_column:
+        # Half-open range on the raw column so the date index can be used
+        day_start = execution_date.strftime('%Y-%m-%d')
+        day_end = (execution_date + timedelta(days=1)).strftime('%Y-%m-%d')
         query = f"""
             SELECT * FROM {table_name} 
-            WHERE DATE({date_column}) = DATE('{execution_date}')
+            WHERE {date_column} >= DATE '{day_start}' AND {date_column} < DATE '{day_end}'
         """
     else:
         query = f"SELECT * FROM {table_name}"
+    return query, window
+
+def _extract_to_minio(postgres_connection, table_name, execution_date, extract_mode, incremental, **kwargs):
+    """Extract ``table_name`` into the raw bucket and return the number of rows written."""
+    query, window = _build_extract_query(postgres_connection, table_name, execution_date, incremental)
+
+    if extract_mode == 'stream':
+        # Server-side cursor + one row group per batch: memory is bounded by the batch size
+        object_path = object_key(table_name, execution_date)
+        minio_client = get_minio_client()
+        ensure_bucket(minio_client, MINIO_BUCKET_RAW)
+        batch_size = kwargs.get('batch_size', STREAM_BATCH_SIZE)
+        nb_rows = stream_query_to_minio(postgres_connection, query, minio_client,
+                                        MINIO_BUCKET_RAW, object_path, batch_size=batch_size)
+        register_object(minio_client, MINIO_BUCKET_RAW, table_name, object_path, execution_date, rows=nb_rows)
+        if window:
+            commit_watermark(postgres_connection, window)
+        logging.info(f"Uploaded {nb_rows} records to MinIO")
+        return nb_rows
 
     # Execute query and get data as Polars DataFrame
-    df = pl.read_database(query=query, connection=postgres_connection)
+    with timed('query'):
+        df = pl.read_database(query=query, connection=postgres_connection)
     logging.info(f"Extracted {len(df)} records from {table_name}")
     logging.info(f"Extracted data: {df.head()}")
     
     if len(df) > 0:
-        # Convert to parquet bytes
-        parquet_buffer = io.BytesIO()
-        logging.info(f"Writing {len(df)} records to parquet")
-        df.write_parquet(parquet_buffer)
-        logging.info(f"Finished writing {len(df)} records to parquet")
-        parquet_buffer.seek(0)
-        
-        # Save to MinIO
+        save_raw_data(table_name, df, execution_date)
+    if window:
+        commit_watermark(postgres_connection, window)
+    return len(df)
+
+def save_raw_data(table_name: str, df: pl.DataFrame, execution_date):
+    # Save to MinIO
+    minio_client = get_minio_client()
+    logging.info(f"Uploading {len(df)} records to MinIO")
+    
+    # Create bucket if it doesn't exist (checked once per process)
+    ensure_bucket(minio_client, MINIO_BUCKET_RAW)
+    
+    # Upload to the day partition and register it in the table manifest
+    try:
+        object_path = put_parquet(minio_client, MINIO_BUCKET_RAW, table_name, execution_date, df, profile='raw')
+    except Exception as e:
+        time.sleep(5)
+        logging.error(f"Connection failed: {e}. Retrying...")
         minio_client = get_minio_client()
-        logging.info(f"Uploading {len(df)} records to MinIO")
-        
-        # Create bucket if it doesn't exist
-        if not minio_client.bucket_exists(MINIO_BUCKET_RAW):
-            logging.info(f"Creating bucket {MINIO_BUCKET_RAW}")
-            minio_client.make_bucket(MINIO_BUCKET_RAW)
-        
-        # Define the object path in MinIO
-        object_path = f"{table_name}/{table_name}_{execution_date.strftime('%Y-%m-%d')}.parquet"
-        logging.info(f"Uploading to {object_path}")
-        
-        # Upload to MinIO
-        try:
-            minio_client.put_object(
-                bucket_name=MINIO_BUCKET_RAW,
-                object_name=object_path,
-                data=parquet_buffer,
-                length=parquet_buffer.getbuffer().nbytes,
-                content_type='application/octet-stream'
-            )
-        except Exception as e:
-            time.sleep(5)
-            logging.error(f"Connection failed: {e}. Retrying...")
-            minio_client = get_minio_client()
-            minio_client.put_object(
-                bucket_name=MINIO_BUCKET_RAW,
-                object_name=object_path,
-                data=parquet_buffer,
-                length=parquet_buffer.getbuffer().nbytes,
-                content_type='application/octet-stream'
-            )
-        logging.info(f"Uploaded {len(df)} records to MinIO")
-        
-        return f"Extracted and saved {len(df)} records from {table_name}"
-    else:
-        return f"No data found for {table_name} on {execution_date}"
+        object_path = put_parquet(minio_client, MINIO_BUCKET_RAW, table_name, execution_date, df, profile='raw')
+    logging.info(f"Uploaded {len(df)} records to {object_path}")
 
 def load_data_from_minio(table: str, **kwargs):
-    execution_date = kwargs['execution_date']
-    logging.info(f"Loading data from MinIO for {execution_date}")
+    # Either the run's day or a [start_date, end_date] range, resolved through the table manifest
+    execution_date = kwargs.get('execution_date')
+    start_date = kwargs.get('start_date', execution_date)
+    end_date = kwargs.get('end_date', start_date)
+    bucket = kwargs.get('bucket', MINIO_BUCKET_RAW)
+    suffix = kwargs.get('suffix', '')
+    # Only the requested columns and the row groups matching the predicates are downloaded
+    columns = kwargs.get('columns')
+    predicates = kwargs.get('predicates')
+    logging.info(f"Loading {table} from {bucket} for {start_date} -> {end_date}")
     minio_client = get_minio_client()
-    object_path = f"{table}/{table}_{execution_date.strftime('%Y-%m-%d')}.parquet"
-    logging.info(f"Loading data from {object_path}")
+    metrics = []
     try:
-        df = pl.read_parquet(minio_client.get_object(MINIO_BUCKET_RAW, object_path))
+        df = read_partitions(minio_client, bucket, table, start_date, end_date, suffix,
+                             columns=columns, predicates=predicates, metrics=metrics)
     except Exception as e:
         logging.error(f"Error while loading data from MinIO: {e}")
+        df = None
+    if metrics:
+        bytes_read = sum(m['bytes_read'] for m in metrics)
+        object_bytes = sum(m['object_bytes'] for m in metrics)
+        logging.info(f"Downloaded {bytes_read} of {object_bytes} stored bytes for {table} ({len(metrics)} objects)")
+    if df is None:
         df = pl.DataFrame()
         return df.is_empty()
     logging.info(f"Loaded table: {table},\n execution_date = {execution_date},\n Data: {len(df.head())} records from MinIO")
     return df
 
+def clean_dataframe(table_name: str, df: pl.DataFrame):
+    """Apply the cleaning rules of ``table_name``; return ``(df, rejected)``, the rows rejected per rule.
+
+    The counts are also added to the running stage as ``rejected.<rule>``
+    counters (``:`` replaced by ``_``, which StatsD reserves).
+    """
+    # Casts, null policy, ranges, normalization and dedup keys are declared
+    # per table in src.cleaning_rules and run as a single lazy Polars plan
+    df, rejected = apply_cleaning_rules(table_name, df)
+    for rule, count in rejected.items():
+        record(f"rejected.{rule.replace(':', '_')}", count)
+    return df, rejected
+
+def drop_redelivered(table_name: str, df: pl.DataFrame, execution_date):
+    """Drop the facts whose business key was cleaned on an earlier day (src.dedup_index).
+
+    Returns ``(df, index)``; ``index.commit()`` records the new keys. Only the
+    validation stage commits, once the rows that passed are saved: quarantined
+    facts are not remembered, so a redelivery of them is cleaned again.
+    ``index`` is None for the tables without dedup index.
+    """
+    if table_name not in DEDUP_TABLES:
+        return df, None
+    index = DedupIndex(get_minio_client(), MINIO_BUCKET_CLEAN, table_name)
+    df, nb_redelivered = index.filter_seen(df, execution_date)
+    if nb_redelivered:
+        logging.info(f"Dropped {nb_redelivered} rows of {table_name} already cleaned on an earlier day")
+    return df, index
+
+def save_clean_data(table_name: str, df: pl.DataFrame, execution_date):
+    minio_client = get_minio_client()
+    ensure_bucket(minio_client, MINIO_BUCKET_CLEAN)
+    
+    put_parquet(minio_client, MINIO_BUCKET_CLEAN, table_name, execution_date, df, suffix="_clean", profile='clean')
+    logging.info(f"Cleaned data saved for {table_name}")
+
 def clean_data(table_name: str, **kwargs):
     execution_date = kwargs['execution_date']
     logging.info(f"Starting data cleaning for {table_name}")
-    df = load_data_from_minio(table=table_name, execution_date=execution_date)
-    
-    if type(df) == bool:
-        return f"No data found for {table_name} on {execution_date}"
-    
-    # Specific cleaning rules for each table
-    if table_name == 'dim_patient':
-        df = df.with_columns([
-            pl.col('date_naissance').cast(pl.Date),
-            pl.col('age').cast(pl.Int32)
-        ])
-    elif table_name == 'dim_medecin':
-        df = df.with_columns([
-            pl.col('experience_annees').cast(pl.Int32)
-        ])
-    elif table_name == 'dim_medicament':
-        df = df.with_columns([
-            pl.col('prix').cast(pl.Float64)
-        ])
-    elif table_name == 'fact_consultation':
-        df = df.with_columns([
-            pl.col('date_consultation').cast(pl.Date),
-            pl.col('duree_minutes').cast(pl.Int32)
-        ])
-    
-    # Common cleaning operations
-    df = df.drop_nulls()
-    df = df.unique()
-    
-    # Save cleaned data to MinIO
-    if len(df) > 0:
-        parquet_buffer = io.BytesIO()
-        df.write_parquet(parquet_buffer)
-        parquet_buffer.seek(0)
-        
-        minio_client = get_minio_client()
-        if not minio_client.bucket_exists(MINIO_BUCKET_CLEAN):
-            minio_client.make_bucket(MINIO_BUCKET_CLEAN)
-        
-        object_path = f"{table_name}/{table_name}_{execution_date.strftime('%Y-%m-%d')}_clean.parquet"
-        
-        try:
-            minio_client.put_object(
-                bucket_name=MINIO_BUCKET_CLEAN,
-                object_name=object_path,
-                data=parquet_buffer,
-                length=parquet_buffer.getbuffer().nbytes,
-                content_type='application/octet-stream'
-            )
-            logging.info(f"Cleaned data saved for {table_name}")
-            return f"Cleaned and saved {len(df)} records from {table_name}"
-        except Exception as e:
-            logging.error(f"Error saving cleaned data: {e}")
-            return f"Error cleaning data for {table_name}: {str(e)}"
+    with stage('clean', table_name) as metrics:
+        df = load_data_from_minio(table=table_name, execution_date=execution_date)
+
+        if type(df) == bool:
+            return f"No data found for {table_name} on {execution_date}"
+
+        df, rejected = clean_dataframe(table_name, df)
+        df, _ = drop_redelivered(table_name, df, execution_date)
+        metrics.add('rows', len(df))
+
+        # Save cleaned data to MinIO
+        if len(df) > 0:
+            try:
+                save_clean_data(table_name, df, execution_date)
+                return f"Cleaned and saved {len(df)} records from {table_name} (rejected per rule: {rejected})"
+            except Exception as e:
+                logging.error(f"Error saving cleaned data: {e}")
+                return f"Error cleaning data for {table_name}: {str(e)}"
+
+def extract_and_clean_fused(table_name: str, **kwargs) -> dict:
+    """Extract -> clean without reading the raw object back from MinIO.
+
+    The extracted frame goes straight to the cleaning rules while the raw
+    upload runs in the background; the clean upload is started as soon as
+    the rules are applied. Both objects are identical to the split mode.
+    """
+    execution_date = kwargs['execution_date']
+    incremental = kwargs.get('incremental', False)
+    logging.info(f"Extracting and cleaning {table_name} on {execution_date} (fused mode)")
+
+    with stage('extract', table_name) as metrics, postgres_connection(SOURCE_CONN_ID) as connection:
+        query, window = _build_extract_query(connection, table_name, execution_date, incremental)
+        with metrics.timer('query'):
+            df = pl.read_database(query=query, connection=connection)
+        metrics.add('rows', len(df))
+        logging.info(f"Extracted {len(df)} records from {table_name}")
+
+        rows_clean = 0
+        rejected = {}
+        if len(df) > 0:
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix=f"upload-{table_name}") as executor:
+                # Uploads are measured by the stage that submitted them
+                raw_upload = executor.submit(propagate(save_raw_data), table_name, df, execution_date)
+                with stage('clean', table_name) as clean_metrics:
+                    clean_df, rejected = clean_dataframe(table_name, df)
+                    clean_df, _ = drop_redelivered(table_name, clean_df, execution_date)
+                    rows_clean = len(clean_df)
+                    clean_metrics.add('rows', rows_clean)
+                    if rows_clean > 0:
+                        executor.submit(propagate(save_clean_data), table_name, clean_df, execution_date).result()
+                raw_upload.result()
+        if window:
+            commit_watermark(connection, window)
+
+    return {'rows_extracted': len(df), 'rows_clean': rows_clean, 'rejected': rejected}
+
+def extract_and_clean(table_name: str, **kwargs) -> dict:
+    """Extract -> clean chain for one table; errors propagate to the caller."""
+    if kwargs.get('fused', True) and kwargs.get('extract_mode', 'memory') != 'stream':
+        return extract_and_clean_fused(table_name, **kwargs)
+    execution_date = kwargs['execution_date']
+    rows_extracted = _extract_rows(table_name, **kwargs)
+    rows_clean = 0
+    rejected = {}
+    with stage('clean', table_name) as metrics:
+        df = load_data_from_minio(table=table_name, execution_date=execution_date)
+        if type(df) != bool:
+            df, rejected = clean_dataframe(table_name, df)
+            df, _ = drop_redelivered(table_name, df, execution_date)
+            if len(df) > 0:
+                save_clean_data(table_name, df, execution_date)
+            rows_clean = len(df)
+        metrics.add('rows', rows_clean)
+    return {'rows_extracted': rows_extracted, 'rows_clean': rows_clean, 'rejected': rejected}
+
+DIMENSION_TABLES = [
+    'dim_temps',
+    'dim_patient',
+    'dim_medecin',
+    'dim_etablissement',
+    'dim_diagnostic',
+    'dim_medicament'
+]
+
+FACT_TABLES = [
+    'fact_consultation',
+    'fact_traitement',
+    'fact_analyse',
+    'fact_occupation_etablissement'
+]
+
+def _run_pipeline(name: str, tables: list, **kwargs):
+    max_workers = kwargs.pop('max_workers', PIPELINE_MAX_WORKERS)
+    logging.info(f"Starting {name} ({len(tables)} tables, {max_workers} workers)")
+    summary = run_per_table(tables, extract_and_clean, max_workers=max_workers, **kwargs)
+    log_summary(name, summary)
+    raise_for_failures(name, summary)
+    return summary
 
 def dimension_pipeline(**kwargs):
-    logging.info("Starting dimension tables pipeline")
-    #def dimension_pipeline(**kwargs):
-    logging.info("Starting dimension tables pipeline")
-    dimension_tables = [
-        'dim_temps',
-        'dim_patient',
-        'dim_medecin',
-        'dim_etablissement',
-        'dim_diagnostic',
-        'dim_medicament'
-    ]
-    for table in dimension_tables:
-        extract_result = extract_table(table, **kwargs)
-        logging.info(extract_result)
-        clean_result = clean_data(table, **kwargs)
-        logging.info(clean_result)
+    """Extract and clean every dimension, past their watermarks (not by a day range on their date columns)."""
+    kwargs.setdefault('incremental', True)
+    return _run_pipeline("dimension tables pipeline", DIMENSION_TABLES, **kwargs)
 
-    
+def _load_dimension_attributes(needed: dict, execution_date) -> dict:
+    """Attributes of the dimensions as of ``execution_date``, read from their clean objects.
+
+    An incrementally extracted dimension is spread over the objects of every
+    day up to ``execution_date``, read projected on the key and the
+    attributes; a snapshot-extracted one (SCD2) is whole in the day's object.
+    """
+    minio_client = get_minio_client()
+    day = execution_date.date() if isinstance(execution_date, datetime) else execution_date
+    dimensions = {}
+    for dimension_table, attributes in needed.items():
+        key = dimension_key(dimension_table)
+        columns = [key] + attributes
+        extent = table_extent(minio_client, MINIO_BUCKET_CLEAN, dimension_table, suffix="_clean")
+        df = None
+        if extent and extent[0] <= day:
+            if dimension_table in SCD2_TABLES:
+                df = read_partitions(minio_client, MINIO_BUCKET_CLEAN, dimension_table, day, suffix="_clean",
+                                     columns=columns)
+            if df is None:
+                df = read_partitions(minio_client, MINIO_BUCKET_CLEAN, dimension_table, extent[0], day,
+                                     suffix="_clean", columns=columns)
+        if df is None:
+            # Validated facts always have their dimension rows: the clean objects are not there yet
+            raise ValueError(f"No clean {dimension_table} data up to {day}")
+        # A key re-delivered on a later day keeps its latest attributes
+        dimensions[dimension_table] = df.unique(subset=[key], keep='last', maintain_order=True)
+    return dimensions
+
+def validate_fact_table(table_name: str, **kwargs):
+    """Quarantine the day's clean facts whose keys have no dimension row (``run_per_table`` worker).
+
+    The orphans go to ``quarantine/{table}/`` in the clean bucket with their
+    reasons in ``_rejected_by``; the clean object is rewritten without them.
+    The business keys of the rows that passed are then recorded in the dedup
+    index, minus those another day recorded since the cleaning.
+    """
+    execution_date = kwargs['execution_date']
+    minio_client = get_minio_client()
+    key = object_key(table_name, execution_date, "_clean")
+    with stage('validate', table_name) as metrics:
+        # Manifest completed by a listing: an object whose writer died before registering it is still checked
+        entries = resolve_range(minio_client, MINIO_BUCKET_CLEAN, table_name, execution_date, suffix="_clean")
+        if key not in {entry['key'] for entry in entries}:
+            logging.info(f"No cleaned data for {table_name} on {execution_date}")
+            return {'rows_clean': 0}
+        df, object_metrics = read_parquet_object(minio_client, MINIO_BUCKET_CLEAN, key)
+        metrics.add('bytes_in', object_metrics['bytes_read'])
+        metrics.add('rows', len(df))
+        valid, orphans = split_orphans(table_name, df)
+        valid, dedup_index = drop_redelivered(table_name, valid, execution_date)
+
+        reasons = count_reasons(orphans)
+        if not orphans.is_empty():
+            # Quarantine first: if the rewrite fails, the next attempt finds the orphans again
+            put_parquet(minio_client, MINIO_BUCKET_CLEAN, table_name, execution_date, orphans,
+                        suffix=ORPHANS_SUFFIX, profile='clean', prefix=QUARANTINE_PREFIX)
+        if len(valid) < len(df):
+            put_parquet(minio_client, MINIO_BUCKET_CLEAN, table_name, execution_date, valid,
+                        suffix="_clean", profile='clean')
+        if dedup_index:
+            dedup_index.commit()
+    if reasons:
+        logging.warning(f"{table_name}: quarantined {len(orphans)} rows with unknown keys {reasons}")
+    return {'rows_clean': len(valid), 'rows_orphan': len(orphans), 'reasons': reasons}
+
+def validate_references(**kwargs):
+    """Check every key of the day's clean facts against the clean dimensions, before aggregation and load."""
+    max_workers = kwargs.pop('max_workers', PIPELINE_MAX_WORKERS)
+    tables = kwargs.pop('tables', FACT_TABLES)
+    # The dimension indexes of this host are brought up to date once and shared by the facts
+    with stage('validate', 'dimension_indexes'):
+        refresh_lookup_indexes(get_minio_client(), MINIO_BUCKET_CLEAN, tables)
+    logging.info(f"Starting referential integrity checks ({len(tables)} tables, {max_workers} workers)")
+    summary = run_per_table(tables, validate_fact_table, max_workers=max_workers, **kwargs)
+    log_summary("referential integrity checks", summary)
+    raise_for_failures("referential integrity checks", summary)
+    return summary
 
 def aggregate_daily_data(**kwargs):
-    logging.info("Starting daily data aggregation")
+    """Compute the declared aggregates (src.aggregations) of the day's clean facts."""
     execution_date = kwargs['execution_date']
-    logging.info("Starting daily data aggregation")
+    names = kwargs.get('aggregates', list(AGGREGATES))
+    logging.info(f"Starting daily data aggregation: {names}")
 
-    df = load_data_from_minio("fact_consultation", execution_date=execution_date)
-    if type(df) == bool:
-        return "No consultation data to aggregate"
+    minio_client = get_minio_client()
+    ensure_bucket(minio_client, MINIO_BUCKET_AGGREGATED)
 
-    if "date_consultation" not in df.columns:
-        logging.warning("date_consultation column not found in fact_consultation")
-        return "Missing column"
+    nb_written = 0
+    for fact_table in FACT_TABLES:
+        if not aggregates_for(fact_table, names):
+            continue
+        date_column = DATE_COLUMN_MAPPING[fact_table]
+        with stage('aggregate', fact_table) as metrics:
+            df = load_data_from_minio(fact_table, execution_date=execution_date, bucket=MINIO_BUCKET_CLEAN,
+                                      suffix='_clean', columns=required_columns(fact_table, date_column, names))
+            if type(df) == bool:
+                logging.info(f"No {fact_table} data to aggregate on {execution_date}")
+                continue
+            metrics.add('rows', len(df))
+            with metrics.timer('query'):
+                dimensions = _load_dimension_attributes(required_dimensions(fact_table, names), execution_date)
+            for name, agg_df in compute_aggregates(fact_table, df, dimensions, date_column, names).items():
+                put_parquet(minio_client, MINIO_BUCKET_AGGREGATED, name, execution_date, agg_df,
+                            suffix="_agg", profile='aggregated')
+                nb_written += 1
 
-    agg_df = df.groupby("date_consultation").agg(
-        [pl.count().alias("nb_consultations")]
-    )
+    logging.info("Aggregation completed and saved")
+    return f"Saved {nb_written} aggregates for date {execution_date}"
 
-    parquet_buffer = io.BytesIO()
-    agg_df.write_parquet(parquet_buffer)
-    parquet_buffer.seek(0)
+def update_rolling_aggregates(**kwargs):
+    """Store the day's mergeable states and refresh the weekly, monthly and rolling windows containing it.
 
+    A backfilled or late day only rewrites its own state and the windows it
+    belongs to; no historical fact partition is read again.
+    """
+    execution_date = kwargs['execution_date']
+    day = execution_date.date() if isinstance(execution_date, datetime) else execution_date
+    names = kwargs.get('states', list(ROLLING_STATES))
     minio_client = get_minio_client()
-    if not minio_client.bucket_exists(MINIO_BUCKET_AGGREGATED):
-        minio_client.make_bucket(MINIO_BUCKET_AGGREGATED)
-
-    object_path = f"consultation_daily/consultation_{execution_date.strftime('%Y-%m-%d')}_agg.parquet"
-
-    minio_client.put_object(
-        bucket_name=MINIO_BUCKET_AGGREGATED,
-        object_name=object_path,
-        data=parquet_buffer,
-        length=parquet_buffer.getbuffer().nbytes,
-        content_type='application/octet-stream'
-    )
-    logging.info("Aggregation completed and saved")
-    return f"Aggregated data saved for date {execution_date}"
+    ensure_bucket(minio_client, MINIO_BUCKET_AGGREGATED)
 
-    
+    nb_windows = 0
+    for name in names:
+        fact_table = ROLLING_STATES[name]['fact']
+        with stage('aggregate', state_table(name)) as metrics:
+            df = load_data_from_minio(fact_table, execution_date=day, bucket=MINIO_BUCKET_CLEAN, suffix='_clean',
+                                      columns=rolling_required_columns(name, DATE_COLUMN_MAPPING[fact_table]))
+            if type(df) == bool:
+                logging.info(f"No {fact_table} data for the {name} state on {day}")
+                continue
+            metrics.add('rows', len(df))
+            put_parquet(minio_client, MINIO_BUCKET_AGGREGATED, state_table(name), day,
+                        compute_daily_state(name, df, day), suffix=STATE_SUFFIX, profile='aggregated')
+
+            first_day, last_day = window_range(day)
+            states = load_data_from_minio(state_table(name), start_date=first_day, end_date=last_day,
+                                          bucket=MINIO_BUCKET_AGGREGATED, suffix=STATE_SUFFIX)
+            for window, results in derive_windows(name, states, day).items():
+                for key_day, window_df in results:
+                    put_parquet(minio_client, MINIO_BUCKET_AGGREGATED, f"{name}_{window}", key_day, window_df,
+                                suffix="_agg", profile='aggregated')
+                    nb_windows += 1
+    return f"Updated {nb_windows} aggregate windows containing {day}"
 
 def insert_data_in_dim_tables(**kwargs):
+    """Load the cleaned dimensions of the day into the warehouse.
+
+    ``load_method`` 'merge' (default) upserts on the business key and only
+    rewrites changed rows, keeping SCD2 history for ``scd2_tables``; 'copy' and
+    'insert' append the rows as-is.
+    """
     execution_date = kwargs['execution_date']
-    logging.info("Starting insertion into dimension tables")
+    load_method = kwargs.get('load_method', 'merge')
+    batch_size = kwargs.get('batch_size', COPY_BATCH_SIZE)
+    scd2_tables = kwargs.get('scd2_tables', SCD2_TABLES)
+    logging.info(f"Starting insertion into dimension tables ({load_method})")
 
     minio_client = get_minio_client()
-    table_names = [
-        'dim_temps',
-        'dim_patient',
-        'dim_medecin',
-        'dim_etablissement',
-        'dim_diagnostic',
-        'dim_medicament'
-    ]
+    table_names = DIMENSION_TABLES
+    summary = {}
 
-    conn = psycopg2.connect(
-        dbname="sante_database",
-        user="postgres",
-        password="postgres",
-        host="postgres-prod",
-        port="5432"
-    )
-    cursor = conn.cursor()
-
-    for table in table_names:
-        object_path = f"{table}/{table}_{execution_date.strftime('%Y-%m-%d')}_clean.parquet"
-        try:
-            parquet_data = minio_client.get_object(MINIO_BUCKET_CLEAN, object_path)
-            df = pl.read_parquet(parquet_data)
-
-            # Insertion par ligne (à adapter à ton schéma)
-            rows = df.to_dicts()
-            for row in rows:
-                columns = ','.join(row.keys())
-                placeholders = ','.join(['%s'] * len(row))
-                values = list(row.values())
-                insert_query = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
-                cursor.execute(insert_query, values)
+    with postgres_connection(WAREHOUSE_CONN_ID) as conn:
+        cursor = conn.cursor()
 
-            conn.commit()
-            logging.info(f"Inserted cleaned data into {table}")
-        except Exception as e:
-            logging.error(f"Error inserting data into {table}: {e}")
-            conn.rollback()
+        for table in table_names:
+            try:
+                with stage('load', table) as metrics:
+                    df = read_partitions(minio_client, MINIO_BUCKET_CLEAN, table, execution_date, suffix="_clean")
+                    if df is None:
+                        logging.info(f"No cleaned data for {table} on {execution_date}")
+                        continue
+                    metrics.add('rows', len(df))
+
+                    with metrics.timer('query'):
+                        if load_method == 'merge':
+                            keys = CLEANING_RULES[table]['dedup_keys']
+                            history = table in scd2_tables
+                            ensure_merge_columns(cursor, table, keys, history=history)
+                            summary[table] = merge_dataframe(cursor, df, table, keys, history=history,
+                                                             valid_from=execution_date, batch_size=batch_size)
+                        else:
+                            summary[table] = {'inserted': load_dataframe(cursor, df, table, method=load_method,
+                                                                         batch_size=batch_size)}
+                        conn.commit()
+                logging.info(f"Loaded cleaned data into {table}: {summary[table]}")
+            except Exception as e:
+                logging.error(f"Error inserting data into {table}: {e}")
+                conn.rollback()
+
+        cursor.close()
 
-    cursor.close()
-    conn.close()
+    return f"Loaded dimension tables for {execution_date}: {summary}"
 
 
 def fact_pipeline(**kwargs):
-    logging.info("Starting fact tables pipeline")
-    fact_tables = [
-        'fact_consultation',
-        'fact_traitement',
-        'fact_analyse',
-        'fact_occupation_etablissement'
-    ]
-    for table in fact_tables:
-        extract_result = extract_table(table, **kwargs)
-        logging.info(extract_result)
-        clean_result = clean_data(table, **kwargs)
-        logging.info(clean_result)
+    return _run_pipeline("fact tables pipeline", FACT_TABLES, **kwargs)
+
+
+def load_fact_table(table_name, **kwargs):
+    """Load the clean facts of the day into the warehouse (``run_per_table`` worker)."""
+    execution_date = kwargs['execution_date']
+    batch_size = kwargs.get('batch_size', COPY_BATCH_SIZE)
+    with stage('load', table_name) as metrics:
+        df = read_partitions(get_minio_client(), MINIO_BUCKET_CLEAN, table_name, execution_date, suffix="_clean")
+        if df is None:
+            logging.info(f"No cleaned data for {table_name} on {execution_date}")
+            return {'rows_clean': 0}
+        metrics.add('rows', len(df))
+
+        with metrics.timer('query'), postgres_connection(WAREHOUSE_CONN_ID) as conn:
+            counts = load_fact(conn, table_name, df, batch_size=batch_size)
+            conn.commit()
+    return {'rows_clean': len(df), **counts}
+
+
+def insert_data_in_fact_tables(**kwargs):
+    """Load the four fact tables in parallel, once the dimensions of the day are in the warehouse."""
+    max_workers = kwargs.pop('max_workers', PIPELINE_MAX_WORKERS)
+    # Surrogate keys are resolved on this host's dimension indexes, brought up to date with the clean dimensions
+    with stage('load', 'dimension_indexes'):
+        refresh_lookup_indexes(get_minio_client(), MINIO_BUCKET_CLEAN, FACT_TABLES)
+    logging.info(f"Starting fact tables load ({len(FACT_TABLES)} tables, {max_workers} workers)")
+    summary = run_per_table(FACT_TABLES, load_fact_table, max_workers=max_workers, **kwargs)
+    log_summary("fact tables load", summary)
+    raise_for_failures("fact tables load", summary)
+    return summary
+
+
+def capture_changes(**kwargs):
+    """Drain the logical replication slot into the raw bucket, one micro-batch at a time.
+
+    Inserts and updates land in ``sante-data-raw`` minutes after being
+    committed on the source. The daily ``extract_table`` polling still feeds
+    the cleaning stage: the micro-batches are not registered in the manifests.
+    """
+    tables = kwargs.get('tables', DIMENSION_TABLES + FACT_TABLES)
+    max_changes = kwargs.get('max_changes', CDC_BATCH_CHANGES)
+    max_batches = kwargs.get('max_batches', 50)
+    minio_client = get_minio_client()
+    ensure_bucket(minio_client, MINIO_BUCKET_RAW)
+
+    totals = {}
+    with postgres_connection(SOURCE_CONN_ID) as connection:
+        ensure_cdc_slot(connection, tables)
+        for _ in range(max_batches):
+            counts = capture_batch(connection, minio_client, MINIO_BUCKET_RAW, tables, max_changes=max_changes)
+            if counts is None:
+                break
+            for table_name, nb_rows in counts.items():
+                totals[table_name] = totals.get(table_name, 0) + nb_rows
+    logging.info(f"Captured changes: {totals}")
+    return f"Captured {sum(totals.values())} changes from {len(totals)} tables"
+
+
+# Files merged by the monthly compaction: (bucket, tables, file name suffix, encoding profile).
+# Compacted raw files are only read back for replays, so they trade write speed for size.
+COMPACTION_TARGETS = [
+    (MINIO_BUCKET_RAW, DIMENSION_TABLES + FACT_TABLES, '', 'balanced'),
+    (MINIO_BUCKET_CLEAN, DIMENSION_TABLES + FACT_TABLES, '_clean', 'clean'),
+    (MINIO_BUCKET_AGGREGATED, list(AGGREGATES), '_agg', 'aggregated'),
+    (MINIO_BUCKET_AGGREGATED, [state_table(name) for name in ROLLING_STATES], STATE_SUFFIX, 'aggregated'),
+]
+
+def compact_partitions(**kwargs):
+    """Merge the daily files of the execution month into one monthly file per table and bucket."""
+    execution_date = kwargs['execution_date']
+    minio_client = get_minio_client()
+    nb_files = 0
+    for bucket, tables, suffix, profile in COMPACTION_TARGETS:
+        ensure_bucket(minio_client, bucket)
+        for table in tables:
+            result = compact_month(minio_client, bucket, table, execution_date.year, execution_date.month,
+                                   suffix, profile=profile)
+            nb_files += result['files']
+    return f"Compacted {nb_files} daily files for {execution_date.strftime('%Y-%m')}"
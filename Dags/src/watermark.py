@@ -0,0 +1,148 @@
+import logging
+from datetime import timedelta
+from typing import NamedTuple, Optional
+
+WATERMARK_TABLE = "etl_watermark"
+
+# Column used as high-watermark for each table. Dimensions are tracked by their
+# monotonically increasing id (their date columns are not load dates, e.g.
+# date_naissance), facts by their business date.
+WATERMARK_COLUMN_MAPPING = {
+    'dim_temps': 'temps_id',
+    'dim_patient': 'patient_id',
+    'dim_medecin': 'medecin_id',
+    'dim_etablissement': 'etablissement_id',
+    'dim_diagnostic': 'diagnostic_id',
+    'dim_medicament': 'medicament_id',
+    'fact_consultation': 'date_consultation',
+    'fact_traitement': 'date_traitement',
+    'fact_analyse': 'date_analyse',
+    'fact_occupation_etablissement': 'date_occupation'
+}
+
+
+class WatermarkWindow(NamedTuple):
+    table_name: str
+    column: str
+    run_date: str
+    low: Optional[str]
+    low_inclusive: bool
+    high: Optional[str]
+    query: str
+
+
+def ensure_watermark_table(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (
+                table_name TEXT NOT NULL,
+                run_date DATE NOT NULL,
+                watermark_column TEXT NOT NULL,
+                low_value TEXT,
+                low_inclusive BOOLEAN NOT NULL DEFAULT FALSE,
+                high_value TEXT,
+                updated_at TIMESTAMP NOT NULL DEFAULT now(),
+                PRIMARY KEY (table_name, run_date)
+            )
+        """)
+    connection.commit()
+
+
+def _range_predicate(column: str, low_inclusive: bool, upper_exclusive: bool) -> str:
+    # Plain comparisons on the raw column so Postgres can use its index
+    conditions = [f"{column} {'>=' if low_inclusive else '>'} %(low)s"]
+    if upper_exclusive:
+        conditions.append(f"{column} < %(upper)s")
+    return " AND ".join(conditions)
+
+
+def open_watermark_window(connection, table_name: str, execution_date) -> WatermarkWindow:
+    """Compute the range of rows to extract for ``table_name`` on ``execution_date``.
+
+    Tables tracked by a date extract their own day ``[D, D+1)`` up to its
+    latest value; a rerun of ``D`` computes that bound again, so it also
+    extracts the rows inserted for ``D`` since the previous run (late data)
+    and replaces the day's object with the complete day. Tables tracked by an
+    id extract the ids above the highest one recorded by any other run; a
+    rerun reuses the stored range, so it extracts exactly the same rows.
+    Runs of the same table are serialized by a transaction-level advisory lock,
+    held until :func:`commit_watermark` (or the rollback of a failed run), so
+    two active runs never extract the same ids. Nothing is persisted until
+    :func:`commit_watermark` is called.
+    """
+    column = WATERMARK_COLUMN_MAPPING[table_name]
+    run_date = execution_date.strftime('%Y-%m-%d')
+    is_date_column = not column.endswith('_id')
+    upper = (execution_date + timedelta(days=1)).strftime('%Y-%m-%d') if is_date_column else None
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"{WATERMARK_TABLE}:{table_name}",))
+        cursor.execute(
+            f"SELECT low_value, low_inclusive, high_value FROM {WATERMARK_TABLE} "
+            "WHERE table_name = %s AND run_date = %s",
+            (table_name, run_date)
+        )
+        recorded = cursor.fetchone()
+
+        if recorded is not None and not is_date_column:
+            low, low_inclusive, high = recorded
+            logging.info(f"Reusing recorded watermark range for {table_name} on {run_date}: ({low}, {high}]")
+        else:
+            if is_date_column:
+                # The run's own day only: runs of other days, whatever their order, never overlap
+                low, low_inclusive = run_date, True
+            else:
+                # Ids have no day: start after every id already extracted, by earlier or later runs
+                cursor.execute(
+                    f"SELECT max(high_value::bigint) FROM {WATERMARK_TABLE} "
+                    "WHERE table_name = %s AND run_date <> %s",
+                    (table_name, run_date)
+                )
+                previous = cursor.fetchone()[0]
+                low, low_inclusive = (str(previous), False) if previous is not None else (None, False)
+
+            if low is None:
+                cursor.execute(f"SELECT max({column}) FROM {table_name}")
+            else:
+                predicate = _range_predicate(column, low_inclusive, upper is not None)
+                cursor.execute(f"SELECT max({column}) FROM {table_name} WHERE {predicate}",
+                               {'low': low, 'upper': upper})
+            high = cursor.fetchone()[0]
+            high = str(high) if high is not None else low
+            if recorded is not None:
+                logging.info(f"Rerun of {table_name} on {run_date}: upper bound {recorded[2]} -> {high}")
+
+        if high is None or (high == low and not low_inclusive):
+            query = f"SELECT * FROM {table_name} WHERE false"
+        elif low is None:
+            query = cursor.mogrify(f"SELECT * FROM {table_name} WHERE {column} <= %(high)s",
+                                   {'high': high}).decode()
+        else:
+            predicate = _range_predicate(column, low_inclusive, False)
+            query = cursor.mogrify(f"SELECT * FROM {table_name} WHERE {predicate} AND {column} <= %(high)s",
+                                   {'low': low, 'high': high}).decode()
+
+    logging.info(f"Watermark window for {table_name} on {run_date}: {query}")
+    return WatermarkWindow(table_name, column, run_date, low, low_inclusive, high, query)
+
+
+def commit_watermark(connection, window: WatermarkWindow):
+    """Record ``window`` once its rows are safely stored; the upsert is a single transaction."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {WATERMARK_TABLE}
+                (table_name, run_date, watermark_column, low_value, low_inclusive, high_value)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (table_name, run_date) DO UPDATE SET
+                watermark_column = EXCLUDED.watermark_column,
+                low_value = EXCLUDED.low_value,
+                low_inclusive = EXCLUDED.low_inclusive,
+                high_value = EXCLUDED.high_value,
+                updated_at = now()
+            """,
+            (window.table_name, window.run_date, window.column,
+             window.low, window.low_inclusive, window.high)
+        )
+    connection.commit()
+    logging.info(f"Watermark for {window.table_name} advanced to {window.high}")
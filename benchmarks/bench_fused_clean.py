@@ -0,0 +1,44 @@
+"""Compare the split (raw upload -> download -> clean) and fused extract/clean modes.
+
+Both modes run against the same source day, Postgres and MinIO configured
+through the SANTE_* environment variables (see Dags/src/resources.py).
+
+Usage:
+    SANTE_PROD_DB_CONN_HOST=localhost SANTE_PROD_DB_CONN_PORT=5434 \
+    SANTE_MINIO_ENDPOINT=localhost:9000 \
+        python benchmarks/bench_fused_clean.py --date 2023-06-01 --repeat 3
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Dags"))
+from src.utils import DIMENSION_TABLES, FACT_TABLES, extract_and_clean  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--date", required=True, help="execution date, YYYY-MM-DD")
+    parser.add_argument("--tables", nargs="+", default=FACT_TABLES + DIMENSION_TABLES)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    execution_date = datetime.strptime(args.date, "%Y-%m-%d")
+
+    print(f"{'table':<32} {'mode':>6} {'rows':>10} {'median s':>10} {'min s':>8}")
+    for table in args.tables:
+        for fused in (False, True):
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                result = extract_and_clean(table, execution_date=execution_date, fused=fused)
+                timings.append(time.perf_counter() - start)
+            mode = "fused" if fused else "split"
+            print(f"{table:<32} {mode:>6} {result['rows_extracted']:>10} "
+                  f"{statistics.median(timings):>10.3f} {min(timings):>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Scaling of generer_fact_traitement: per-row pandas lookup vs. vectorized draws and gather.
+
+The per-row version (random.choice draws and one df.loc scan of the
+medication frame per treatment, O(N x M)) is reproduced here as the
+baseline; generator.generer_fact_traitement now draws with NumPy, so the
+two no longer produce the same rows for a seed.
+
+Usage:
+    python benchmarks/bench_generator_traitement.py --traitements 1000 10000 50000 --medicaments 150 1500 15000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+from faker import Faker
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "data_generator"))
+import generator  # noqa: E402
+
+
+def generer_fact_traitement_loc(df_temps, df_patient, df_medecin, df_medicament, df_diagnostic, nb_traitements):
+    traitement_data = []
+    temps_ids = df_temps['temps_id'].tolist()
+    patient_ids = df_patient['patient_id'].tolist()
+    medecin_ids = df_medecin['medecin_id'].tolist()
+    medicament_ids = df_medicament['medicament_id'].tolist()
+    diagnostic_ids = df_diagnostic['diagnostic_id'].tolist()
+    for i in range(1, nb_traitements + 1):
+        temps_id = random.choice(temps_ids)
+        patient_id = random.choice(patient_ids)
+        medecin_id = random.choice(medecin_ids)
+        medicament_id = random.choice(medicament_ids)
+        diagnostic_id = random.choice(diagnostic_ids) if random.random() > 0.1 else None
+        duree_jours = random.randint(1, 90)
+        prix_medicament = df_medicament.loc[df_medicament['medicament_id'] == medicament_id, 'prix'].values[0]
+        cout_total = round(prix_medicament * duree_jours * random.uniform(0.8, 1.2), 2)
+        traitement_data.append({
+            'traitement_id': i, 'temps_id': temps_id, 'patient_id': patient_id, 'medecin_id': medecin_id,
+            'medicament_id': medicament_id, 'diagnostic_id': diagnostic_id, 'duree_jours': duree_jours,
+            'cout_total': cout_total, 'efficacite': random.randint(1, 5),
+            'effets_secondaires': random.random() < 0.3
+        })
+    return pd.DataFrame(traitement_data)
+
+
+def chronometrer(fonction, dimensions, nb_traitements):
+    random.seed(42)
+    debut = time.perf_counter()
+    df = fonction(*dimensions, nb_traitements)
+    return time.perf_counter() - debut, df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--traitements", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--medicaments", type=int, nargs="+", default=[150, 1500, 15000])
+    parser.add_argument("--max-loc-cells", type=int, default=5 * 10 ** 8,
+                        help="skip the per-row baseline when traitements x medicaments exceeds this")
+    args = parser.parse_args()
+
+    Faker.seed(42)
+    random.seed(42)
+    df_temps = generator.generer_dim_temps(datetime(2020, 1, 1), datetime(2023, 12, 31))
+    df_patient = generator.generer_dim_patient(1000)
+    df_medecin = generator.generer_dim_medecin(100)
+    df_diagnostic = generator.generer_dim_diagnostic(200)
+
+    print(f"{'traitements':>12} {'medicaments':>12} {'loc s':>10} {'gather s':>10} {'speedup':>8}")
+    for nb_medicaments in args.medicaments:
+        df_medicament = generator.generer_dim_medicament(nb_medicaments)
+        dimensions = (df_temps, df_patient, df_medecin, df_medicament, df_diagnostic)
+        for nb_traitements in args.traitements:
+            temps_gather, df_gather = chronometrer(generator.generer_fact_traitement, dimensions, nb_traitements)
+            if nb_traitements * nb_medicaments <= args.max_loc_cells:
+                temps_loc, df_loc = chronometrer(generer_fact_traitement_loc, dimensions, nb_traitements)
+                assert len(df_loc) == len(df_gather)
+                assert df_gather['medicament_id'].isin(df_medicament['medicament_id']).all()
+                loc, speedup = f"{temps_loc:>10.3f}", f"{temps_loc / temps_gather:>7.1f}x"
+            else:
+                loc, speedup = f"{'-':>10}", f"{'-':>8}"
+            print(f"{nb_traitements:>12} {nb_medicaments:>12} {loc} {temps_gather:>10.3f} {speedup}")
+
+
+if __name__ == "__main__":
+    main()
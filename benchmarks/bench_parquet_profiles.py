@@ -0,0 +1,114 @@
+"""Write time, read time, file size and peak memory of each Parquet encoding profile.
+
+Representative fact and dimension frames are produced with the vectorized
+data generator, then written and read back in memory with every profile of
+Dags/src/encoding.py. Peak memory is the RSS growth above the level before
+the operation, sampled every few milliseconds (Linux /proc).
+
+Usage:
+    python benchmarks/bench_parquet_profiles.py --consultations 2000000 --repeat 3
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import threading
+import time
+
+import polars as pl
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Dags"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "data_generator"))
+from src.encoding import PARQUET_PROFILES, write_parquet  # noqa: E402
+import generateur_vectorise  # noqa: E402
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def rss_bytes():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * PAGE_SIZE
+
+
+class PeakRss:
+    """RSS growth above the level at entry, sampled in a background thread."""
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.peak = 0
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss_bytes() - self._baseline)
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._baseline = rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes() - self._baseline)
+
+
+def measure(df, profile, repeat):
+    write_times, read_times, write_peaks, read_peaks = [], [], [], []
+    for _ in range(repeat):
+        buffer = io.BytesIO()
+        with PeakRss() as peak:
+            start = time.perf_counter()
+            write_parquet(df, buffer, profile)
+            write_times.append(time.perf_counter() - start)
+        write_peaks.append(peak.peak)
+        size = buffer.getbuffer().nbytes
+
+        buffer.seek(0)
+        with PeakRss() as peak:
+            start = time.perf_counter()
+            pl.from_arrow(pq.read_table(buffer))
+            read_times.append(time.perf_counter() - start)
+        read_peaks.append(peak.peak)
+        del buffer
+    return {
+        'write_s': statistics.median(write_times),
+        'read_s': statistics.median(read_times),
+        'size': size,
+        'write_peak': max(write_peaks),
+        'read_peak': max(read_peaks),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--consultations", type=int, default=1_000_000)
+    parser.add_argument("--traitements", type=int, default=500_000)
+    parser.add_argument("--patients", type=int, default=200_000)
+    parser.add_argument("--profiles", nargs="+", default=list(PARQUET_PROFILES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    tables = generateur_vectorise.generer_tout(
+        args.seed, "2020-01-01", "2023-12-31", args.patients, 500, 50, 200, 1500,
+        args.consultations, args.traitements, 10, 30)
+    frames = {name: pl.from_pandas(tables[name])
+              for name in ('fact_consultation', 'fact_traitement', 'dim_patient', 'dim_medicament')}
+
+    print(f"{'table':<20} {'profile':<16} {'rows':>9} {'MiB':>8} {'write s':>8} {'read s':>8} "
+          f"{'write MiB':>10} {'read MiB':>9}")
+    for name, df in frames.items():
+        for profile in args.profiles:
+            result = measure(df, profile, args.repeat)
+            print(f"{name:<20} {profile:<16} {len(df):>9} {result['size'] / 2 ** 20:>8.1f} "
+                  f"{result['write_s']:>8.3f} {result['read_s']:>8.3f} "
+                  f"{result['write_peak'] / 2 ** 20:>10.1f} {result['read_peak'] / 2 ** 20:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
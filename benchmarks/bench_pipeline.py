@@ -0,0 +1,282 @@
+"""End-to-end benchmark of the pipeline stages against local Postgres and MinIO.
+
+For each scale factor the source database is seeded with the vectorized data
+generator, then extract, clean, validate, aggregate and the two warehouse loads run
+outside Airflow on one execution day, ``--repeat`` times, in the DAG's order.
+Every repeat starts from a freshly seeded state (seeding is not timed), so
+each run measures the same cold day rather than a replay of the previous one.
+Per stage the harness records the wall time, throughput (rows/s), latency
+percentiles of its per-table steps and peak RSS (both from
+Dags/src/instrumentation.py), and writes everything to a JSON file.
+
+With ``--baseline`` the results are compared to a previous JSON file: stages
+whose median wall time or peak memory grew by more than ``--tolerance`` are
+reported as regressions and the exit status is 1.
+
+Postgres and MinIO are configured with the SANTE_* variables of
+Dags/src/resources.py; an S3 mock speaking the S3 API (e.g. moto_server) can
+stand in for MinIO. Seeding truncates the source and warehouse tables and
+empties the sante-data-* buckets, so non-local hosts are refused unless
+--allow-remote is given.
+
+Usage:
+    SANTE_PROD_DB_CONN_HOST=localhost SANTE_PROD_DB_CONN_PORT=5434 \\
+    SANTE_ANALYTICS_DB_CONN_HOST=localhost SANTE_ANALYTICS_DB_CONN_PORT=5433 \\
+    SANTE_MINIO_ENDPOINT=localhost:9000 \\
+        python benchmarks/bench_pipeline.py --scale 0.1 1 --repeat 3 --output bench_main.json
+    python benchmarks/bench_pipeline.py --scale 0.1 1 --baseline bench_main.json --output bench_branch.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import polars as pl
+from minio.deleteobjects import DeleteObject
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Dags"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "data_generator"))
+from src.dimension_index import DIMENSION_INDEX_DIR  # noqa: E402
+from src.instrumentation import add_listener, remove_listener  # noqa: E402
+from src.resources import (SOURCE_CONN_ID, WAREHOUSE_CONN_ID, get_minio_client,  # noqa: E402
+                           minio_settings, postgres_connection, postgres_settings)
+from src.utils import (DATE_COLUMN_MAPPING, DIMENSION_TABLES, FACT_TABLES, MINIO_BUCKET_AGGREGATED,  # noqa: E402
+                       MINIO_BUCKET_CLEAN, MINIO_BUCKET_RAW, aggregate_daily_data, clean_data, extract_table,
+                       insert_data_in_dim_tables, insert_data_in_fact_tables, update_rolling_aggregates,
+                       validate_references)
+from src.warehouse import copy_dataframe, history_table  # noqa: E402
+from src.watermark import WATERMARK_TABLE, ensure_watermark_table  # noqa: E402
+import generateur_vectorise  # noqa: E402
+
+# Generated volumes at scale factor 1
+BASE_SIZES = {
+    'nb_patients': 100_000, 'nb_medecins': 5_000, 'nb_etablissements': 500, 'nb_diagnostics': 2_000,
+    'nb_medicaments': 1_500, 'nb_consultations': 1_000_000, 'nb_traitements': 500_000, 'nb_analyses': 500_000,
+}
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+_PG_TYPES = {
+    pl.Int8: "SMALLINT", pl.Int16: "SMALLINT", pl.Int32: "INTEGER", pl.Int64: "BIGINT",
+    pl.Float32: "REAL", pl.Float64: "DOUBLE PRECISION", pl.Boolean: "BOOLEAN",
+    pl.Date: "DATE", pl.Datetime: "TIMESTAMP", pl.Utf8: "TEXT",
+}
+
+
+def generate(scale: float, execution_date: datetime, days: int, seed: int) -> dict:
+    """The ten tables as Polars frames, ``days`` days of history ending on ``execution_date``."""
+    sizes = {name: max(int(size * scale), 5) for name, size in BASE_SIZES.items()}
+    tables = generateur_vectorise.generer_tout(
+        seed, execution_date - timedelta(days=days - 1), execution_date, sizes['nb_patients'],
+        sizes['nb_medecins'], sizes['nb_etablissements'], sizes['nb_diagnostics'], sizes['nb_medicaments'],
+        sizes['nb_consultations'], sizes['nb_traitements'], sizes['nb_analyses'], days)
+    frames = {name: pl.from_pandas(df) for name, df in tables.items()}
+    frames['dim_temps'] = frames['dim_temps'].with_columns([pl.col('date').cast(pl.Date)])
+    # The generator leaves the fact dates to the source schema: derive them from dim_temps
+    for fact_table in FACT_TABLES:
+        dates = frames['dim_temps'].select(['temps_id', pl.col('date').alias(DATE_COLUMN_MAPPING[fact_table])])
+        frames[fact_table] = frames[fact_table].join(dates, on='temps_id', how='left')
+    return frames
+
+
+def create_table_sql(table: str, df: pl.DataFrame) -> str:
+    columns = ', '.join(f"{name} {_PG_TYPES.get(dtype.base_type(), 'TEXT')}" for name, dtype in df.schema.items())
+    return f"CREATE TABLE IF NOT EXISTS {table} ({columns}, PRIMARY KEY ({df.columns[0]}))"
+
+
+def check_local(allow_remote: bool):
+    hosts = {postgres_settings(SOURCE_CONN_ID)['host'], postgres_settings(WAREHOUSE_CONN_ID)['host'],
+             minio_settings()['endpoint'].split(':')[0]}
+    remote = sorted(host for host in hosts if host not in LOCAL_HOSTS)
+    if remote and not allow_remote:
+        sys.exit(f"Refusing to reset non-local stores {remote} (use --allow-remote)")
+
+
+def seed(frames: dict):
+    """Reset the source, warehouse, buckets and local dimension indexes, then load the tables into the source."""
+    start = time.perf_counter()
+    tables = DIMENSION_TABLES + FACT_TABLES
+    with postgres_connection(SOURCE_CONN_ID) as connection:
+        ensure_watermark_table(connection)
+        with connection.cursor() as cursor:
+            for table in tables:
+                cursor.execute(create_table_sql(table, frames[table]))
+            cursor.execute(f"TRUNCATE {', '.join(tables)}")
+            cursor.execute(f"DELETE FROM {WATERMARK_TABLE} WHERE table_name = ANY(%s)", (tables,))
+            for table in tables:
+                copy_dataframe(cursor, frames[table], table)
+        connection.commit()
+
+    with postgres_connection(WAREHOUSE_CONN_ID) as connection:
+        with connection.cursor() as cursor:
+            for table in DIMENSION_TABLES:
+                cursor.execute(create_table_sql(table, frames[table]))
+                cursor.execute(f"DROP TABLE IF EXISTS {history_table(table)}")
+            cursor.execute(f"TRUNCATE {', '.join(DIMENSION_TABLES)}")
+            # Recreated, partitioned by month, by the fact load
+            for table in FACT_TABLES:
+                cursor.execute(f"DROP TABLE IF EXISTS {table} CASCADE")
+        connection.commit()
+
+    minio_client = get_minio_client()
+    for bucket in (MINIO_BUCKET_RAW, MINIO_BUCKET_CLEAN, MINIO_BUCKET_AGGREGATED):
+        if minio_client.bucket_exists(bucket):
+            objects = [DeleteObject(obj.object_name) for obj in minio_client.list_objects(bucket, recursive=True)]
+            for error in minio_client.remove_objects(bucket, objects):
+                print(f"Could not delete {error.name}: {error}")
+    shutil.rmtree(DIMENSION_INDEX_DIR, ignore_errors=True)
+    print(f"Seeded {sum(len(frames[table]) for table in tables)} rows in {time.perf_counter() - start:.1f}s")
+
+
+def stages(execution_date: datetime) -> list:
+    """(stage name, callable) in the order of Dags/dag.py."""
+    def extract():
+        for table in DIMENSION_TABLES:
+            extract_table(table, execution_date=execution_date, incremental=True)
+        for table in FACT_TABLES:
+            extract_table(table, execution_date=execution_date, incremental=True, extract_mode='stream')
+
+    def clean():
+        for table in DIMENSION_TABLES + FACT_TABLES:
+            clean_data(table, execution_date=execution_date)
+
+    def aggregate():
+        aggregate_daily_data(execution_date=execution_date)
+        update_rolling_aggregates(execution_date=execution_date)
+
+    return [
+        ('extract', extract),
+        ('clean', clean),
+        ('validate', lambda: validate_references(execution_date=execution_date)),
+        ('aggregate', aggregate),
+        ('load_dimensions', lambda: insert_data_in_dim_tables(execution_date=execution_date)),
+        ('load_facts', lambda: insert_data_in_fact_tables(execution_date=execution_date)),
+    ]
+
+
+def percentiles(values) -> dict:
+    if not values:
+        return {}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {'p50': float(p50), 'p90': float(p90), 'p99': float(p99), 'max': float(max(values))}
+
+
+def run_scale(scale: float, args) -> dict:
+    execution_date = datetime.strptime(args.date, "%Y-%m-%d")
+    frames = generate(scale, execution_date, args.days, args.seed)
+
+    steps = []
+    add_listener(steps.append)
+    results = {}
+    try:
+        for repeat in range(args.repeat):
+            # Watermarks, clean objects, dedup keys and warehouse rows of the previous run would turn
+            # this one into a no-op replay
+            seed(frames)
+            for name, function in stages(execution_date):
+                steps.clear()
+                start = time.perf_counter()
+                function()
+                wall = time.perf_counter() - start
+                rows = sum(step.counters['rows'] for step in steps)
+                stage = results.setdefault(name, {'runs': [], 'step_seconds': []})
+                stage['runs'].append({
+                    'wall_s': wall, 'rows': rows, 'rows_per_s': rows / wall if wall > 0 else 0.0,
+                    'bytes_in': sum(step.counters['bytes_in'] for step in steps),
+                    'bytes_out': sum(step.counters['bytes_out'] for step in steps),
+                    'peak_rss_bytes': max((step.peak_rss for step in steps), default=0),
+                    'failed_steps': [step.table for step in steps if step.failed],
+                })
+                stage['step_seconds'] += [step.seconds for step in steps]
+                print(f"scale {scale:<6} run {repeat + 1}/{args.repeat} {name:<16} {wall:>8.2f}s "
+                      f"{rows:>10} rows {rows / wall if wall > 0 else 0:>12.0f} rows/s")
+    finally:
+        remove_listener(steps.append)
+
+    for stage in results.values():
+        runs = stage['runs']
+        stage['wall_s'] = float(np.median([run['wall_s'] for run in runs]))
+        stage['rows_per_s'] = float(np.median([run['rows_per_s'] for run in runs]))
+        stage['peak_rss_bytes'] = max(run['peak_rss_bytes'] for run in runs)
+        stage['step_latency_s'] = percentiles(stage.pop('step_seconds'))
+    return {'scale': scale, 'source_rows': {table: len(df) for table, df in frames.items()}, 'stages': results}
+
+
+def compare(results: list, baseline: dict, tolerance: float) -> list:
+    """Stages slower or heavier than the baseline run of the same scale by more than ``tolerance``."""
+    previous = {result['scale']: result['stages'] for result in baseline['results']}
+    regressions = []
+    for result in results:
+        for name, stage in result['stages'].items():
+            reference = previous.get(result['scale'], {}).get(name)
+            if reference is None:
+                continue
+            for metric in ('wall_s', 'peak_rss_bytes'):
+                if reference[metric] and stage[metric] > reference[metric] * (1 + tolerance):
+                    regressions.append({'scale': result['scale'], 'stage': name, 'metric': metric,
+                                        'baseline': reference[metric], 'current': stage[metric],
+                                        'ratio': stage[metric] / reference[metric]})
+    return regressions
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, nargs="+", default=[0.1])
+    parser.add_argument("--date", default="2023-06-30", help="execution date, YYYY-MM-DD")
+    parser.add_argument("--days", type=int, default=30, help="days of generated history ending on --date")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_pipeline.json")
+    parser.add_argument("--baseline", help="previous result file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed slowdown, 0.10 = +10%%")
+    parser.add_argument("--allow-remote", action="store_true")
+    args = parser.parse_args()
+    check_local(args.allow_remote)
+
+    document = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'polars': pl.__version__,
+        'cpu_count': os.cpu_count(),
+        'parameters': {'date': args.date, 'days': args.days, 'repeat': args.repeat, 'seed': args.seed},
+        'results': [run_scale(scale, args) for scale in args.scale],
+    }
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(document['results'], json.load(baseline), args.tolerance)
+        document['baseline'] = {'file': args.baseline, 'tolerance': args.tolerance, 'regressions': regressions}
+
+    with open(args.output, "w") as output:
+        json.dump(document, output, indent=2)
+    print(f"Results written to {args.output}")
+
+    print(f"\n{'scale':>6} {'stage':<16} {'wall s':>8} {'rows/s':>12} {'p50 s':>8} {'p99 s':>8} {'peak MiB':>9}")
+    for result in document['results']:
+        for name, stage in result['stages'].items():
+            latency = stage['step_latency_s']
+            print(f"{result['scale']:>6} {name:<16} {stage['wall_s']:>8.2f} {stage['rows_per_s']:>12.0f} "
+                  f"{latency.get('p50', 0):>8.3f} {latency.get('p99', 0):>8.3f} "
+                  f"{stage['peak_rss_bytes'] / 2 ** 20:>9.0f}")
+    for regression in regressions:
+        print(f"REGRESSION scale {regression['scale']} {regression['stage']} {regression['metric']}: "
+              f"{regression['baseline']:.3g} -> {regression['current']:.3g} (x{regression['ratio']:.2f})")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Chargement en masse des tables générées dans PostgreSQL.
+
+``COPY FROM STDIN`` est utilisé par défaut, ``execute_values`` en repli. Les
+dimensions (indépendantes entre elles) sont chargées en parallèle sur des
+connexions distinctes, puis les faits. Les index secondaires et les clés
+étrangères peuvent être supprimés pendant le chargement et recréés ensuite.
+"""
+
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+from psycopg2 import extras
+
+NULL_COPY = r'\N'
+TAILLE_LOT_VALUES = 10000
+
+
+def _preparer(df):
+    """Colonnes d'ids flottantes (créées par des None) repassées en entiers nullables."""
+    df = df.copy(deep=False)
+    for colonne in df.columns:
+        if colonne.endswith('_id') and df[colonne].dtype.kind == 'f':
+            df[colonne] = df[colonne].astype('Int64')
+    return df
+
+
+def copier_dataframe(conn, df, table_name):
+    """Charge ``df`` avec COPY ... FORMAT csv ; la transaction est validée par l'appelant."""
+    tampon = io.StringIO()
+    _preparer(df).to_csv(tampon, index=False, header=False, na_rep=NULL_COPY)
+    tampon.seek(0)
+    colonnes = ', '.join(df.columns)
+    with conn.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table_name} ({colonnes}) FROM STDIN WITH (FORMAT csv, NULL '{NULL_COPY}')", tampon)
+
+
+def inserer_execute_values(conn, df, table_name):
+    """Repli sans COPY : INSERT multi-lignes par lots avec execute_values."""
+    df = _preparer(df).astype(object)
+    df = df.where(df.notna(), None)
+    colonnes = ', '.join(df.columns)
+    with conn.cursor() as cursor:
+        extras.execute_values(cursor, f"INSERT INTO {table_name} ({colonnes}) VALUES %s",
+                              df.itertuples(index=False, name=None), page_size=TAILLE_LOT_VALUES)
+
+
+def charger_table(get_connection, df, table_name, methode='copy'):
+    """Charge une table sur sa propre connexion et renvoie ses statistiques de débit."""
+    conn = get_connection()
+    if conn is None:
+        raise RuntimeError(f"Pas de connexion pour charger {table_name}")
+    debut = time.perf_counter()
+    try:
+        if methode == 'copy':
+            try:
+                copier_dataframe(conn, df, table_name)
+            except Exception as e:
+                print(f"COPY impossible pour {table_name} ({e}), repli sur execute_values")
+                conn.rollback()
+                methode = 'execute_values'
+                inserer_execute_values(conn, df, table_name)
+        else:
+            inserer_execute_values(conn, df, table_name)
+        conn.commit()
+    finally:
+        conn.close()
+    duree = time.perf_counter() - debut
+    return {'table': table_name, 'methode': methode, 'lignes': len(df), 'secondes': duree,
+            'lignes_par_seconde': len(df) / duree if duree > 0 else float('inf')}
+
+
+@contextmanager
+def contraintes_differees(conn, tables):
+    """Supprime les clés étrangères et index secondaires de ``tables`` puis les recrée en sortie.
+
+    Les clés primaires et contraintes d'unicité sont conservées. La recréation
+    des clés étrangères revalide toutes les lignes chargées.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid)
+            FROM pg_constraint
+            WHERE contype = 'f' AND conrelid::regclass::text = ANY(%s)
+        """, (list(tables),))
+        cles_etrangeres = cursor.fetchall()
+        cursor.execute("""
+            SELECT i.indexname, i.indexdef
+            FROM pg_indexes i
+            WHERE i.tablename = ANY(%s)
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conname = i.indexname)
+        """, (list(tables),))
+        index = cursor.fetchall()
+
+        for table, nom, _ in cles_etrangeres:
+            cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {nom}")
+        for nom, _ in index:
+            cursor.execute(f"DROP INDEX {nom}")
+    conn.commit()
+    print(f"{len(cles_etrangeres)} clés étrangères et {len(index)} index différés")
+
+    try:
+        yield
+    finally:
+        debut = time.perf_counter()
+        with conn.cursor() as cursor:
+            for _, definition in index:
+                cursor.execute(definition)
+            for table, nom, definition in cles_etrangeres:
+                cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {nom} {definition}")
+        conn.commit()
+        print(f"Index et clés étrangères recréés en {time.perf_counter() - debut:.1f}s")
+
+
+def _charger_en_parallele(get_connection, tables, methode, paralleles):
+    with ThreadPoolExecutor(max_workers=max(1, paralleles)) as executor:
+        futures = [executor.submit(charger_table, get_connection, df, nom, methode) for nom, df in tables.items()]
+        return [future.result() for future in futures]
+
+
+def charger_tables(get_connection, tables, methode='copy', paralleles=4, differer_index=False):
+    """Charge les dimensions en parallèle, puis les faits, et affiche le débit de chaque table."""
+    dimensions = {nom: df for nom, df in tables.items() if nom.startswith('dim_')}
+    faits = {nom: df for nom, df in tables.items() if not nom.startswith('dim_')}
+
+    debut = time.perf_counter()
+    conn = get_connection()
+    try:
+        with contraintes_differees(conn, tables) if differer_index else nullcontext():
+            # Les faits référencent les dimensions : ils sont chargés une fois celles-ci terminées
+            statistiques = (_charger_en_parallele(get_connection, dimensions, methode, paralleles)
+                            + _charger_en_parallele(get_connection, faits, methode, paralleles))
+    finally:
+        conn.close()
+
+    for stats in statistiques:
+        print(f"{stats['table']:<32} {stats['methode']:<15} {stats['lignes']:>12} lignes "
+              f"{stats['secondes']:>8.2f}s {stats['lignes_par_seconde']:>12.0f} lignes/s")
+    total_lignes = sum(stats['lignes'] for stats in statistiques)
+    duree = time.perf_counter() - debut
+    print(f"Total : {total_lignes} lignes en {duree:.1f}s ({total_lignes / duree:.0f} lignes/s)")
+    return statistiques
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Moteur de génération vectorisé (NumPy) pour les tests de charge.
+
+Chaque colonne est produite d'un bloc à partir d'un ``numpy.random.Generator``
+initialisé avec une graine : le même ``seed`` donne exactement les mêmes
+tables. Les valeurs textuelles (noms, villes, ...) sont tirées dans des
+réservoirs pré-échantillonnés une seule fois avec Faker.
+"""
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from faker import Faker
+
+GROUPES_SANGUINS = np.array(['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-'])
+SPECIALITES = np.array([
+    'Médecine générale', 'Cardiologie', 'Dermatologie', 'Gastro-entérologie',
+    'Neurologie', 'Ophtalmologie', 'Pédiatrie', 'Psychiatrie', 'Radiologie',
+    'Chirurgie', 'Gynécologie', 'Orthopédie', 'ORL', 'Urologie', 'Endocrinologie'
+])
+TYPES_ETABLISSEMENT = np.array([
+    'Hôpital public', 'Clinique privée', 'Centre médical', 'EHPAD',
+    'Centre de rééducation', 'Maternité', 'Centre psychiatrique'
+])
+PREFIXES_ETABLISSEMENT = np.array(['Centre Hospitalier', 'Clinique', 'Hôpital', 'Institut'])
+CATEGORIES_DIAGNOSTIC = {
+    'A': ('Maladies infectieuses et parasitaires', ['Infections intestinales', 'Tuberculose', 'Infections bactériennes']),
+    'C': ('Tumeurs malignes', ['Tumeurs malignes digestives', 'Tumeurs malignes respiratoires', 'Mélanome']),
+    'E': ('Maladies endocriniennes, nutritionnelles et métaboliques', ['Diabète', 'Obésité', 'Troubles métaboliques']),
+    'F': ('Troubles mentaux et du comportement', ['Troubles anxieux', 'Dépression', 'Troubles bipolaires']),
+    'G': ('Maladies du système nerveux', ['Épilepsie', 'Migraines', 'Parkinson']),
+    'I': ('Maladies de l\'appareil circulatoire', ['Hypertension', 'Infarctus', 'AVC']),
+    'J': ('Maladies de l\'appareil respiratoire', ['Pneumonie', 'Asthme', 'BPCO']),
+    'K': ('Maladies de l\'appareil digestif', ['Ulcère gastrique', 'Appendicite', 'Cirrhose']),
+    'M': ('Maladies du système ostéo-articulaire, des muscles et du tissu conjonctif', ['Arthrose', 'Lombalgie', 'Ostéoporose']),
+    'R': ('Symptômes, signes et résultats anormaux d\'examens cliniques et de laboratoire', ['Douleur', 'Fièvre', 'Malaise'])
+}
+FORMES = np.array(['comprimé', 'gélule', 'sirop', 'solution injectable', 'pommade', 'patch', 'spray'])
+CATEGORIES_THERAPEUTIQUES = np.array([
+    'Analgésique', 'Antibiotique', 'Antidépresseur', 'Antihypertenseur',
+    'Anti-inflammatoire', 'Antihistaminique', 'Anxiolytique', 'Corticoïde',
+    'Diurétique', 'Hypnotique', 'Immunosuppresseur', 'Neuroleptique'
+])
+PREFIXES_MEDICAMENT = np.array(['Abi', 'Acti', 'Allo', 'Bio', 'Cardi', 'Derm', 'Endo', 'Fibro', 'Gastro', 'Hemo',
+                                'Immuno', 'Kine', 'Lipo', 'Myco', 'Neuro', 'Onco', 'Pneumo', 'Reno', 'Thrombo'])
+SUFFIXES_MEDICAMENT = np.array(['al', 'ine', 'ol', 'one', 'ium', 'ax', 'ex', 'ix', 'ox', 'um', 'an', 'en', 'on', 'in', 'il'])
+DOSAGES = np.array([5, 10, 20, 25, 50, 100, 200, 250, 500, 1000])
+UNITES = np.array(['mg', 'mcg', 'g', 'ml'])
+TYPES_ANALYSE = np.array([
+    'Analyse sanguine', 'Radiographie', 'Scanner', 'IRM', 'Échographie',
+    'Électrocardiogramme', 'Test d\'effort', 'Endoscopie', 'Biopsie',
+    'Test allergologique', 'Analyse d\'urine', 'Spirométrie'
+])
+
+TAILLE_RESERVOIR = 2000
+
+
+class ReservoirsFaker:
+    """Valeurs Faker tirées une seule fois, puis réutilisées par indexation NumPy."""
+
+    def __init__(self, seed, taille=TAILLE_RESERVOIR):
+        fake = Faker(['fr_FR'])
+        fake.seed_instance(seed)
+        self.noms = np.array([fake.last_name() for _ in range(taille)])
+        self.prenoms_hommes = np.array([fake.first_name_male() for _ in range(taille)])
+        self.prenoms_femmes = np.array([fake.first_name_female() for _ in range(taille)])
+        self.prenoms = np.concatenate([self.prenoms_hommes, self.prenoms_femmes])
+        self.villes = np.array([fake.city() for _ in range(taille)])
+        self.codes_postaux = np.array([fake.postcode() for _ in range(taille)])
+        self.phrases = np.array([fake.sentence(nb_words=6) for _ in range(taille)])
+
+
+def _chiffres(rng, n, nb_chiffres):
+    """Chaînes de ``nb_chiffres`` chiffres aléatoires (équivalent de fake.numerify)."""
+    valeurs = rng.integers(0, 10 ** nb_chiffres, n, dtype=np.int64)
+    return np.char.zfill(valeurs.astype(str), nb_chiffres)
+
+
+def _ids_optionnels(rng, ids, n, taux_absent):
+    """Tire ``n`` ids dans ``ids`` dont une proportion ``taux_absent`` est manquante (NULL)."""
+    valeurs = rng.choice(ids, n)
+    absents = rng.random(n) <= taux_absent
+    return pd.arrays.IntegerArray(valeurs.astype(np.int64), absents)
+
+
+def generer_dim_temps(date_debut, date_fin):
+    """Génère la dimension temps en une seule opération sur un index de dates."""
+    dates = pd.date_range(date_debut, date_fin, freq='D')
+    return pd.DataFrame({
+        'temps_id': np.arange(1, len(dates) + 1, dtype=np.int32),
+        'date': dates,
+        'jour': dates.day,
+        'mois': dates.month,
+        'annee': dates.year,
+        'trimestre': dates.quarter,
+        'semaine_annee': dates.isocalendar().week.to_numpy(dtype=np.int32),
+        'est_weekend': dates.weekday >= 5
+    })
+
+
+def generer_dim_patient(rng, reservoirs, nb_patients, date_reference):
+    """Génère la dimension patient ; l'âge est calculé à ``date_reference`` pour rester reproductible."""
+    reference = pd.Timestamp(date_reference).normalize()
+    jours = rng.integers(365, 100 * 365, nb_patients)
+    naissances = reference - pd.to_timedelta(jours, unit='D')
+    anniversaire_passe = (naissances.month < reference.month) | (
+        (naissances.month == reference.month) & (naissances.day <= reference.day))
+    ages = reference.year - naissances.year - (~anniversaire_passe).astype(int)
+
+    sexes = rng.choice(np.array(['M', 'F']), nb_patients)
+    hommes = sexes == 'M'
+    prenoms = np.where(hommes,
+                       reservoirs.prenoms_hommes[rng.integers(0, len(reservoirs.prenoms_hommes), nb_patients)],
+                       reservoirs.prenoms_femmes[rng.integers(0, len(reservoirs.prenoms_femmes), nb_patients)])
+
+    return pd.DataFrame({
+        'patient_id': np.arange(1, nb_patients + 1, dtype=np.int32),
+        'numero_securite_sociale': np.char.add(_chiffres(rng, nb_patients, 12), np.where(hommes, '1', '2')),
+        'nom': rng.choice(reservoirs.noms, nb_patients),
+        'prenom': prenoms,
+        'date_naissance': naissances.date,
+        'age': np.asarray(ages, dtype=np.int32),
+        'sexe': sexes,
+        'groupe_sanguin': rng.choice(GROUPES_SANGUINS, nb_patients),
+        'ville': rng.choice(reservoirs.villes, nb_patients),
+        'code_postal': rng.choice(reservoirs.codes_postaux, nb_patients),
+        'pays': 'France'
+    })
+
+
+def generer_dim_medecin(rng, reservoirs, nb_medecins):
+    """Génère la dimension médecin."""
+    return pd.DataFrame({
+        'medecin_id': np.arange(1, nb_medecins + 1, dtype=np.int32),
+        'nom': rng.choice(reservoirs.noms, nb_medecins),
+        'prenom': rng.choice(reservoirs.prenoms, nb_medecins),
+        'specialite': rng.choice(SPECIALITES, nb_medecins),
+        'numero_rpps': _chiffres(rng, nb_medecins, 10),
+        'experience_annees': rng.integers(1, 41, nb_medecins, dtype=np.int32)
+    })
+
+
+def generer_dim_etablissement(rng, reservoirs, nb_etablissements):
+    """Génère la dimension établissement."""
+    villes = rng.choice(reservoirs.villes, nb_etablissements)
+    prefixes = rng.choice(PREFIXES_ETABLISSEMENT, nb_etablissements)
+    return pd.DataFrame({
+        'etablissement_id': np.arange(1, nb_etablissements + 1, dtype=np.int32),
+        'nom': np.char.add(np.char.add(prefixes, ' '), villes),
+        'type': rng.choice(TYPES_ETABLISSEMENT, nb_etablissements),
+        'capacite_lits': rng.integers(20, 1001, nb_etablissements, dtype=np.int32),
+        'ville': villes,
+        'code_postal': rng.choice(reservoirs.codes_postaux, nb_etablissements),
+        'pays': 'France'
+    })
+
+
+def generer_dim_diagnostic(rng, reservoirs, nb_diagnostics):
+    """Génère la dimension diagnostic (codes CIM-10)."""
+    codes_categorie = np.array(list(CATEGORIES_DIAGNOSTIC.keys()))
+    libelles = np.array([libelle for libelle, _ in CATEGORIES_DIAGNOSTIC.values()])
+    # Toutes les catégories ont 3 sous-catégories : tableau (catégorie, sous-catégorie)
+    sous_categories = np.array([sous for _, sous in CATEGORIES_DIAGNOSTIC.values()])
+
+    categorie_idx = rng.integers(0, len(codes_categorie), nb_diagnostics)
+    sous_idx = rng.integers(0, sous_categories.shape[1], nb_diagnostics)
+    sous_categorie = sous_categories[categorie_idx, sous_idx]
+    code_num = np.char.add(np.char.add(_chiffres(rng, nb_diagnostics, 2), '.'), _chiffres(rng, nb_diagnostics, 1))
+
+    return pd.DataFrame({
+        'diagnostic_id': np.arange(1, nb_diagnostics + 1, dtype=np.int32),
+        'code_cim10': np.char.add(codes_categorie[categorie_idx], code_num),
+        'description': np.char.add(np.char.add(sous_categorie, ' - '), rng.choice(reservoirs.phrases, nb_diagnostics)),
+        'categorie': libelles[categorie_idx],
+        'sous_categorie': sous_categorie
+    })
+
+
+def generer_dim_medicament(rng, nb_medicaments):
+    """Génère la dimension médicament."""
+    dosages = np.char.add(np.char.add(rng.choice(DOSAGES, nb_medicaments).astype(str), ' '),
+                          rng.choice(UNITES, nb_medicaments))
+    return pd.DataFrame({
+        'medicament_id': np.arange(1, nb_medicaments + 1, dtype=np.int32),
+        'nom': np.char.add(rng.choice(PREFIXES_MEDICAMENT, nb_medicaments), rng.choice(SUFFIXES_MEDICAMENT, nb_medicaments)),
+        'forme': rng.choice(FORMES, nb_medicaments),
+        'dosage': dosages,
+        'prix': np.round(rng.uniform(1.5, 150.0, nb_medicaments), 2),
+        'categorie_therapeutique': rng.choice(CATEGORIES_THERAPEUTIQUES, nb_medicaments)
+    })
+
+
+def generer_dimensions(rng, reservoirs, date_debut, date_fin, nb_patients, nb_medecins,
+                       nb_etablissements, nb_diagnostics, nb_medicaments):
+    """Génère les six dimensions ; renvoie un dictionnaire nom de table -> DataFrame."""
+    return {
+        'dim_temps': generer_dim_temps(date_debut, date_fin),
+        'dim_patient': generer_dim_patient(rng, reservoirs, nb_patients, date_fin),
+        'dim_medecin': generer_dim_medecin(rng, reservoirs, nb_medecins),
+        'dim_etablissement': generer_dim_etablissement(rng, reservoirs, nb_etablissements),
+        'dim_diagnostic': generer_dim_diagnostic(rng, reservoirs, nb_diagnostics),
+        'dim_medicament': generer_dim_medicament(rng, nb_medicaments)
+    }
+
+
+# Générateurs de faits : ``id_debut`` permet de produire une table par lots successifs
+def generer_fact_consultation(rng, dimensions, nb_consultations, id_debut=1):
+    """Génère ``nb_consultations`` consultations en tirages vectorisés."""
+    n = nb_consultations
+    return pd.DataFrame({
+        'consultation_id': np.arange(id_debut, id_debut + n, dtype=np.int64),
+        'temps_id': rng.choice(dimensions['dim_temps']['temps_id'].to_numpy(), n),
+        'patient_id': rng.choice(dimensions['dim_patient']['patient_id'].to_numpy(), n),
+        'medecin_id': rng.choice(dimensions['dim_medecin']['medecin_id'].to_numpy(), n),
+        'etablissement_id': rng.choice(dimensions['dim_etablissement']['etablissement_id'].to_numpy(), n),
+        'diagnostic_id': _ids_optionnels(rng, dimensions['dim_diagnostic']['diagnostic_id'].to_numpy(), n, 0.1),
+        'duree_minutes': rng.integers(10, 121, n, dtype=np.int32),
+        'cout': np.round(rng.uniform(25, 200, n), 2),
+        'urgence': rng.random(n) < 0.2,
+        'satisfaction_patient': rng.integers(1, 6, n, dtype=np.int8)
+    })
+
+
+def generer_fact_traitement(rng, dimensions, nb_traitements, id_debut=1):
+    """Génère les traitements ; le prix du médicament est obtenu par indexation (gather)."""
+    n = nb_traitements
+    medicaments = dimensions['dim_medicament']
+    medicament_ids = medicaments['medicament_id'].to_numpy()
+    position = rng.integers(0, len(medicament_ids), n)
+    duree_jours = rng.integers(1, 91, n, dtype=np.int32)
+    prix = medicaments['prix'].to_numpy()[position]
+    return pd.DataFrame({
+        'traitement_id': np.arange(id_debut, id_debut + n, dtype=np.int64),
+        'temps_id': rng.choice(dimensions['dim_temps']['temps_id'].to_numpy(), n),
+        'patient_id': rng.choice(dimensions['dim_patient']['patient_id'].to_numpy(), n),
+        'medecin_id': rng.choice(dimensions['dim_medecin']['medecin_id'].to_numpy(), n),
+        'medicament_id': medicament_ids[position],
+        'diagnostic_id': _ids_optionnels(rng, dimensions['dim_diagnostic']['diagnostic_id'].to_numpy(), n, 0.1),
+        'duree_jours': duree_jours,
+        'cout_total': np.round(prix * duree_jours * rng.uniform(0.8, 1.2, n), 2),
+        'efficacite': rng.integers(1, 6, n, dtype=np.int8),
+        'effets_secondaires': rng.random(n) < 0.3
+    })
+
+
+def generer_fact_analyse(rng, dimensions, nb_analyses, id_debut=1):
+    """Génère les analyses."""
+    n = nb_analyses
+    return pd.DataFrame({
+        'analyse_id': np.arange(id_debut, id_debut + n, dtype=np.int64),
+        'temps_id': rng.choice(dimensions['dim_temps']['temps_id'].to_numpy(), n),
+        'patient_id': rng.choice(dimensions['dim_patient']['patient_id'].to_numpy(), n),
+        'etablissement_id': rng.choice(dimensions['dim_etablissement']['etablissement_id'].to_numpy(), n),
+        'type_analyse': rng.choice(TYPES_ANALYSE, n),
+        'resultat_anormal': rng.random(n) < 0.25,
+        'cout': np.round(rng.uniform(20, 1000, n), 2),
+        'delai_resultat_heures': rng.integers(1, 169, n, dtype=np.int16)
+    })
+
+
+def generer_fact_occupation_etablissement(rng, dimensions, nb_occupations, id_debut=1):
+    """Génère l'occupation : ``nb_occupations`` dates distinctes par établissement."""
+    temps_ids = dimensions['dim_temps']['temps_id'].to_numpy()
+    etablissements = dimensions['dim_etablissement']
+    etablissement_ids = etablissements['etablissement_id'].to_numpy()
+    capacites = etablissements['capacite_lits'].to_numpy()
+    nb_dates = min(nb_occupations, len(temps_ids))
+
+    # Tirage sans remise par établissement : permutation de chaque ligne puis troncature
+    dates = rng.permuted(np.tile(temps_ids, (len(etablissement_ids), 1)), axis=1)[:, :nb_dates].ravel()
+    etablissement_idx = np.repeat(np.arange(len(etablissement_ids)), nb_dates)
+    n = len(dates)
+
+    admissions = (capacites[etablissement_idx] * rng.uniform(0.05, 0.2, n)).astype(np.int32)
+    sorties = (admissions * rng.uniform(0.8, 1.2, n)).astype(np.int32)
+    return pd.DataFrame({
+        'occupation_id': np.arange(id_debut, id_debut + n, dtype=np.int64),
+        'temps_id': dates,
+        'etablissement_id': etablissement_ids[etablissement_idx],
+        'taux_occupation': np.round(rng.uniform(0.3, 0.95, n), 2),
+        'nombre_admissions': admissions,
+        'nombre_sorties': sorties,
+        'duree_moyenne_sejour': np.round(rng.uniform(1, 15, n), 2)
+    })
+
+
+def generer_tout(seed, date_debut, date_fin, nb_patients, nb_medecins, nb_etablissements, nb_diagnostics,
+                 nb_medicaments, nb_consultations, nb_traitements, nb_analyses, nb_occupations_par_etablissement):
+    """Génère les dix tables de façon reproductible pour une graine donnée."""
+    rng = np.random.default_rng(seed)
+    reservoirs = ReservoirsFaker(seed)
+    tables = generer_dimensions(rng, reservoirs, date_debut, date_fin, nb_patients, nb_medecins,
+                                nb_etablissements, nb_diagnostics, nb_medicaments)
+    tables['fact_consultation'] = generer_fact_consultation(rng, tables, nb_consultations)
+    tables['fact_traitement'] = generer_fact_traitement(rng, tables, nb_traitements)
+    tables['fact_analyse'] = generer_fact_analyse(rng, tables, nb_analyses)
+    tables['fact_occupation_etablissement'] = generer_fact_occupation_etablissement(
+        rng, tables, nb_occupations_par_etablissement)
+    return tables
+
+
+if __name__ == "__main__":
+    debut = datetime.now()
+    tables = generer_tout(42, datetime(2020, 1, 1), datetime(2023, 12, 31), 100000, 5000, 500, 2000, 1500,
+                          10_000_000, 5_000_000, 5_000_000, 365)
+    for nom, df in tables.items():
+        print(f"{nom}: {len(df)} lignes")
+    print(f"Durée : {datetime.now() - debut}")
@@ -2,7 +2,10 @@
 # -*- coding: utf-8 -*-
 
 import os
+import time
 import random
+import argparse
+import numpy as np
 import pandas as pd
 import psycopg2
 from faker import Faker
@@ -10,6 +13,10 @@ from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 from tqdm import tqdm
 
+import chargement_bulk
+import generateur_vectorise
+import sortie_streaming
+
 # Configuration de Faker pour générer des données en français
 fake = Faker(['fr_FR'])
 Faker.seed(42)  # Pour la reproductibilité
@@ -213,106 +220,33 @@ def generer_dim_medicament(nb_medicaments):
     return pd.DataFrame(medicament_data)
 
 # Générateurs de données pour les faits
+def _rng():
+    """Générateur NumPy tiré de l'état de ``random`` : la graine (``--seed``) fixe aussi les faits."""
+    return np.random.default_rng(random.getrandbits(64))
+
 def generer_fact_consultation(df_temps, df_patient, df_medecin, df_etablissement, df_diagnostic, nb_consultations):
-    """Génère les données pour la table de faits consultation."""
-    consultation_data = []
-    
-    temps_ids = df_temps['temps_id'].tolist()
-    patient_ids = df_patient['patient_id'].tolist()
-    medecin_ids = df_medecin['medecin_id'].tolist()
-    etablissement_ids = df_etablissement['etablissement_id'].tolist()
-    diagnostic_ids = df_diagnostic['diagnostic_id'].tolist()
-    
-    for i in range(1, nb_consultations + 1):
-        temps_id = random.choice(temps_ids)
-        patient_id = random.choice(patient_ids)
-        medecin_id = random.choice(medecin_ids)
-        etablissement_id = random.choice(etablissement_ids)
-        diagnostic_id = random.choice(diagnostic_ids) if random.random() > 0.1 else None  # 10% sans diagnostic
-        
-        consultation_data.append({
-            'consultation_id': i,
-            'temps_id': temps_id,
-            'patient_id': patient_id,
-            'medecin_id': medecin_id,
-            'etablissement_id': etablissement_id,
-            'diagnostic_id': diagnostic_id,
-            'duree_minutes': random.randint(10, 120),
-            'cout': round(random.uniform(25, 200), 2),
-            'urgence': random.random() < 0.2,  # 20% des consultations sont urgentes
-            'satisfaction_patient': random.randint(1, 5)
-        })
-    
-    return pd.DataFrame(consultation_data)
+    """Génère les données pour la table de faits consultation (tirages vectorisés de generateur_vectorise)."""
+    dimensions = {'dim_temps': df_temps, 'dim_patient': df_patient, 'dim_medecin': df_medecin,
+                  'dim_etablissement': df_etablissement, 'dim_diagnostic': df_diagnostic}
+    return generateur_vectorise.generer_fact_consultation(_rng(), dimensions, nb_consultations)
+
+def construire_index(df, cle, attribut):
+    """Tableau NumPy où ``index[id] = attribut`` : remplace une recherche par une indexation directe."""
+    ids = df[cle].to_numpy()
+    index = np.zeros(ids.max() + 1, dtype=df[attribut].dtype)
+    index[ids] = df[attribut].to_numpy()
+    return index
 
 def generer_fact_traitement(df_temps, df_patient, df_medecin, df_medicament, df_diagnostic, nb_traitements):
-    """Génère les données pour la table de faits traitement."""
-    traitement_data = []
-    
-    temps_ids = df_temps['temps_id'].tolist()
-    patient_ids = df_patient['patient_id'].tolist()
-    medecin_ids = df_medecin['medecin_id'].tolist()
-    medicament_ids = df_medicament['medicament_id'].tolist()
-    diagnostic_ids = df_diagnostic['diagnostic_id'].tolist()
-    
-    for i in range(1, nb_traitements + 1):
-        temps_id = random.choice(temps_ids)
-        patient_id = random.choice(patient_ids)
-        medecin_id = random.choice(medecin_ids)
-        medicament_id = random.choice(medicament_ids)
-        diagnostic_id = random.choice(diagnostic_ids) if random.random() > 0.1 else None  # 10% sans diagnostic
-        
-        duree_jours = random.randint(1, 90)  # Entre 1 jour et 3 mois
-        prix_medicament = df_medicament.loc[df_medicament['medicament_id'] == medicament_id, 'prix'].values[0]
-        cout_total = round(prix_medicament * duree_jours * random.uniform(0.8, 1.2), 2)  # Variation du coût
-        
-        traitement_data.append({
-            'traitement_id': i,
-            'temps_id': temps_id,
-            'patient_id': patient_id,
-            'medecin_id': medecin_id,
-            'medicament_id': medicament_id,
-            'diagnostic_id': diagnostic_id,
-            'duree_jours': duree_jours,
-            'cout_total': cout_total,
-            'efficacite': random.randint(1, 5),
-            'effets_secondaires': random.random() < 0.3  # 30% ont des effets secondaires
-        })
-    
-    return pd.DataFrame(traitement_data)
+    """Génère les données pour la table de faits traitement (tirages vectorisés de generateur_vectorise)."""
+    dimensions = {'dim_temps': df_temps, 'dim_patient': df_patient, 'dim_medecin': df_medecin,
+                  'dim_medicament': df_medicament, 'dim_diagnostic': df_diagnostic}
+    return generateur_vectorise.generer_fact_traitement(_rng(), dimensions, nb_traitements)
 
 def generer_fact_analyse(df_temps, df_patient, df_etablissement, nb_analyses):
-    """Génère les données pour la table de faits analyse."""
-    analyse_data = []
-    
-    temps_ids = df_temps['temps_id'].tolist()
-    patient_ids = df_patient['patient_id'].tolist()
-    etablissement_ids = df_etablissement['etablissement_id'].tolist()
-    
-    types_analyse = [
-        'Analyse sanguine', 'Radiographie', 'Scanner', 'IRM', 'Échographie',
-        'Électrocardiogramme', 'Test d\'effort', 'Endoscopie', 'Biopsie',
-        'Test allergologique', 'Analyse d\'urine', 'Spirométrie'
-    ]
-    
-    for i in range(1, nb_analyses + 1):
-        temps_id = random.choice(temps_ids)
-        patient_id = random.choice(patient_ids)
-        etablissement_id = random.choice(etablissement_ids)
-        type_analyse = random.choice(types_analyse)
-        
-        analyse_data.append({
-            'analyse_id': i,
-            'temps_id': temps_id,
-            'patient_id': patient_id,
-            'etablissement_id': etablissement_id,
-            'type_analyse': type_analyse,
-            'resultat_anormal': random.random() < 0.25,  # 25% de résultats anormaux
-            'cout': round(random.uniform(20, 1000), 2),
-            'delai_resultat_heures': random.randint(1, 168)  # Entre 1 heure et 1 semaine
-        })
-    
-    return pd.DataFrame(analyse_data)
+    """Génère les données pour la table de faits analyse (tirages vectorisés de generateur_vectorise)."""
+    dimensions = {'dim_temps': df_temps, 'dim_patient': df_patient, 'dim_etablissement': df_etablissement}
+    return generateur_vectorise.generer_fact_analyse(_rng(), dimensions, nb_analyses)
 
 def generer_fact_occupation_etablissement(df_temps, df_etablissement, nb_occupations):
     """Génère les données pour la table de faits occupation d'établissement."""
@@ -321,14 +255,12 @@ def generer_fact_occupation_etablissement(df_temps, df_etablissement, nb_occupat
     temps_ids = df_temps['temps_id'].tolist()
     etablissement_ids = df_etablissement['etablissement_id'].tolist()
     
-    # Créer un dictionnaire pour suivre les occupations par établissement
-    etablissement_capacites = {}
-    for _, row in df_etablissement.iterrows():
-        etablissement_capacites[row['etablissement_id']] = row['capacite_lits']
+    # Index id -> capacité pour suivre les occupations par établissement
+    etablissement_capacites = construire_index(df_etablissement, 'etablissement_id', 'capacite_lits')
     
     # Pour chaque établissement, générer des données d'occupation pour différentes dates
     for etablissement_id in etablissement_ids:
-        capacite = etablissement_capacites[etablissement_id]
+        capacite = int(etablissement_capacites[etablissement_id])
         
         # Sélectionner des dates aléatoires
         selected_temps_ids = random.sample(temps_ids, min(nb_occupations, len(temps_ids)))
@@ -373,73 +305,113 @@ def inserer_donnees(conn, df, table_name):
     conn.commit()
     return True
 
-# Fonction principale
-def main():
-    # Paramètres de génération
-    date_debut = datetime(2020, 1, 1)
-    date_fin = datetime(2023, 12, 31)
-    nb_patients = 1000
-    nb_medecins = 100
-    nb_etablissements = 50
-    nb_diagnostics = 200
-    nb_medicaments = 150
-    nb_consultations = 5000
-    nb_traitements = 3000
-    nb_analyses = 4000
-    nb_occupations_par_etablissement = 100
-    
-    print("Génération des données de santé...")
-    
+def parse_arguments():
+    """Paramètres de génération (les valeurs par défaut reproduisent le jeu historique)."""
+    parser = argparse.ArgumentParser(description="Générateur de données de santé")
+    parser.add_argument('--moteur', choices=['classique', 'vectorise'], default=os.environ.get('GENERATEUR_MOTEUR', 'classique'),
+                        help="'vectorise' génère des colonnes entières avec NumPy (tests de charge)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--date-debut', type=lambda d: datetime.strptime(d, '%Y-%m-%d'), default=datetime(2020, 1, 1))
+    parser.add_argument('--date-fin', type=lambda d: datetime.strptime(d, '%Y-%m-%d'), default=datetime(2023, 12, 31))
+    parser.add_argument('--nb-patients', type=int, default=1000)
+    parser.add_argument('--nb-medecins', type=int, default=100)
+    parser.add_argument('--nb-etablissements', type=int, default=50)
+    parser.add_argument('--nb-diagnostics', type=int, default=200)
+    parser.add_argument('--nb-medicaments', type=int, default=150)
+    parser.add_argument('--nb-consultations', type=int, default=5000)
+    parser.add_argument('--nb-traitements', type=int, default=3000)
+    parser.add_argument('--nb-analyses', type=int, default=4000)
+    parser.add_argument('--nb-occupations-par-etablissement', type=int, default=100)
+    parser.add_argument('--chargement', choices=['bulk', 'ligne'], default='bulk',
+                        help="'bulk' : COPY (repli execute_values) et tables en parallèle ; 'ligne' : INSERT ligne par ligne")
+    parser.add_argument('--methode-bulk', choices=['copy', 'execute_values'], default='copy')
+    parser.add_argument('--paralleles', type=int, default=4, help="tables chargées simultanément en mode bulk")
+    parser.add_argument('--differer-index', action='store_true',
+                        help="supprimer index secondaires et clés étrangères pendant le chargement, puis les recréer")
+    parser.add_argument('--streaming', metavar='DESTINATION',
+                        help="répertoire local ou s3://bucket/prefixe : faits générés par lots et écrits partitionnés par date")
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='parquet', help="format du mode streaming")
+    parser.add_argument('--partition', choices=['jour', 'mois'], default='mois', help="granularité des partitions de date")
+    parser.add_argument('--taille-lot', type=int, default=1_000_000, help="lignes de faits par lot en mode streaming")
+    return parser.parse_args()
+
+def generer_classique(args):
+    """Génération ligne par ligne historique (random + Faker)."""
+    Faker.seed(args.seed)
+    random.seed(args.seed)
+
     # Générer les dimensions
     print("Génération des dimensions...")
-    df_temps = generer_dim_temps(date_debut, date_fin)
-    df_patient = generer_dim_patient(nb_patients)
-    df_medecin = generer_dim_medecin(nb_medecins)
-    df_etablissement = generer_dim_etablissement(nb_etablissements)
-    df_diagnostic = generer_dim_diagnostic(nb_diagnostics)
-    df_medicament = generer_dim_medicament(nb_medicaments)
+    df_temps = generer_dim_temps(args.date_debut, args.date_fin)
+    df_patient = generer_dim_patient(args.nb_patients)
+    df_medecin = generer_dim_medecin(args.nb_medecins)
+    df_etablissement = generer_dim_etablissement(args.nb_etablissements)
+    df_diagnostic = generer_dim_diagnostic(args.nb_diagnostics)
+    df_medicament = generer_dim_medicament(args.nb_medicaments)
     
     # Générer les faits
     print("Génération des faits...")
-    df_consultation = generer_fact_consultation(df_temps, df_patient, df_medecin, df_etablissement, df_diagnostic, nb_consultations)
-    df_traitement = generer_fact_traitement(df_temps, df_patient, df_medecin, df_medicament, df_diagnostic, nb_traitements)
-    df_analyse = generer_fact_analyse(df_temps, df_patient, df_etablissement, nb_analyses)
-    df_occupation = generer_fact_occupation_etablissement(df_temps, df_etablissement, nb_occupations_par_etablissement)
+    df_consultation = generer_fact_consultation(df_temps, df_patient, df_medecin, df_etablissement, df_diagnostic, args.nb_consultations)
+    df_traitement = generer_fact_traitement(df_temps, df_patient, df_medecin, df_medicament, df_diagnostic, args.nb_traitements)
+    df_analyse = generer_fact_analyse(df_temps, df_patient, df_etablissement, args.nb_analyses)
+    df_occupation = generer_fact_occupation_etablissement(df_temps, df_etablissement, args.nb_occupations_par_etablissement)
+
+    return {
+        'dim_temps': df_temps,
+        'dim_patient': df_patient,
+        'dim_medecin': df_medecin,
+        'dim_etablissement': df_etablissement,
+        'dim_diagnostic': df_diagnostic,
+        'dim_medicament': df_medicament,
+        'fact_consultation': df_consultation,
+        'fact_traitement': df_traitement,
+        'fact_analyse': df_analyse,
+        'fact_occupation_etablissement': df_occupation
+    }
+
+# Fonction principale
+def main():
+    args = parse_arguments()
+    
+    if args.streaming:
+        # Mémoire constante : dimensions + un lot de faits à la fois (moteur vectorisé)
+        sortie_streaming.generer_en_streaming(args)
+        return
+    
+    print(f"Génération des données de santé (moteur {args.moteur})...")
+    debut = time.perf_counter()
+    if args.moteur == 'vectorise':
+        tables = generateur_vectorise.generer_tout(
+            args.seed, args.date_debut, args.date_fin, args.nb_patients, args.nb_medecins,
+            args.nb_etablissements, args.nb_diagnostics, args.nb_medicaments, args.nb_consultations,
+            args.nb_traitements, args.nb_analyses, args.nb_occupations_par_etablissement)
+    else:
+        tables = generer_classique(args)
+    print(f"Génération terminée en {time.perf_counter() - debut:.1f}s "
+          f"({sum(len(df) for df in tables.values())} lignes)")
     
     # Connexion à la base de données
     conn = get_db_connection()
+    if conn is not None and args.chargement == 'bulk':
+        conn.close()
+        print("Chargement en masse des données dans la base de données...")
+        chargement_bulk.charger_tables(get_db_connection, tables, methode=args.methode_bulk,
+                                       paralleles=args.paralleles, differer_index=args.differer_index)
+        return
     if conn is None:
         print("Impossible de se connecter à la base de données. Sauvegarde des données en CSV.")
         # Sauvegarder en CSV si pas de connexion à la base de données
-        df_temps.to_csv('dim_temps.csv', index=False)
-        df_patient.to_csv('dim_patient.csv', index=False)
-        df_medecin.to_csv('dim_medecin.csv', index=False)
-        df_etablissement.to_csv('dim_etablissement.csv', index=False)
-        df_diagnostic.to_csv('dim_diagnostic.csv', index=False)
-        df_medicament.to_csv('dim_medicament.csv', index=False)
-        df_consultation.to_csv('fact_consultation.csv', index=False)
-        df_traitement.to_csv('fact_traitement.csv', index=False)
-        df_analyse.to_csv('fact_analyse.csv', index=False)
-        df_occupation.to_csv('fact_occupation_etablissement.csv', index=False)
+        for table_name, df in tables.items():
+            df.to_csv(f'{table_name}.csv', index=False)
         print("Données sauvegardées en CSV.")
         return
     
     # Insérer les données dans la base de données
     print("Insertion des données dans la base de données...")
     try:
-        # Insérer les dimensions d'abord (pour respecter les contraintes de clé étrangère)
-        inserer_donnees(conn, df_temps, 'dim_temps')
-        inserer_donnees(conn, df_patient, 'dim_patient')
-        inserer_donnees(conn, df_medecin, 'dim_medecin')
-        inserer_donnees(conn, df_etablissement, 'dim_etablissement')
-        inserer_donnees(conn, df_diagnostic, 'dim_diagnostic')
-        inserer_donnees(conn, df_medicament, 'dim_medicament')
-        
-        # Puis insérer les faits
-        inserer_donnees(conn, df_consultation, 'fact_consultation')
-        inserer_donnees(conn, df_traitement, 'fact_traitement')
-        inserer_donnees(conn, df_analyse, 'fact_analyse')
-        inserer_donnees(conn, df_occupation, 'fact_occupation_etablissement')
+        # Les dimensions sont insérées d'abord (pour respecter les contraintes de clé étrangère), puis les faits
+        for table_name, df in tables.items():
+            inserer_donnees(conn, df, table_name)
         
         print("Insertion des données terminée avec succès.")
     except Exception as e:
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Mode streaming : les faits sont générés par lots et écrits au fil de l'eau.
+
+Chaque lot est découpé par date (via ``temps_id`` -> ``dim_temps.date``) et
+écrit en Parquet ou CSV compressé sous une arborescence partitionnée :
+
+    fact_consultation/annee=2023/mois=06/jour=01/part-00003.parquet
+
+La destination est un répertoire local ou un bucket MinIO/S3 (``s3://bucket/prefixe``).
+Seuls les dimensions et le lot courant sont en mémoire, quel que soit le volume total.
+"""
+
+import io
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+import generateur_vectorise
+
+FORMATS = {'parquet': '.parquet', 'csv': '.csv.gz'}
+
+
+class DestinationLocale:
+    def __init__(self, racine):
+        self.racine = Path(racine)
+
+    def ecrire(self, cle, donnees):
+        chemin = self.racine / cle
+        chemin.parent.mkdir(parents=True, exist_ok=True)
+        chemin.write_bytes(donnees)
+
+    def __str__(self):
+        return str(self.racine)
+
+
+class DestinationMinio:
+    def __init__(self, url):
+        from minio import Minio
+
+        bucket, _, prefixe = url[len('s3://'):].partition('/')
+        self.bucket = bucket
+        self.prefixe = prefixe.strip('/')
+        self.client = Minio(
+            os.environ.get('MINIO_ENDPOINT', 'minio:9000'),
+            access_key=os.environ.get('MINIO_ACCESS_KEY', 'minioadmin'),
+            secret_key=os.environ.get('MINIO_SECRET_KEY', 'minioadmin'),
+            secure=os.environ.get('MINIO_SECURE', 'false').lower() == 'true'
+        )
+        if not self.client.bucket_exists(self.bucket):
+            self.client.make_bucket(self.bucket)
+
+    def ecrire(self, cle, donnees):
+        nom = f"{self.prefixe}/{cle}" if self.prefixe else cle
+        self.client.put_object(self.bucket, nom, io.BytesIO(donnees), len(donnees),
+                               content_type='application/octet-stream')
+
+    def __str__(self):
+        return f"s3://{self.bucket}/{self.prefixe}"
+
+
+def ouvrir_destination(cible):
+    return DestinationMinio(cible) if cible.startswith('s3://') else DestinationLocale(cible)
+
+
+def serialiser(df, format_sortie):
+    tampon = io.BytesIO()
+    if format_sortie == 'parquet':
+        df.to_parquet(tampon, index=False)
+    else:
+        df.to_csv(tampon, index=False, compression='gzip')
+    return tampon.getvalue()
+
+
+def chemin_partition(date, granularite):
+    chemin = f"annee={date.year}/mois={date.month:02d}"
+    if granularite == 'jour':
+        chemin += f"/jour={date.day:02d}"
+    return chemin
+
+
+def ecrire_lot_partitionne(destination, table_name, lot, numero, dates_par_temps_id, format_sortie, granularite):
+    """Écrit un lot de faits, un fichier par partition de date présente dans le lot."""
+    dates = dates_par_temps_id[lot['temps_id'].to_numpy()]
+    if granularite == 'jour':
+        cles = dates.astype('datetime64[D]')
+    else:
+        cles = dates.astype('datetime64[M]')
+    # Tri par partition puis découpage en tranches contiguës (un seul passage sur le lot)
+    ordre = np.argsort(cles, kind='stable')
+    uniques, debuts = np.unique(cles[ordre], return_index=True)
+    fins = np.append(debuts[1:], len(ordre))
+    for cle, debut, fin in zip(uniques, debuts, fins):
+        partition = lot.iloc[ordre[debut:fin]]
+        date = cle.astype('datetime64[D]').item()
+        nom = f"{table_name}/{chemin_partition(date, granularite)}/part-{numero:05d}{FORMATS[format_sortie]}"
+        destination.ecrire(nom, serialiser(partition, format_sortie))
+    return len(uniques)
+
+
+def iterer_lots(generateur, rng, dimensions, total, taille_lot):
+    """Produit ``total`` lignes de faits en lots de ``taille_lot`` avec des ids continus."""
+    for id_debut in range(1, total + 1, taille_lot):
+        yield generateur(rng, dimensions, min(taille_lot, total - id_debut + 1), id_debut=id_debut)
+
+
+def generer_en_streaming(args):
+    """Génère toutes les tables vers ``args.streaming`` sans conserver les faits en mémoire."""
+    destination = ouvrir_destination(args.streaming)
+    rng = np.random.default_rng(args.seed)
+    reservoirs = generateur_vectorise.ReservoirsFaker(args.seed)
+    dimensions = generateur_vectorise.generer_dimensions(
+        rng, reservoirs, args.date_debut, args.date_fin, args.nb_patients, args.nb_medecins,
+        args.nb_etablissements, args.nb_diagnostics, args.nb_medicaments)
+
+    for table_name, df in dimensions.items():
+        destination.ecrire(f"{table_name}/{table_name}{FORMATS[args.format]}", serialiser(df, args.format))
+
+    # Index temps_id -> date pour partitionner les faits par gather
+    temps = dimensions['dim_temps']
+    dates_par_temps_id = np.zeros(temps['temps_id'].max() + 1, dtype='datetime64[D]')
+    dates_par_temps_id[temps['temps_id'].to_numpy()] = temps['date'].to_numpy().astype('datetime64[D]')
+
+    faits = {
+        'fact_consultation': iterer_lots(generateur_vectorise.generer_fact_consultation, rng, dimensions,
+                                         args.nb_consultations, args.taille_lot),
+        'fact_traitement': iterer_lots(generateur_vectorise.generer_fact_traitement, rng, dimensions,
+                                       args.nb_traitements, args.taille_lot),
+        'fact_analyse': iterer_lots(generateur_vectorise.generer_fact_analyse, rng, dimensions,
+                                    args.nb_analyses, args.taille_lot),
+        # Volume borné par nb_etablissements x nb_occupations : un seul lot
+        'fact_occupation_etablissement': (generateur_vectorise.generer_fact_occupation_etablissement(
+            rng, dimensions, args.nb_occupations_par_etablissement) for _ in range(1)),
+    }
+    for table_name, lots in faits.items():
+        debut = time.perf_counter()
+        nb_lignes, nb_fichiers = 0, 0
+        for numero, lot in enumerate(lots):
+            nb_fichiers += ecrire_lot_partitionne(destination, table_name, lot, numero, dates_par_temps_id,
+                                                  args.format, args.partition)
+            nb_lignes += len(lot)
+        duree = time.perf_counter() - debut
+        print(f"{table_name}: {nb_lignes} lignes, {nb_fichiers} fichiers en {duree:.1f}s "
+              f"({nb_lignes / max(duree, 1e-9):.0f} lignes/s)")
+    print(f"Données écrites dans {destination}")
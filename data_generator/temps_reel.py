@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Générateur d'événements en continu pour les tests de débit.
+
+Insère en boucle des consultations, traitements, analyses et occupations
+dans la base de production à un débit cible, modulé par un profil journalier
+et des rafales aléatoires. Les ids de dimensions existants sont réutilisés ;
+chaque établissement reçoit au plus une occupation par jour.
+Le débit réellement atteint et le retard sur la cible sont affichés
+régulièrement.
+
+    python temps_reel.py --debit 200 --duree 3600
+"""
+
+import argparse
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+import chargement_bulk
+import generateur_vectorise
+from generator import get_db_connection
+
+# Multiplicateur du débit cible par heure de la journée (pic le matin et l'après-midi)
+PROFIL_JOURNALIER = np.array([
+    0.2, 0.15, 0.1, 0.1, 0.1, 0.2, 0.4, 0.8, 1.4, 1.8, 1.9, 1.7,
+    1.2, 1.3, 1.7, 1.8, 1.6, 1.3, 1.0, 0.8, 0.6, 0.5, 0.4, 0.3
+])
+
+# Répartition des événements entre tables de faits
+REPARTITION = {
+    'fact_consultation': 0.40,
+    'fact_traitement': 0.25,
+    'fact_analyse': 0.30,
+    'fact_occupation_etablissement': 0.05,
+}
+
+CLES_PRIMAIRES = {
+    'fact_consultation': 'consultation_id',
+    'fact_traitement': 'traitement_id',
+    'fact_analyse': 'analyse_id',
+    'fact_occupation_etablissement': 'occupation_id',
+}
+
+
+def charger_dimensions(conn):
+    """Lit les ids (et attributs utiles aux faits) des dimensions déjà présentes en base."""
+    requetes = {
+        'dim_temps': "SELECT temps_id, date FROM dim_temps",
+        'dim_patient': "SELECT patient_id FROM dim_patient",
+        'dim_medecin': "SELECT medecin_id FROM dim_medecin",
+        'dim_etablissement': "SELECT etablissement_id, capacite_lits FROM dim_etablissement",
+        'dim_diagnostic': "SELECT diagnostic_id FROM dim_diagnostic",
+        'dim_medicament': "SELECT medicament_id, prix FROM dim_medicament",
+    }
+    dimensions = {}
+    with conn.cursor() as cursor:
+        for table_name, requete in requetes.items():
+            cursor.execute(requete)
+            colonnes = [colonne.name for colonne in cursor.description]
+            dimensions[table_name] = pd.DataFrame(cursor.fetchall(), columns=colonnes)
+            if dimensions[table_name].empty:
+                raise RuntimeError(f"{table_name} est vide : lancer d'abord generator.py")
+    dimensions['dim_medicament']['prix'] = dimensions['dim_medicament']['prix'].astype(float)
+    return dimensions
+
+
+def temps_du_jour(dimensions):
+    """Restreint dim_temps à aujourd'hui (ou à la dernière date connue) : les événements sont datés du jour."""
+    temps = dimensions['dim_temps']
+    dates = pd.to_datetime(temps['date']).dt.date
+    aujourd_hui = temps[dates == date.today()]
+    return aujourd_hui if not aujourd_hui.empty else temps[dates == dates.max()]
+
+
+def occupations_existantes(conn, dimensions):
+    """Établissements ayant déjà une occupation à la date des événements (lancements précédents compris)."""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT DISTINCT etablissement_id FROM fact_occupation_etablissement WHERE temps_id = ANY(%s)",
+                       (dimensions['dim_temps']['temps_id'].tolist(),))
+        return {row[0] for row in cursor.fetchall()}
+
+
+def prochains_ids(conn):
+    with conn.cursor() as cursor:
+        ids = {}
+        for table_name, cle in CLES_PRIMAIRES.items():
+            cursor.execute(f"SELECT COALESCE(MAX({cle}), 0) + 1 FROM {table_name}")
+            ids[table_name] = cursor.fetchone()[0]
+    return ids
+
+
+def debit_cible(debit_base, instant, rafale):
+    heure = time.localtime(instant).tm_hour
+    return debit_base * PROFIL_JOURNALIER[heure] * rafale
+
+
+def generer_evenements(rng, dimensions, table_name, n, id_debut, occupes):
+    if table_name == 'fact_consultation':
+        return generateur_vectorise.generer_fact_consultation(rng, dimensions, n, id_debut)
+    if table_name == 'fact_traitement':
+        return generateur_vectorise.generer_fact_traitement(rng, dimensions, n, id_debut)
+    if table_name == 'fact_analyse':
+        return generateur_vectorise.generer_fact_analyse(rng, dimensions, n, id_debut)
+    # Une occupation par jour et par établissement : tirés parmi ceux qui n'en ont pas encore (``occupes``)
+    etablissements = dimensions['dim_etablissement']
+    libres = etablissements[~etablissements['etablissement_id'].isin(occupes)]
+    choisis = libres.iloc[rng.choice(len(libres), min(n, len(libres)), replace=False)]
+    occupes.update(choisis['etablissement_id'].tolist())
+    return generateur_vectorise.generer_fact_occupation_etablissement(
+        rng, {**dimensions, 'dim_etablissement': choisis}, 1, id_debut)
+
+
+def boucle(conn, dimensions, args):
+    rng = np.random.default_rng(args.seed)
+    ids = prochains_ids(conn)
+    occupes = occupations_existantes(conn, dimensions)
+    tables = list(REPARTITION)
+    poids = np.array([REPARTITION[table_name] for table_name in tables])
+
+    debut = time.time()
+    dernier_tick = debut
+    dernier_rapport = debut
+    cible_cumulee = 0.0
+    produits = 0
+    rafale, fin_rafale = 1.0, debut
+    par_table = dict.fromkeys(tables, 0)
+
+    while args.duree is None or time.time() - debut < args.duree:
+        maintenant = time.time()
+        # Rafales : avec une probabilité donnée, le débit est multiplié pendant quelques secondes
+        if maintenant >= fin_rafale:
+            rafale = args.facteur_rafale if rng.random() < args.probabilite_rafale else 1.0
+            fin_rafale = maintenant + rng.uniform(2, 10)
+        cible_cumulee += debit_cible(args.debit, maintenant, rafale) * (maintenant - dernier_tick)
+        dernier_tick = maintenant
+
+        if len(occupes) >= len(dimensions['dim_etablissement']) and poids[tables.index('fact_occupation_etablissement')]:
+            # Tous les établissements ont leur occupation du jour : les événements vont aux autres faits
+            poids[tables.index('fact_occupation_etablissement')] = 0
+            poids = poids / poids.sum()
+
+        a_produire = int(cible_cumulee) - produits
+        if a_produire > 0:
+            repartition = rng.multinomial(a_produire, poids)
+            for table_name, n in zip(tables, repartition):
+                if n == 0:
+                    continue
+                lot = generer_evenements(rng, dimensions, table_name, int(n), ids[table_name], occupes)
+                chargement_bulk.copier_dataframe(conn, lot, table_name)
+                ids[table_name] += len(lot)
+                par_table[table_name] += len(lot)
+                produits += len(lot)
+            conn.commit()
+
+        if maintenant - dernier_rapport >= args.rapport:
+            ecoule = maintenant - debut
+            retard = cible_cumulee - produits
+            debit_courant = debit_cible(args.debit, maintenant, rafale)
+            print(f"[{ecoule:8.0f}s] cible {cible_cumulee:10.0f} | produits {produits:10d} | "
+                  f"débit atteint {produits / ecoule:8.1f}/s (cible instantanée {debit_courant:7.1f}/s) | "
+                  f"retard {retard:8.0f} événements ({retard / max(debit_courant, 1e-9):5.1f}s) | {par_table}")
+            dernier_rapport = maintenant
+
+        time.sleep(max(0.0, args.intervalle - (time.time() - maintenant)))
+
+    return produits, time.time() - debut
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Génération continue d'événements de santé")
+    parser.add_argument('--debit', type=float, default=50.0, help="événements par seconde au coefficient 1 du profil")
+    parser.add_argument('--duree', type=float, default=None, help="durée en secondes (infinie par défaut)")
+    parser.add_argument('--intervalle', type=float, default=0.5, help="période d'insertion en secondes")
+    parser.add_argument('--rapport', type=float, default=10.0, help="période d'affichage des statistiques")
+    parser.add_argument('--probabilite-rafale', type=float, default=0.05)
+    parser.add_argument('--facteur-rafale', type=float, default=4.0)
+    parser.add_argument('--seed', type=int, default=None)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    conn = get_db_connection()
+    if conn is None:
+        raise SystemExit("Impossible de se connecter à la base de données")
+    try:
+        dimensions = charger_dimensions(conn)
+        dimensions['dim_temps'] = temps_du_jour(dimensions)
+        print(f"Génération continue à {args.debit} événements/s (profil journalier, rafales x{args.facteur_rafale})")
+        produits, duree = boucle(conn, dimensions, args)
+    except KeyboardInterrupt:
+        print("Arrêt demandé")
+        return
+    finally:
+        conn.close()
+    print(f"{produits} événements en {duree:.0f}s, débit atteint {produits / max(duree, 1e-9):.1f}/s")
+
+
+if __name__ == "__main__":
+    main()